@@ -1,8 +1,20 @@
 """
 EEG Analytics Module
 Handles all complex analytics calculations for student attention tracking
+
+AnalyticsContext loads one student's recent eeg_data once (one connection, one query)
+as NumPy columns and computes every analytics output from it, memoizing the attention
+periods that the session stats and the recommendation are built on. The module-level
+functions are one-shot wrappers around a context for callers that need one output.
+
+A context can also be given the device's ingest-side AttentionTracker snapshot
+(DeviceStateStore.attention_periods); attention periods, session stats and the
+recommendation then come from it without touching eeg_data whenever the tracker has
+seen every reading of the window (see tracked_attention_periods).
 """
 import mysql.connector  # Only for error handling
+from bisect import bisect_left
+from collections import namedtuple
 from datetime import datetime, timedelta
 import logging
 import numpy as np
@@ -10,134 +22,275 @@ import numpy as np
 # Import centralized database connection
 from db import get_db_connection
 
+# Pre-aggregated 1-minute / 1-hour buckets of eeg_data
+from eeg_rollups import fetch_bucket_series, fetch_window_totals
+
+# Period rules shared with the incremental tracker run at ingest
+from attention_tracker import FOCUS_THRESHOLD, MAX_PERIOD_GAP, MIN_PERIOD_POINTS, quality_score
+
 logger = logging.getLogger(__name__)
 
+# Timeline resolution: per-reading rows up to this window, then 1-minute buckets up to
+# TIMELINE_MINUTE_MAX_MINUTES, then 1-hour buckets (keeps charts to a few thousand points)
+TIMELINE_RAW_MAX_MINUTES = 60
+TIMELINE_MINUTE_MAX_MINUTES = 48 * 60
 
-def calculate_attention_periods(mac_address, time_window_minutes=60):
+# Points per timeline series unless the caller asks for another budget; longer series are
+# reduced to each bucket's min and max (see minmax_downsample)
+TIMELINE_MAX_POINTS = 1000
+# Smallest budget a caller may ask for: one bucket's min and max point
+TIMELINE_MIN_POINTS = 2
+TIMELINE_SERIES = ("alpha", "beta", "theta", "delta", "gamma", "focus")
+TIME_FORMATS = {"raw": "%H:%M:%S", "1m": "%H:%M", "1h": "%m-%d %H:%M"}
+
+# A chart-ready timeline before formatting: timestamps (datetimes), values
+# (len(timestamps), len(TIMELINE_SERIES)) with focus as a percentage, and how many
+# readings / buckets it was downsampled from (equal to len(timestamps) if it wasn't)
+Timeline = namedtuple("Timeline", ["resolution", "timestamps", "values", "source_points"])
+
+# The recommendation always looks at the last hour
+RECOMMENDATION_WINDOW_MINUTES = 60
+
+# "seconds" is TO_SECONDS(timestamp): numeric time for gap arithmetic without converting datetimes
+COLUMNS = ("seconds", "focus", "delta", "theta", "alpha", "beta", "gamma")
+EMPTY_METRICS = {'focus_level': 0, 'engagement': 0, 'quality_score': 0}
+
+
+def find_focus_runs(seconds, focus):
     """
-    Calculate continuous focus periods for a student
-    Returns list of focus periods with quality scores
+    Run-length encode the focused readings: (first, last) index arrays of every run of
+    focus >= FOCUS_THRESHOLD with no gap over MAX_PERIOD_GAP seconds between consecutive
+    readings and at least MIN_PERIOD_POINTS readings
     """
-    try:
-        db = get_db_connection()
-        if not db:
-            return []
-        
-        cursor = db.cursor(dictionary=True)
-        
-        # Get student ID
-        cursor.execute("SELECT id FROM students WHERE device_mac = %s", (mac_address,))
-        student = cursor.fetchone()
-        if not student:
-            return []
-        
-        student_id = student['id']
-        
-        # Get EEG data from last time_window_minutes
-        start_time = datetime.now() - timedelta(minutes=time_window_minutes)
-        
-        cursor.execute("""
-            SELECT timestamp, focus, beta, gamma, theta, delta, alpha
-            FROM eeg_data 
-            WHERE student_id = %s AND timestamp >= %s
-            ORDER BY timestamp ASC
-        """, (student_id, start_time))
-        
-        data_points = cursor.fetchall()
-        cursor.close()
-        db.close()
-        
-        if not data_points:
-            return []
-        
-        # Analyze focus periods
-        periods = []
-        current_period = None
-        focus_threshold = 0.6  # Minimum focus level to count as "focused"
-        
-        for point in data_points:
-            is_focused = point['focus'] >= focus_threshold
-            
-            if is_focused:
-                if current_period is None:
-                    # Start new focus period
-                    current_period = {
-                        'start_time': point['timestamp'],
-                        'end_time': point['timestamp'],
-                        'focus_values': [point['focus']],
-                        'beta_values': [point['beta']],
-                        'gamma_values': [point['gamma']]
-                    }
-                else:
-                    # Continue current period
-                    time_gap = (point['timestamp'] - current_period['end_time']).total_seconds()
-                    
-                    if time_gap <= 10:  # Allow 10 second gap
-                        current_period['end_time'] = point['timestamp']
-                        current_period['focus_values'].append(point['focus'])
-                        current_period['beta_values'].append(point['beta'])
-                        current_period['gamma_values'].append(point['gamma'])
-                    else:
-                        # Gap too large, save current period and start new one
-                        if len(current_period['focus_values']) >= 3:  # At least 3 data points
-                            periods.append(current_period)
-                        
-                        current_period = {
-                            'start_time': point['timestamp'],
-                            'end_time': point['timestamp'],
-                            'focus_values': [point['focus']],
-                            'beta_values': [point['beta']],
-                            'gamma_values': [point['gamma']]
-                        }
-            else:
-                # Not focused - save current period if exists
-                if current_period and len(current_period['focus_values']) >= 3:
-                    periods.append(current_period)
-                current_period = None
-        
-        # Don't forget the last period
-        if current_period and len(current_period['focus_values']) >= 3:
-            periods.append(current_period)
-        
-        # Calculate quality scores for each period
-        formatted_periods = []
-        for i, period in enumerate(periods):
-            duration_seconds = (period['end_time'] - period['start_time']).total_seconds()
-            duration_minutes = max(1, int(duration_seconds / 60))
-            
-            # Calculate quality score (0-100)
-            avg_focus = np.mean(period['focus_values'])
-            avg_beta = np.mean(period['beta_values'])
-            avg_gamma = np.mean(period['gamma_values'])
-            
-            # Quality = weighted average of focus (60%), beta (25%), gamma (15%)
-            quality_score = int((avg_focus * 60 + avg_beta * 25 + avg_gamma * 15))
-            
-            formatted_periods.append({
-                'period_number': i + 1,
-                'start_time': period['start_time'].strftime('%H:%M'),
-                'end_time': period['end_time'].strftime('%H:%M'),
-                'duration_minutes': duration_minutes,
-                'quality_score': quality_score,
-                'quality_level': 'high' if quality_score >= 75 else ('medium' if quality_score >= 50 else 'low'),
-                'is_active': i == len(periods) - 1  # Last period is current
-            })
-        
-        return formatted_periods
-        
-    except Exception as e:
-        logger.error(f"Attention periods calculation error: {e}")
+    focused = np.asarray(focus) >= FOCUS_THRESHOLD
+    n = focused.size
+    if n == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    # boundary[i]: a run can't continue from reading i - 1 to reading i (boundary[0] and
+    # boundary[n] are the edges of the window)
+    boundary = np.ones(n + 1, dtype=bool)
+    if n > 1:
+        gaps = np.diff(np.asarray(seconds, dtype=np.float64))
+        boundary[1:n] = (gaps > MAX_PERIOD_GAP) | ~focused[:-1] | ~focused[1:]
+    firsts = np.flatnonzero(focused & boundary[:n])
+    lasts = np.flatnonzero(focused & boundary[1:])
+
+    keep = lasts - firsts + 1 >= MIN_PERIOD_POINTS
+    return firsts[keep], lasts[keep]
+
+
+def compute_attention_periods(timestamps, seconds, focus, beta, gamma):
+    """
+    Attention periods (the dashboard's period dicts) from aligned columns of readings
+    in timestamp order; seconds is the timestamps as numbers (any epoch), and quality
+    is the mean focus / beta / gamma of each run
+    """
+    firsts, lasts = find_focus_runs(seconds, focus)
+    if firsts.size == 0:
         return []
 
+    # Sum each [first, last] run: reduceat over alternating run starts / run ends
+    bounds = np.column_stack([firsts, lasts + 1]).ravel()
+    counts = lasts - firsts + 1
 
-def calculate_session_stats(mac_address, time_window_minutes=60):
+    def run_means(values):
+        padded = np.append(np.asarray(values, dtype=np.float64), 0.0)  # lets bounds reach n
+        return np.add.reduceat(padded, bounds)[::2] / counts
+
+    # Quality = weighted average of focus (60%), beta (25%), gamma (15%)
+    quality_scores = (run_means(focus) * 60 + run_means(beta) * 25 + run_means(gamma) * 15).astype(int)
+
+    return format_periods(
+        (timestamps[a], timestamps[b], score)
+        for a, b, score in zip(firsts.tolist(), lasts.tolist(), quality_scores.tolist())
+    )
+
+
+def minmax_downsample(lows, highs, max_points):
     """
-    Calculate today's statistics for a student
-    Returns dict with avg attention span, longest span, total focus time
+    Shape-preserving downsampling of aligned series, all series at once
+    lows / highs: (n, k) arrays, one column per series (the same array for raw readings;
+    per-bucket minima and maxima for rollup rows). The n rows are split into
+    max_points // 2 equal buckets and every series keeps its lowest and highest value
+    in each bucket, in the order they occur, so peaks and dips survive.
+    Returns: (first row, last row) index arrays per bucket and the (2 * buckets, k) values
     """
-    try:
-        periods = calculate_attention_periods(mac_address, time_window_minutes)
-        
+    n, k = lows.shape
+    size = -(-n // max(1, max_points // 2))  # rows per bucket
+    buckets = -(-n // size)
+    pad = ((0, buckets * size - n), (0, 0))
+    lows = np.pad(np.asarray(lows, dtype=np.float64), pad, constant_values=np.nan).reshape(buckets, size, k)
+    highs = np.pad(np.asarray(highs, dtype=np.float64), pad, constant_values=np.nan).reshape(buckets, size, k)
+
+    low_at = np.nanargmin(lows, axis=1)
+    high_at = np.nanargmax(highs, axis=1)
+    low = np.take_along_axis(lows, low_at[:, None, :], axis=1)[:, 0, :]
+    high = np.take_along_axis(highs, high_at[:, None, :], axis=1)[:, 0, :]
+    low_first = low_at <= high_at
+
+    values = np.empty((buckets, 2, k))
+    values[:, 0] = np.where(low_first, low, high)
+    values[:, 1] = np.where(low_first, high, low)
+    firsts = np.arange(buckets) * size
+    return firsts, np.minimum(firsts + size, n) - 1, values.reshape(-1, k)
+
+
+def downsample_timeline(resolution, timestamps, values, lows, highs, max_points):
+    """
+    Timeline from (n, len(TIMELINE_SERIES)) arrays of values and their extremes
+    More than max_points rows are min / max downsampled; each bucket's pair of points is
+    stamped with its first and last row's time
+    """
+    source_points = len(timestamps)
+    if max_points and source_points > max_points:
+        firsts, lasts, values = minmax_downsample(lows, highs, max_points)
+        timestamps = [timestamps[i] for pair in zip(firsts.tolist(), lasts.tolist()) for i in pair]
+    values = values.copy()
+    values[:, TIMELINE_SERIES.index('focus')] *= 100  # focus as a percentage
+    return Timeline(resolution, timestamps, values, source_points)
+
+
+def format_timeline(timeline):
+    """The JSON chart payload: time labels and one list per series"""
+    time_format = TIME_FORMATS[timeline.resolution]
+    formatted = {
+        'resolution': timeline.resolution,
+        'timestamps': [t.strftime(time_format) for t in timeline.timestamps]
+    }
+    if timeline.source_points > len(timeline.timestamps):
+        formatted['downsampled_from'] = timeline.source_points
+    for i, series in enumerate(TIMELINE_SERIES):
+        formatted[series] = timeline.values[:, i].tolist()
+    return formatted
+
+
+def format_periods(spans):
+    """The dashboard's period dicts from (start datetime, end datetime, quality score) in time order"""
+    formatted_periods = []
+    for i, (start, end, score) in enumerate(spans):
+        duration_seconds = (end - start).total_seconds()
+        formatted_periods.append({
+            'period_number': i + 1,
+            'start_time': start.strftime('%H:%M'),
+            'end_time': end.strftime('%H:%M'),
+            'duration_minutes': max(1, int(duration_seconds / 60)),
+            'quality_score': int(score),
+            'quality_level': 'high' if score >= 75 else ('medium' if score >= 50 else 'low'),
+            'is_active': False
+        })
+    if formatted_periods:
+        formatted_periods[-1]['is_active'] = True  # Last period is current
+    return formatted_periods
+
+
+def tracked_attention_periods(tracked, window_minutes, now):
+    """
+    Attention periods for the last window_minutes from an AttentionTracker snapshot
+    Returns None when the tracker can't vouch for the whole window - it started after
+    the window did (server restart, device slot evicted) or has already dropped a
+    period that ended inside it - and eeg_data has to be read instead
+    """
+    if tracked is None:
+        return None
+    since, evicted_until, periods = tracked
+    window_start = now - timedelta(minutes=window_minutes)
+    if since > window_start or (evicted_until is not None and evicted_until >= window_start):
+        return None
+    # A period that began before the window is reported whole (eeg_data would clip it)
+    return format_periods(
+        (p['start'], p['end'], quality_score(p)) for p in periods if p['end'] >= window_start
+    )
+
+
+class AnalyticsContext:
+    """
+    One student's last `window_minutes` of readings, loaded on first use
+    tracked: optional AttentionTracker snapshot for the device, used for attention periods
+    """
+
+    def __init__(self, mac_address, window_minutes=60, tracked=None):
+        self.mac_address = mac_address
+        self.window_minutes = window_minutes
+        self.tracked = tracked
+        self.now = datetime.now()  # every output of one request ends at the same instant
+        self.timestamps = None     # list of datetimes, ascending
+        self.columns = None        # name -> float64 array, aligned with timestamps
+        self._periods = {}         # window -> formatted periods
+
+    @property
+    def loaded(self):
+        return self.timestamps is not None
+
+    def load(self):
+        """Fetch the window (student lookup + one eeg_data query); empty on any error"""
+        if self.loaded:
+            return self
+        self.timestamps, self.columns = [], {name: np.empty(0) for name in COLUMNS}
+        try:
+            db = get_db_connection()
+            if not db:
+                return self
+            cursor = db.cursor()
+            try:
+                cursor.execute("SELECT id FROM students WHERE device_mac = %s", (self.mac_address,))
+                student = cursor.fetchone()
+                if not student:
+                    return self
+                cursor.execute(f"""
+                    SELECT timestamp, TO_SECONDS(timestamp) AS seconds, {', '.join(COLUMNS[1:])}
+                    FROM eeg_data
+                    WHERE student_id = %s AND timestamp >= %s
+                    ORDER BY timestamp ASC
+                """, (student[0], self.now - timedelta(minutes=self.window_minutes)))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+                db.close()
+        except Exception as e:
+            logger.error(f"Analytics data load error for {self.mac_address}: {e}")
+            return self
+
+        if rows:
+            self.timestamps = [row[0] for row in rows]
+            values = np.array([row[1:] for row in rows], dtype=np.float64)
+            self.columns = {name: values[:, i] for i, name in enumerate(COLUMNS)}
+        return self
+
+    def _start_index(self, window_minutes):
+        """First loaded reading inside the last window_minutes"""
+        if window_minutes > self.window_minutes:
+            raise ValueError(f"{window_minutes} minute window outside the loaded {self.window_minutes} minutes")
+        return bisect_left(self.timestamps, self.now - timedelta(minutes=window_minutes))
+
+    def attention_periods(self, window_minutes=None):
+        """
+        Calculate continuous focus periods for a student
+        Returns list of focus periods with quality scores
+        """
+        window_minutes = self.window_minutes if window_minutes is None else window_minutes
+        if window_minutes not in self._periods:
+            self._periods[window_minutes] = self._find_periods(window_minutes)
+        return self._periods[window_minutes]
+
+    def _find_periods(self, window_minutes):
+        periods = tracked_attention_periods(self.tracked, window_minutes, self.now)
+        if periods is not None:
+            return periods
+        self.load()
+        lo = self._start_index(window_minutes)
+        return compute_attention_periods(
+            self.timestamps[lo:], *(self.columns[name][lo:] for name in ('seconds', 'focus', 'beta', 'gamma'))
+        )
+
+    def session_stats(self, window_minutes=None):
+        """
+        Calculate today's statistics for a student
+        Returns dict with avg attention span, longest span, total focus time
+        """
+        window_minutes = self.window_minutes if window_minutes is None else window_minutes
+        periods = self.attention_periods(window_minutes)
+
         if not periods:
             return {
                 'avg_attention_span': '0 minutes',
@@ -145,55 +298,42 @@ def calculate_session_stats(mac_address, time_window_minutes=60):
                 'total_focus_time': '0 minutes (0%)',
                 'total_periods': 0
             }
-        
+
         # Calculate statistics
         durations = [p['duration_minutes'] for p in periods]
         avg_duration = np.mean(durations)
         longest_duration = max(durations)
         total_focus_minutes = sum(durations)
-        
+
         # Calculate percentage (out of time window)
-        percentage = min(100, int((total_focus_minutes / time_window_minutes) * 100))
-        
+        percentage = min(100, int((total_focus_minutes / window_minutes) * 100))
+
         return {
             'avg_attention_span': f"{avg_duration:.1f} minutes",
             'longest_span': f"{longest_duration} minutes",
             'total_focus_time': f"{total_focus_minutes} minutes ({percentage}% of session)",
             'total_periods': len(periods)
         }
-        
-    except Exception as e:
-        logger.error(f"Session stats calculation error: {e}")
-        return {
-            'avg_attention_span': 'N/A',
-            'longest_span': 'N/A',
-            'total_focus_time': 'N/A',
-            'total_periods': 0
-        }
 
-
-def generate_recommendation(mac_address):
-    """
-    Generate personalized recommendation based on student's performance
-    """
-    try:
-        stats = calculate_session_stats(mac_address, time_window_minutes=60)
-        periods = calculate_attention_periods(mac_address, time_window_minutes=60)
-        
+    def recommendation(self):
+        """
+        Generate personalized recommendation based on student's performance
+        """
+        periods = self.attention_periods(RECOMMENDATION_WINDOW_MINUTES)
         if not periods:
             return "Start monitoring to receive personalized recommendations."
-        
+
         # Extract average duration
-        avg_span_str = stats['avg_attention_span']
+        avg_span_str = self.session_stats(RECOMMENDATION_WINDOW_MINUTES)['avg_attention_span']
         try:
             avg_minutes = float(avg_span_str.split()[0])
         except:
             avg_minutes = 0
-        
+
         # Get quality of recent periods
-        recent_quality = [p['quality_score'] for p in periods[-3:]] if len(periods) >= 3 else [p['quality_score'] for p in periods]
+        recent_quality = [p['quality_score'] for p in periods[-3:]]
         avg_quality = np.mean(recent_quality) if recent_quality else 0
-        
+
         # Generate recommendation based on performance
         if avg_minutes >= 20 and avg_quality >= 80:
             return "Excellent focus! You're maintaining great attention spans. Keep up the outstanding work!"
@@ -205,64 +345,160 @@ def generate_recommendation(mac_address):
             return "Take short breaks between focus sessions. Try the Pomodoro technique: 25 minutes focus, 5 minutes break."
         else:
             return "Practice mindful breathing before studying. Start with 5-minute focus goals and gradually increase."
-        
-    except Exception as e:
-        logger.error(f"Recommendation generation error: {e}")
-        return "Continue monitoring to receive personalized recommendations."
 
+    def performance_metrics(self, window_minutes=None):
+        """
+        Calculate performance metrics: focus level, engagement, quality score
+        From the loaded columns when the window is in memory, else from the rollup sums
+        """
+        window_minutes = self.window_minutes if window_minutes is None else window_minutes
+        if self.loaded:
+            lo = self._start_index(window_minutes)
+            count = len(self.timestamps) - lo
+            focus_sum, beta_sum, gamma_sum, theta_sum = (
+                float(np.sum(self.columns[metric][lo:])) for metric in ('focus', 'beta', 'gamma', 'theta')
+            )
+        else:
+            count, focus_sum, beta_sum, gamma_sum, theta_sum = self._window_totals(window_minutes)
+        if not count:
+            return dict(EMPTY_METRICS)
 
-def get_wave_timeline_data(mac_address, time_window_minutes=30):
-    """
-    Get timeline data for brain wave visualization
-    Returns arrays of timestamps and wave values for charting
-    """
-    try:
+        # Focus Level: average of recent focus values (0-100%)
+        focus_level = int(focus_sum / count * 100)
+
+        # Engagement: based on beta and gamma activity (0-100%)
+        # High beta + gamma = high engagement
+        engagement = int((beta_sum + gamma_sum) / 2 / count * 100)
+
+        # Quality Score: weighted combination (0-100)
+        # Focus 40%, Beta 30%, Gamma 20%, Low Theta 10%
+        quality_score = int((focus_sum * 0.4 + beta_sum * 0.3 + gamma_sum * 0.2 + (count - theta_sum) * 0.1) / count * 100)
+
+        return {
+            'focus_level': min(100, max(0, focus_level)),
+            'engagement': min(100, max(0, engagement)),
+            'quality_score': min(100, max(0, quality_score))
+        }
+
+    def _window_totals(self, window_minutes):
+        """(count, focus, beta, gamma, theta sums) over the window from the rollup tables"""
         db = get_db_connection()
         if not db:
-            return None
-        
+            return 0, 0.0, 0.0, 0.0, 0.0
         cursor = db.cursor(dictionary=True)
-        
-        # Get student ID
-        cursor.execute("SELECT id FROM students WHERE device_mac = %s", (mac_address,))
-        student = cursor.fetchone()
-        if not student:
+        try:
+            totals = fetch_window_totals(
+                cursor, self.mac_address, self.now - timedelta(minutes=window_minutes), self.now
+            )
+        finally:
             cursor.close()
             db.close()
+        if not totals:
+            return 0, 0.0, 0.0, 0.0, 0.0
+        return (int(totals['sample_count']),) + tuple(
+            float(totals[f'{metric}_sum']) for metric in ('focus', 'beta', 'gamma', 'theta')
+        )
+
+    def wave_timeline(self, window_minutes=30, max_points=TIMELINE_MAX_POINTS):
+        """
+        Get timeline data for brain wave visualization
+        Returns arrays of timestamps and wave values for charting, at most max_points
+        per series (None or 0: every point)
+        """
+        timeline = self.timeline_data(window_minutes, max_points)
+        return format_timeline(timeline) if timeline else None
+
+    def timeline_data(self, window_minutes=30, max_points=TIMELINE_MAX_POINTS):
+        """wave_timeline() as an unformatted Timeline (for the compact encodings), or None"""
+        if window_minutes > TIMELINE_RAW_MAX_MINUTES:
+            return self._bucket_timeline(window_minutes, max_points)
+        if not self.loaded and window_minutes < self.window_minutes:
+            # Only the timeline is needed - don't load more than it shows
+            self.window_minutes = window_minutes
+        self.load()
+        lo = self._start_index(window_minutes)
+        if lo == len(self.timestamps):
             return None
-        
-        student_id = student['id']
-        
-        # Get last 30 minutes of data
-        start_time = datetime.now() - timedelta(minutes=time_window_minutes)
-        
-        cursor.execute("""
-            SELECT timestamp, alpha, beta, theta, delta, gamma, focus
-            FROM eeg_data 
-            WHERE student_id = %s AND timestamp >= %s
-            ORDER BY timestamp ASC
-        """, (student_id, start_time))
-        
-        data_points = cursor.fetchall()
-        cursor.close()
-        db.close()
-        
-        if not data_points:
+
+        values = np.column_stack([self.columns[series][lo:] for series in TIMELINE_SERIES])
+        return downsample_timeline('raw', self.timestamps[lo:], values, values, values, max_points)
+
+    def _bucket_timeline(self, window_minutes, max_points):
+        """
+        Long windows: one averaged point per 1-minute or 1-hour bucket; past max_points
+        buckets, the min / max of the buckets' own extremes instead
+        """
+        resolution = '1m' if window_minutes <= TIMELINE_MINUTE_MAX_MINUTES else '1h'
+        db = get_db_connection()
+        if not db:
+            return None
+        cursor = db.cursor(dictionary=True)
+        try:
+            points = fetch_bucket_series(
+                cursor, self.mac_address, self.now - timedelta(minutes=window_minutes), resolution
+            )
+        finally:
+            cursor.close()
+            db.close()
+        if not points:
             return None
-        
-        # Format for charting
-        timeline = {
-            'timestamps': [point['timestamp'].strftime('%H:%M:%S') for point in data_points],
-            'alpha': [float(point['alpha']) for point in data_points],
-            'beta': [float(point['beta']) for point in data_points],
-            'theta': [float(point['theta']) for point in data_points],
-            'delta': [float(point['delta']) for point in data_points],
-            'gamma': [float(point['gamma']) for point in data_points],
-            'focus': [float(point['focus']) * 100 for point in data_points]  # Convert to percentage
+
+        def column(suffix):
+            return np.array([[point[series + suffix] for series in TIMELINE_SERIES] for point in points], dtype=np.float64)
+
+        return downsample_timeline(
+            resolution, [point['bucket_start'] for point in points],
+            column(''), column('_min'), column('_max'), max_points
+        )
+
+
+def calculate_attention_periods(mac_address, time_window_minutes=60):
+    """
+    Calculate continuous focus periods for a student
+    Returns list of focus periods with quality scores
+    """
+    try:
+        return AnalyticsContext(mac_address, time_window_minutes).attention_periods()
+    except Exception as e:
+        logger.error(f"Attention periods calculation error: {e}")
+        return []
+
+
+def calculate_session_stats(mac_address, time_window_minutes=60):
+    """
+    Calculate today's statistics for a student
+    Returns dict with avg attention span, longest span, total focus time
+    """
+    try:
+        return AnalyticsContext(mac_address, time_window_minutes).session_stats()
+    except Exception as e:
+        logger.error(f"Session stats calculation error: {e}")
+        return {
+            'avg_attention_span': 'N/A',
+            'longest_span': 'N/A',
+            'total_focus_time': 'N/A',
+            'total_periods': 0
         }
-        
-        return timeline
-        
+
+
+def generate_recommendation(mac_address):
+    """
+    Generate personalized recommendation based on student's performance
+    """
+    try:
+        return AnalyticsContext(mac_address, RECOMMENDATION_WINDOW_MINUTES).recommendation()
+    except Exception as e:
+        logger.error(f"Recommendation generation error: {e}")
+        return "Continue monitoring to receive personalized recommendations."
+
+
+def get_wave_timeline_data(mac_address, time_window_minutes=30, max_points=TIMELINE_MAX_POINTS):
+    """
+    Get timeline data for brain wave visualization
+    Returns arrays of timestamps and wave values for charting
+    """
+    try:
+        return AnalyticsContext(mac_address, time_window_minutes).wave_timeline(time_window_minutes, max_points)
     except Exception as e:
         logger.error(f"Wave timeline data error: {e}")
         return None
@@ -273,69 +509,7 @@ def calculate_performance_metrics(mac_address, time_window_minutes=60):
     Calculate performance metrics: focus level, engagement, quality score
     """
     try:
-        db = get_db_connection()
-        if not db:
-            return {'focus_level': 0, 'engagement': 0, 'quality_score': 0}
-        
-        cursor = db.cursor(dictionary=True)
-        
-        # Get student ID
-        cursor.execute("SELECT id FROM students WHERE device_mac = %s", (mac_address,))
-        student = cursor.fetchone()
-        if not student:
-            cursor.close()
-            db.close()
-            return {'focus_level': 0, 'engagement': 0, 'quality_score': 0}
-        
-        student_id = student['id']
-        
-        # Get recent data
-        start_time = datetime.now() - timedelta(minutes=time_window_minutes)
-        
-        cursor.execute("""
-            SELECT focus, beta, gamma, alpha, theta, delta
-            FROM eeg_data 
-            WHERE student_id = %s AND timestamp >= %s
-            ORDER BY timestamp DESC
-        """, (student_id, start_time))
-        
-        data_points = cursor.fetchall()
-        cursor.close()
-        db.close()
-        
-        if not data_points:
-            return {'focus_level': 0, 'engagement': 0, 'quality_score': 0}
-        
-        # Calculate metrics
-        focus_values = [point['focus'] for point in data_points]
-        beta_values = [point['beta'] for point in data_points]
-        gamma_values = [point['gamma'] for point in data_points]
-        alpha_values = [point['alpha'] for point in data_points]
-        theta_values = [point['theta'] for point in data_points]
-        
-        # Focus Level: average of recent focus values (0-100%)
-        focus_level = int(np.mean(focus_values) * 100)
-        
-        # Engagement: based on beta and gamma activity (0-100%)
-        # High beta + gamma = high engagement
-        engagement_scores = [(b + g) / 2 for b, g in zip(beta_values, gamma_values)]
-        engagement = int(np.mean(engagement_scores) * 100)
-        
-        # Quality Score: weighted combination (0-100)
-        # Focus 40%, Beta 30%, Gamma 20%, Low Theta 10%
-        quality_scores = []
-        for f, b, g, t in zip(focus_values, beta_values, gamma_values, theta_values):
-            quality = (f * 0.4 + b * 0.3 + g * 0.2 + (1 - t) * 0.1)
-            quality_scores.append(quality)
-        
-        quality_score = int(np.mean(quality_scores) * 100)
-        
-        return {
-            'focus_level': min(100, max(0, focus_level)),
-            'engagement': min(100, max(0, engagement)),
-            'quality_score': min(100, max(0, quality_score))
-        }
-        
+        return AnalyticsContext(mac_address, time_window_minutes).performance_metrics()
     except Exception as e:
         logger.error(f"Performance metrics calculation error: {e}")
-        return {'focus_level': 0, 'engagement': 0, 'quality_score': 0}
+        return dict(EMPTY_METRICS)
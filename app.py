@@ -1,23 +1,76 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 import numpy as np
-from scipy.signal import butter, lfilter, iirnotch
+from scipy.signal import sosfilt
 import mysql.connector  # Only for error handling
 from datetime import datetime
 import traceback
+import json
+import threading
+import time
 import logging
 import joblib
 import os
 from dotenv import load_dotenv  # Added for environment variables
 
+# Optional WebSocket support for persistent device connections
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
 # Import centralized database connection
 from db import get_db_connection
 
-from analytics import (
-    calculate_attention_periods,
-    calculate_session_stats,
-    generate_recommendation,
-    get_wave_timeline_data,
-    calculate_performance_metrics
+# Binary sample frame format for /upload
+from ingest_protocol import BINARY_FRAME_MIMETYPES, FrameError, iter_sample_frames, normalize_mac_address
+
+# Per-device sample history and streaming filters
+from eeg_dsp import (
+    StreamingFilter,
+    design_bandpass_sos,
+    design_notch_sos,
+    get_spectral_plan
+)
+
+# Device status + sample windows, optionally shared by all gunicorn workers
+from device_state import SharedMemoryDeviceState, create_device_state
+
+# Optional DSP/inference processes with per-device affinity
+from dsp_engine import DspEngine, ShardError
+
+# Vectorized 148-feature model input
+from ml_features import BAND_ORDER as ML_BAND_ORDER, N_FEATURES as ML_FEATURE_COUNT, extract_ml_features_batch
+
+# Cross-device micro-batched model inference
+from inference_batcher import InferenceBatcher
+
+# NumPy-only evaluator for the exported tree model (no xgboost/lightgbm import)
+from compiled_trees import CompiledTreeModel
+
+# Background batched persistence for eeg_data / raw_data
+from write_behind import Reading, writer as persistence_writer
+
+# Cached student list for the live dashboard endpoints
+from student_roster import get_student_roster, invalidate_roster
+
+# Materialized per-session rollups (session history pages)
+from session_summaries import rebuild_session_summary
+
+# Baseline tables and versioned schema changes (applied by `python migrations.py`)
+from migrations import apply_migrations, pending_migrations, run_due_catchups
+
+# Startup hooks for gunicorn preload / per-worker initialisation
+import lifecycle
+
+from analytics import (AnalyticsContext, RECOMMENDATION_WINDOW_MINUTES, TIMELINE_MAX_POINTS, TIMELINE_MIN_POINTS,
+                       format_timeline)
+
+# Compact timeline formats (?format=columnar, Accept: application/x-eeg-timeline)
+from timeline_encoding import TIMELINE_MIMETYPE, encode_binary, encode_columnar, wants_binary
+
+# Repeated dashboard reads served from memory until the next stored batch for the device
+from response_cache import (
+    ANALYTICS_CACHE_SECONDS, SESSION_HISTORY_SCOPE, cached_response, invalidate_responses, mac_scope, response_cache
 )
 
 # Load environment variables from .env file
@@ -28,14 +81,32 @@ from students_routes import register_students_routes
 from session_routes import register_session_routes
 
 app = Flask(__name__)
+sock = Sock(app) if Sock else None
 
 # ----- ML Model Loading -----
 ML_MODEL = None
 ML_MODEL_PATH = "optimized_eeg_model_78.joblib"
+# Written by `python compiled_trees.py optimized_eeg_model_78.joblib`; preferred when present
+# and exported from the current joblib (or when there is no joblib to compare against)
+COMPILED_MODEL_PATH = os.getenv("EEG_COMPILED_MODEL_PATH", "optimized_eeg_model_78.trees.npz")
 
 def load_ml_model():
     """Load the trained ML model for enhanced state prediction"""
     global ML_MODEL
+    if os.path.exists(COMPILED_MODEL_PATH):
+        try:
+            compiled = CompiledTreeModel.load(COMPILED_MODEL_PATH)
+            if os.path.exists(ML_MODEL_PATH) and not compiled.matches_source(ML_MODEL_PATH):
+                logger.warning(f"⚠️ {COMPILED_MODEL_PATH} was not exported from the current {ML_MODEL_PATH} - "
+                               f"loading the joblib model (re-run `python compiled_trees.py {ML_MODEL_PATH}`)")
+            else:
+                ML_MODEL = compiled
+                logger.info(f"✅ Compiled tree model loaded ({ML_MODEL.n_trees} trees, NumPy evaluator)")
+                return True
+        except Exception as e:
+            logger.error(f"❌ Failed to load compiled model {COMPILED_MODEL_PATH}: {e} - trying {ML_MODEL_PATH}")
+            ML_MODEL = None
+
     try:
         if os.path.exists(ML_MODEL_PATH):
             loaded_data = joblib.load(ML_MODEL_PATH)
@@ -84,6 +155,13 @@ def load_ml_model():
         ML_MODEL = None
         return False
 
+# Batched inference: rows from all devices within a short window share one predict_proba call
+INFERENCE_BATCHER = InferenceBatcher(
+    lambda: ML_MODEL,
+    max_batch=int(os.getenv("EEG_INFERENCE_BATCH_SIZE", 64)),
+    max_wait=float(os.getenv("EEG_INFERENCE_BATCH_MS", 30)) / 1000.0
+)
+
 # Setup logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -100,108 +178,135 @@ EEG_BANDS = {
     "beta":  (13, 30),
     "gamma": (30, 45)
 }
+EEG_BAND_SPEC = tuple(EEG_BANDS.items())  # Hashable form used to key cached spectral plans
 
-# ----- EEG Buffer (per device MAC) -----
-EEG_BUFFERS = {}  # Dictionary to store separate buffers for each MAC address
-DEVICE_STATUSES = {}  # Dictionary to store status for each device MAC address
+# "periodogram" (single window, default) or "welch" (averaged 50%-overlap segments, steadier)
+SPECTRAL_MODE = os.getenv("EEG_SPECTRAL_MODE", "periodogram")
 
-# Initialize database
-def init_database():
-    db = get_db_connection()
-    if db:
-        cursor = db.cursor()
-        try:
-            # Create students table FIRST (no foreign keys)
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS students (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                name VARCHAR(100),
-                device_mac VARCHAR(50) UNIQUE,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-            
-            # Create monitoring_sessions table (no foreign keys)
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS monitoring_sessions (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                teacher_name VARCHAR(100),
-                subject VARCHAR(100),
-                start_time DATETIME,
-                end_time DATETIME,
-                active BOOLEAN DEFAULT TRUE,
-                INDEX idx_active (active)
-            )
-            """)
-            
-            # Now create raw_data (references students)
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS raw_data (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME,
-                adc_value INT,
-                mac_address VARCHAR(50),
-                student_id INT,
-                INDEX idx_timestamp (timestamp),
-                INDEX idx_mac (mac_address),
-                FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE SET NULL
-            )
-            """)
+# ----- Device State (per device MAC) -----
+# Connection status, the last BUFFER_SIZE raw samples, the same window after filtering and
+# the filter state carried between uploads. "local" keeps them in this process; "shared"
+# puts them in shared memory so every gunicorn worker sees the same devices.
+# ----- DSP Engine -----
+# EEG_DSP_SHARDS > 0 runs filtering, band powers and prediction in that many forked
+# processes, each device pinned to one of them; the web workers only parse and store.
+# Shards read and write the shared device state, so it is required here.
+DSP_SHARDS = int(os.getenv("EEG_DSP_SHARDS", 0))
+DSP_TIMEOUT = float(os.getenv("EEG_DSP_TIMEOUT_MS", 2000)) / 1000.0
 
-            # Create eeg_data (references students)
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS eeg_data (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME,
-                delta FLOAT,
-                theta FLOAT,
-                alpha FLOAT,
-                beta FLOAT,
-                gamma FLOAT,
-                focus FLOAT,
-                signal_quality VARCHAR(20),
-                mac_address VARCHAR(50),
-                student_id INT,
-                INDEX idx_timestamp (timestamp),
-                INDEX idx_mac (mac_address),
-                FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE SET NULL
-            )
-            """)
-            
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                student_id INT,
-                session_name VARCHAR(100),
-                start_time DATETIME,
-                end_time DATETIME,
-                active BOOLEAN DEFAULT TRUE,
-                monitoring_session_id INT,
-                FOREIGN KEY (student_id) REFERENCES students(id),
-                FOREIGN KEY (monitoring_session_id) REFERENCES monitoring_sessions(id) ON DELETE SET NULL
-            )
-            """)
-            
-            logger.info("Database tables initialized successfully")
-            return True
-        except mysql.connector.Error as err:
-            logger.error(f"Database initialization error: {err}")
-            return False
-        finally:
+DEVICE_STATE = create_device_state(
+    "shared" if DSP_SHARDS > 0 else os.getenv("EEG_DEVICE_STATE", "local"),
+    BUFFER_SIZE,
+    SAMPLE_RATE,
+    max_devices=int(os.getenv("EEG_MAX_DEVICES", 256))
+)
+
+# ----- Streaming Ingest (WebSocket) -----
+# Each open /ws/ingest channel holds a server thread for its lifetime, so channels per
+# process are capped; a headset refused with close code 1013 (try again later) sends
+# its frames over /upload instead. gunicorn.conf.py sizes the thread pool from this cap.
+WS_MAX_CHANNELS = int(os.getenv("EEG_WS_MAX_CHANNELS", 40))
+WS_TRY_AGAIN_LATER = 1013
+_ws_slots = threading.BoundedSemaphore(WS_MAX_CHANNELS)
+_ws_open = {"channels": 0, "refused": 0}
+
+# ----- Live Updates (Server-Sent Events) -----
+# /api/stream pushes device changes from DEVICE_STATE instead of dashboards polling MySQL.
+# Each open stream holds a server thread, so streams per process are capped; clients
+# refused with 503 fall back to polling. gunicorn.conf.py gives the streams their own
+# threads on top of the ingest channels and ordinary requests.
+SSE_MAX_STREAMS = int(os.getenv("EEG_SSE_MAX_STREAMS", 16))
+SSE_POLL_SECONDS = 0.5  # how often a stream checks the store's version counter
+SSE_HEARTBEAT_SECONDS = 5  # also how soon a dropped client frees its slot (~2 heartbeats)
+SSE_MAX_STREAM_SECONDS = 300  # then the browser reconnects (and resumes) by itself
+SSE_RETRY_MS = 3000
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+# ----- Active Monitoring Session Cache -----
+# The upload path checks this instead of querying monitoring_sessions per request.
+# Start/end routes in this process update it immediately; other workers see changes within the TTL.
+ACTIVE_SESSION_TTL = 5  # seconds
+_active_session = {"id": None, "checked_at": None}
+_active_session_lock = threading.Lock()
+
+def get_active_monitoring_session_id():
+    """Return the id of the active monitoring session (or None), cached for ACTIVE_SESSION_TTL seconds"""
+    with _active_session_lock:
+        checked_at = _active_session["checked_at"]
+        if checked_at is not None and time.monotonic() - checked_at < ACTIVE_SESSION_TTL:
+            return _active_session["id"]
+        
+        try:
+            db = get_db_connection()
+            cursor = db.cursor()
+            cursor.execute("SELECT id FROM monitoring_sessions WHERE active = TRUE ORDER BY start_time DESC LIMIT 1")
+            row = cursor.fetchone()
             cursor.close()
             db.close()
-    return False
+            _active_session["id"] = row[0] if row else None
+        except Exception as e:
+            # Keep the last known value; try again after the TTL
+            logger.error(f"Active session lookup error: {e}")
+        
+        _active_session["checked_at"] = time.monotonic()
+        return _active_session["id"]
+
+def set_active_monitoring_session_id(session_id):
+    """Update the cache after this process starts or ends a monitoring session"""
+    with _active_session_lock:
+        _active_session["id"] = session_id
+        _active_session["checked_at"] = time.monotonic()
+
+def close_active_monitoring_sessions(cursor, end_time):
+    """End every active monitoring session; returns the ids of the ones closed"""
+    cursor.execute("SELECT id FROM monitoring_sessions WHERE active = TRUE")
+    session_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "UPDATE monitoring_sessions SET active = FALSE, end_time = %s WHERE active = TRUE",
+        (end_time,)
+    )
+    return session_ids
+
+def finalize_session_summaries(db, session_ids):
+    """
+    Write the final rollups of sessions that just ended, after this process's queued readings
+    If this fails the history endpoint rebuilds them on its next read
+    """
+    if not session_ids:
+        return
+    persistence_writer.flush()
+    cursor = db.cursor()
+    try:
+        for session_id in session_ids:
+            rebuild_session_summary(cursor, session_id, finalize=True)
+        db.commit()
+    except mysql.connector.Error as e:
+        logger.error(f"❌ Session summary error: {e}")
+    finally:
+        cursor.close()
+
+# Check the database schema (created and migrated by `python migrations.py`, see migrations.py)
+def init_database():
+    db = get_db_connection()
+    cursor = db.cursor()
+    try:
+        pending = pending_migrations(cursor)
+    finally:
+        cursor.close()
+        db.close()
+    if pending:
+        raise RuntimeError(f"Schema migration(s) {pending} not applied - run `python migrations.py`")
+    logger.info("Database schema is up to date")
+    return "schema up to date"
 
 # ----- Signal Processing Functions -----
+# Offline (whole-array) filters - the live pipeline uses StreamingFilter per device.
+# Coefficients come from the cached designs in eeg_dsp instead of being redesigned per call.
 def bandpass_filter(data, lowcut=0.5, highcut=48, fs=SAMPLE_RATE, order=2):
     try:
         if len(data) < 10:
             return data
-        nyq = 0.5 * fs
-        low = max(lowcut / nyq, 0.01)
-        high = min(highcut / nyq, 0.99)
-        b, a = butter(order, [low, high], btype='band')
-        return lfilter(b, a, data)
+        return sosfilt(design_bandpass_sos(lowcut, highcut, fs, order), data)
     except Exception as e:
         logger.error(f"Bandpass filter error: {e}")
         return data
@@ -210,39 +315,23 @@ def notch_filter(data, freq=50.0, fs=SAMPLE_RATE, Q=10.0):
     try:
         if len(data) < 10:
             return data
-        b, a = iirnotch(freq/(fs/2), Q)
-        return lfilter(b, a, data)
+        return sosfilt(design_notch_sos(freq, fs, Q), data)
     except Exception as e:
         logger.error(f"Notch filter error: {e}")
         return data
 
 def compute_band_power(signal):
-    """Compute EEG band powers using FFT with Hamming window"""
+    """Compute EEG band powers using FFT with Hamming window (cached SpectralPlan per window length)"""
     try:
         N = len(signal)
         if N < 50:
             return {band: 0.1 for band in EEG_BANDS}
         
-        signal = signal - np.mean(signal)
-        window = np.hamming(N)
-        signal_windowed = signal * window
-        
-        freqs = np.fft.rfftfreq(N, 1/SAMPLE_RATE)
-        fft_vals = np.abs(np.fft.rfft(signal_windowed))**2
-        
-        window_power = np.sum(window**2) / N
-        psd = fft_vals / (N * window_power)
-        
-        band_powers = {}
-        for band, (low, high) in EEG_BANDS.items():
-            idx = np.logical_and(freqs >= low, freqs <= high)
-            if np.any(idx):
-                power = float(np.sum(psd[idx]))
-                band_powers[band] = max(power, 0.01)
-            else:
-                band_powers[band] = 0.01
+        plan = get_spectral_plan(N, SAMPLE_RATE, EEG_BAND_SPEC, SPECTRAL_MODE)
+        powers = plan.band_powers(signal)
         
-        return band_powers
+        # Empty bands come back as 0 and are floored to 0.01 like any weak band
+        return {band: max(float(power), 0.01) for band, power in zip(plan.band_names, powers)}
         
     except Exception as e:
         logger.error(f"Band power computation error: {e}")
@@ -392,179 +481,20 @@ def extract_ml_features(band_powers, focus_score, raw_eeg_buffer=None):
     """
     Extract 148 advanced features for ML model prediction (MODEL TRAINED WITH 148!)
     Includes: band powers, ratios, statistical features, spectral features
+    Single-window wrapper around ml_features.extract_ml_features_batch (float64, exact legacy values)
     """
     try:
-        delta = band_powers.get('delta', 0)
-        theta = band_powers.get('theta', 0)
-        alpha = band_powers.get('alpha', 0)
-        beta = band_powers.get('beta', 0)
-        gamma = band_powers.get('gamma', 0)
-        
-        total_power = sum(band_powers.values())
-        if total_power == 0:
-            total_power = 1e-10
-        
-        # Feature array (148 features total)
-        features = []
-        
-        # 1-5: Raw band powers
-        features.extend([delta, theta, alpha, beta, gamma])
-        
-        # 6-10: Normalized band powers (percentages)
-        features.extend([
-            delta / total_power * 100,
-            theta / total_power * 100,
-            alpha / total_power * 100,
-            beta / total_power * 100,
-            gamma / total_power * 100
-        ])
-        
-        # 11: Total power
-        features.append(total_power)
-        
-        # 12-25: Band ratios (critical for state detection)
-        features.extend([
-            beta / theta if theta > 0 else 0,  # Beta/Theta (attention)
-            beta / alpha if alpha > 0 else 0,  # Beta/Alpha
-            alpha / theta if theta > 0 else 0,  # Alpha/Theta
-            (beta + gamma) / (alpha + theta) if (alpha + theta) > 0 else 0,  # Engagement
-            delta / theta if theta > 0 else 0,
-            gamma / beta if beta > 0 else 0,
-            (alpha + theta) / beta if beta > 0 else 0,
-            beta / (alpha + theta) if (alpha + theta) > 0 else 0,  # NASA Index
-            (theta + alpha) / (beta + gamma) if (beta + gamma) > 0 else 0,
-            alpha / delta if delta > 0 else 0,
-            gamma / theta if theta > 0 else 0,
-            beta / delta if delta > 0 else 0,
-            (beta + alpha) / (theta + delta) if (theta + delta) > 0 else 0,
-            gamma / alpha if alpha > 0 else 0
-        ])
-        
-        # 26: Focus score (from formula)
-        features.append(focus_score)
-        
-        # 27-31: Logarithmic band powers (reduce skewness)
-        features.extend([
-            np.log1p(delta),
-            np.log1p(theta),
-            np.log1p(alpha),
-            np.log1p(beta),
-            np.log1p(gamma)
-        ])
-        
-        # 32-36: Square root normalized powers
-        features.extend([
-            np.sqrt(delta / total_power) if total_power > 0 else 0,
-            np.sqrt(theta / total_power) if total_power > 0 else 0,
-            np.sqrt(alpha / total_power) if total_power > 0 else 0,
-            np.sqrt(beta / total_power) if total_power > 0 else 0,
-            np.sqrt(gamma / total_power) if total_power > 0 else 0
-        ])
-        
-        # 37-41: Low vs High frequency ratios
-        low_freq = delta + theta
-        high_freq = beta + gamma
-        mid_freq = alpha
-        
-        features.extend([
-            high_freq / low_freq if low_freq > 0 else 0,
-            low_freq / high_freq if high_freq > 0 else 0,
-            mid_freq / low_freq if low_freq > 0 else 0,
-            mid_freq / high_freq if high_freq > 0 else 0,
-            (high_freq + mid_freq) / low_freq if low_freq > 0 else 0
-        ])
-        
-        # 42-46: Band power differences
-        features.extend([
-            beta - theta,
-            beta - alpha,
-            alpha - theta,
-            gamma - beta,
-            beta - delta
-        ])
-        
-        # 47-51: Cross-band interactions
-        features.extend([
-            beta * alpha,
-            theta * delta,
-            gamma * beta,
-            alpha * theta,
-            beta * gamma
-        ])
-        
-        # 52-56: Relative band dominance
-        max_power = max(band_powers.values())
-        features.extend([
-            delta / max_power if max_power > 0 else 0,
-            theta / max_power if max_power > 0 else 0,
-            alpha / max_power if max_power > 0 else 0,
-            beta / max_power if max_power > 0 else 0,
-            gamma / max_power if max_power > 0 else 0
-        ])
-        
-        # 57-71: Statistical features from raw EEG (if available)
+        band_row = [[band_powers.get(band, 0) for band in ML_BAND_ORDER]]
+        raw_windows = None
         if raw_eeg_buffer is not None and len(raw_eeg_buffer) > 10:
-            eeg_array = np.array(raw_eeg_buffer)
-            features.extend([
-                np.mean(eeg_array),
-                np.std(eeg_array),
-                np.var(eeg_array),
-                np.median(eeg_array),
-                np.max(eeg_array),
-                np.min(eeg_array),
-                np.ptp(eeg_array),  # peak-to-peak
-                np.percentile(eeg_array, 25),
-                np.percentile(eeg_array, 75),
-                np.percentile(eeg_array, 90),
-                np.mean(np.abs(np.diff(eeg_array))),  # mean absolute derivative
-                np.std(np.diff(eeg_array)) if len(eeg_array) > 1 else 0,
-                len(eeg_array),
-                np.sum(eeg_array > 0),
-                np.sum(eeg_array < 0)
-            ])
-        else:
-            # Placeholder zeros if no raw data
-            features.extend([0] * 15)
-        
-        # 72-86: Advanced spectral features
-        features.extend([
-            (beta + gamma) / total_power if total_power > 0 else 0,  # High freq ratio
-            (delta + theta) / total_power if total_power > 0 else 0,  # Low freq ratio
-            alpha / total_power if total_power > 0 else 0,  # Mid freq ratio
-            beta / (delta + theta + alpha) if (delta + theta + alpha) > 0 else 0,
-            gamma / (delta + theta + alpha + beta) if (delta + theta + alpha + beta) > 0 else 0,
-            np.sqrt(beta * alpha) / theta if theta > 0 else 0,
-            (beta ** 2) / (alpha * theta) if (alpha * theta) > 0 else 0,
-            np.log1p(beta / theta) if theta > 0 else 0,
-            np.log1p(alpha / delta) if delta > 0 else 0,
-            (beta + alpha + gamma) / (theta + delta) if (theta + delta) > 0 else 0,
-            beta * gamma / (alpha * theta) if (alpha * theta) > 0 else 0,
-            (beta - theta) / (beta + theta) if (beta + theta) > 0 else 0,
-            (alpha - delta) / (alpha + delta) if (alpha + delta) > 0 else 0,
-            gamma / (beta + alpha) if (beta + alpha) > 0 else 0,
-            (theta + delta + alpha) / (beta + gamma) if (beta + gamma) > 0 else 0
-        ])
-        
-        # 87-148: Additional contextual features (pad to reach 148 - model expects this!)
-        remaining_features = 148 - len(features)
-        if remaining_features > 0:
-            # Add polynomial features and interactions
-            for i in range(min(remaining_features, 20)):
-                features.append(focus_score ** (i + 1) * 0.1)
-            
-            # Add more cross-band ratios if needed
-            while len(features) < 148:
-                features.append(0)
+            raw_windows = np.asarray(raw_eeg_buffer).reshape(1, -1)
         
-        # Ensure exactly 148 features (model was trained with 148!)
-        features = features[:148]
-        
-        return np.array(features).reshape(1, -1)
+        return extract_ml_features_batch(band_row, [focus_score], raw_windows, dtype=np.float64)
         
     except Exception as e:
         logger.error(f"Feature extraction error: {e}")
         # Return zero features array as fallback (148 features!)
-        return np.zeros((1, 148))
+        return np.zeros((1, ML_FEATURE_COUNT))
 
 def predict_state_hybrid(band_powers, focus_score, raw_eeg_buffer=None):
     """
@@ -628,10 +558,12 @@ def predict_state_hybrid(band_powers, focus_score, raw_eeg_buffer=None):
                 # Extract 147 features for ML model
                 features = extract_ml_features(band_powers, focus_score, raw_eeg_buffer)
                 
-                # Get ML prediction with probabilities
-                ml_prediction_raw = ML_MODEL.predict(features)[0]
+                # Get ML prediction with probabilities (one predict_proba, micro-batched across devices)
+                prediction = INFERENCE_BATCHER.predict(features)
+                if prediction is None:
+                    return formula_state if formula_state in VALID_STATES else 'distracted'
+                ml_prediction_raw, ml_proba = prediction
                 ml_prediction = normalize_state(ml_prediction_raw)
-                ml_proba = ML_MODEL.predict_proba(features)[0]
                 
                 # Get confidence of ML prediction
                 ml_confidence = np.max(ml_proba)
@@ -691,11 +623,10 @@ def predict_state_hybrid(band_powers, focus_score, raw_eeg_buffer=None):
 # Replace this function in your Flask app
 def analyze_signal_quality(raw_values):
     """Enhanced signal quality detection - more lenient for normal EEG values"""
-    if not raw_values or len(raw_values) < 1:
+    raw_array = np.asarray(raw_values)
+    if raw_array.size < 1:
         return "no_data", "No signal detected"
     
-    raw_array = np.array(raw_values)
-    
     # Check for pure disconnection patterns (all zeros or all max values)
     if np.all(raw_array == 0):
         return "connection_error", "Sensor completely disconnected - receiving only zeros"
@@ -739,10 +670,10 @@ def check_device_wearing(raw_values):
     return normal_range_count > len(raw_array) * 0.7  # 70% threshold
 def check_device_wearing(raw_values):
     """Simple check - if not getting only 0s or 4095s, consider as wearing"""
-    if not raw_values or len(raw_values) < 1:
+    raw_array = np.asarray(raw_values)
+    if raw_array.size < 1:
         return False
     
-    raw_array = np.array(raw_values)
     unique_values = np.unique(raw_array)
     
     # Not wearing only if getting pure 0s, pure 4095s, or only these two values
@@ -758,22 +689,12 @@ def process_eeg_data(raw_values, mac_address):
     Process EEG data with HYBRID prediction (Formula + ML Model)
     Returns: band_powers, focus_level, mental_state
     """
-    global EEG_BUFFERS
     try:
-        # Initialize buffer for this MAC address if not exists
-        if mac_address not in EEG_BUFFERS:
-            EEG_BUFFERS[mac_address] = []
-        
-        EEG_BUFFERS[mac_address].extend([float(v) for v in raw_values])
-        if len(EEG_BUFFERS[mac_address]) > BUFFER_SIZE:
-            EEG_BUFFERS[mac_address] = EEG_BUFFERS[mac_address][-BUFFER_SIZE:]
+        chunk = (np.asarray(raw_values, dtype=np.float64) - 2048) / 2048.0
         
-        signal = np.array(EEG_BUFFERS[mac_address], dtype=float)
-        signal = (signal - 2048) / 2048.0
-        
-        if len(signal) > 50:
-            signal = notch_filter(signal)
-            signal = bandpass_filter(signal)
+        # Only the new samples are filtered; the filter state carries over between uploads.
+        # Returns copies of the windows, shared by the DSP and the ML raw-signal features
+        raw_window, signal = DEVICE_STATE.process_chunk(mac_address, raw_values, chunk)
         
         # Calculate band powers
         band_powers = compute_band_power(signal)
@@ -782,13 +703,36 @@ def process_eeg_data(raw_values, mac_address):
         focus_level = calculate_focus(band_powers)
         
         # 🔥 HYBRID PREDICTION: Use both formula + ML model
-        mental_state = predict_state_hybrid(band_powers, focus_level, EEG_BUFFERS[mac_address])
+        mental_state = predict_state_hybrid(band_powers, focus_level, raw_window)
         
         return band_powers, focus_level, mental_state
     except Exception as e:
         logger.error(f"EEG processing error for MAC {mac_address}: {e}")
-        default_bands = {"delta":0.2,"theta":0.15,"alpha":0.3,"beta":0.25,"gamma":0.1}
-        return default_bands, 0.4, "monitoring"
+        return default_processing_result()
+
+def default_processing_result():
+    """Neutral result reported when a chunk couldn't be processed"""
+    default_bands = {"delta":0.2,"theta":0.15,"alpha":0.3,"beta":0.25,"gamma":0.1}
+    return default_bands, 0.4, "monitoring"
+
+# Created at import so web workers inherit the shard addresses; started by a preload hook
+DSP_ENGINE = DspEngine(DSP_SHARDS, process_eeg_data, timeout=DSP_TIMEOUT) if DSP_SHARDS > 0 else None
+
+def dispatch_eeg_processing(raw_values, mac_address):
+    """
+    Process a chunk on the device's DSP shard when the engine runs, otherwise in this process
+    Returns: band_powers, focus_level, mental_state
+    """
+    if DSP_ENGINE is not None and DSP_ENGINE.started:
+        try:
+            result = DSP_ENGINE.process(mac_address, raw_values)
+        except ShardError as e:
+            # The shard may still apply this chunk - processing it here would duplicate it
+            logger.error(f"❌ {e} ({mac_address})")
+            return default_processing_result()
+        if result is not None:
+            return result
+    return process_eeg_data(raw_values, mac_address)
 
 # ----- Routes -----
 # Student Management Routes
@@ -829,6 +773,9 @@ def add_student():
             db.commit()
             cursor.close()
             db.close()
+            invalidate_roster()
+            if device_mac:
+                invalidate_responses(device_mac)
             return jsonify({"status": "ok", "student_id": student_id, "msg": "Student added"}), 201
         return jsonify({"status": "error", "msg": "Database connection failed"}), 500
     except Exception as e:
@@ -946,10 +893,8 @@ def start_monitoring_session():
             cursor = db.cursor()
             
             # End any active monitoring sessions
-            cursor.execute(
-                "UPDATE monitoring_sessions SET active = FALSE, end_time = %s WHERE active = TRUE",
-                (datetime.now(),)
-            )
+            end_time = datetime.now()
+            ended_sessions = close_active_monitoring_sessions(cursor, end_time)
             
             # Start new monitoring session
             cursor.execute(
@@ -959,7 +904,10 @@ def start_monitoring_session():
             session_id = cursor.lastrowid
             db.commit()
             cursor.close()
+            set_active_monitoring_session_id(session_id)
+            finalize_session_summaries(db, ended_sessions)
             db.close()
+            invalidate_responses(SESSION_HISTORY_SCOPE)
             
             logger.info(f"Monitoring session started by {teacher_name} for {subject}")
             return jsonify({
@@ -981,13 +929,16 @@ def end_monitoring_session():
         db = get_db_connection()
         if db:
             cursor = db.cursor()
-            cursor.execute(
-                "UPDATE monitoring_sessions SET active = FALSE, end_time = %s WHERE active = TRUE",
-                (datetime.now(),)
-            )
+            end_time = datetime.now()
+            ended_sessions = close_active_monitoring_sessions(cursor, end_time)
             db.commit()
             cursor.close()
+            set_active_monitoring_session_id(None)
+            
+            # Materialize the ended session's rollups for the history pages
+            finalize_session_summaries(db, ended_sessions)
             db.close()
+            invalidate_responses(SESSION_HISTORY_SCOPE)
             
             logger.info("Monitoring session ended")
             return jsonify({"status": "ok", "msg": "Monitoring session ended"}), 200
@@ -1030,10 +981,133 @@ def get_monitoring_status():
         logger.error(f"Get monitoring status error: {e}")
         return jsonify({"status": "error", "msg": str(e)}), 500
 
+def ingest_samples(mac_address, raw_values, sequence=None):
+    """
+    Run one chunk of samples from a device through status tracking, DSP and storage
+    Shared by the JSON and binary /upload formats
+    Returns: (response payload dict, HTTP status code)
+    """
+    # Track frame sequence numbers (binary uploads only)
+    last_sequence = None
+    if sequence is not None:
+        status = DEVICE_STATE.get_status(mac_address)
+        last_sequence = status["last_sequence"] if status is not None else None
+        if last_sequence is not None:
+            if sequence == last_sequence:
+                # Device retried a frame we already processed - acknowledge without reprocessing
+                return {
+                    "status": "ok",
+                    "mac_address": mac_address,
+                    "sequence": sequence,
+                    "duplicate": True
+                }, 200
+            gap = (sequence - last_sequence - 1) & 0xFFFFFFFF
+            if 0 < gap < 0x80000000:
+                logger.warning(f"⚠️  {mac_address}: {gap} frame(s) missing before sequence {sequence}")
+    
+    result, status_code = process_samples(mac_address, raw_values)
+    
+    if sequence is not None:
+        result["sequence"] = sequence
+        # Recorded only once the frame was handled: a frame that raised (500) is
+        # processed again when the device retries it instead of acked as a duplicate.
+        # Compare-and-set, so a slower older frame can't overwrite a newer sequence.
+        if status_code == 200:
+            DEVICE_STATE.record_sequence(mac_address, last_sequence, sequence)
+    return result, status_code
+
+def process_samples(mac_address, raw_values):
+    """Status, DSP, live publish and write-behind queueing for one chunk (see ingest_samples)"""
+    timestamp = datetime.now()
+   
+    # ✅ Analyze signal quality
+    quality, quality_msg = analyze_signal_quality(raw_values)
+    DEVICE_STATE.update_status(
+        mac_address,
+        connected=quality != "connection_error",
+        last_update=timestamp,
+        wearing=check_device_wearing(raw_values),
+        signal_quality=quality,
+        error_message=quality_msg if quality == "connection_error" else None
+    )
+    
+    # Process EEG data
+    band_powers, focus_level, mental_state = dispatch_eeg_processing(raw_values, mac_address)
+    DEVICE_STATE.publish(mac_address, band_powers, focus_level, mental_state)
+    
+    result = {
+        "status": "ok",
+        "mac_address": mac_address,
+        "bands": band_powers,
+        "focus": focus_level,
+        "mental_state": mental_state
+    }
+   
+    # ✅ Check if monitoring session is active (cached - no DB round trip per upload)
+    session_id = get_active_monitoring_session_id()
+    if session_id is None:
+        # No active session - don't save
+        # Only log first time
+        if not hasattr(upload_data, 'no_session_logged'):
+            logger.warning(f"⚠️  No active session - Data from {mac_address} not saved")
+            upload_data.no_session_logged = True
+        
+        result.update({"data_saved": False, "message": "No active session"})
+        return result, 200
+    
+    # Stored readings also feed the device's attention tracker (periods without SQL);
+    # a period this reading closed is written with it
+    closed_period = DEVICE_STATE.track_attention(
+        mac_address, timestamp, focus_level, band_powers['beta'], band_powers['gamma']
+    )
+
+    # Active session exists - hand the reading to the write-behind queue
+    # (student lookup/registration and INSERTs happen in the background writer)
+    queued = persistence_writer.enqueue(
+        Reading(timestamp, mac_address, raw_values, band_powers, focus_level, quality, session_id, closed_period)
+    )
+    
+    # Log only occasionally (every 10 requests)
+    if not hasattr(upload_data, 'request_count'):
+        upload_data.request_count = 0
+    upload_data.request_count += 1
+    
+    if upload_data.request_count % 10 == 1:
+        logger.info(f"💾 Queued data from {mac_address} | Focus: {focus_level*100:.0f}% | {mental_state}")
+    
+    result["data_saved"] = queued
+    return result, 200
+
+def upload_binary_frames():
+    """
+    Handle a packed binary upload (see ingest_protocol.py for the frame layout)
+    Samples are read straight into NumPy without building per-sample Python objects
+    """
+    body = request.get_data(cache=False)
+    if not body:
+        return jsonify({"status": "error", "msg": "No data received"}), 400
+    
+    try:
+        frames = list(iter_sample_frames(body))
+    except FrameError as e:
+        return jsonify({"status": "error", "msg": f"Invalid frame: {e}"}), 400
+    
+    result, status_code = None, 200
+    for frame in frames:
+        result, status_code = ingest_samples(frame.mac_address, frame.samples, frame.sequence)
+        if status_code != 200:
+            break
+    
+    result["frames"] = len(frames)
+    return jsonify(result), status_code
+
 @app.route("/upload", methods=['POST'])
 def upload_data():
-    global DEVICE_STATUSES
     try:
+        # ✅ Binary frames (application/octet-stream)
+        if request.mimetype in BINARY_FRAME_MIMETYPES:
+            return upload_binary_frames()
+        
         data = request.json
         
         # ✅ Validate incoming data
@@ -1044,16 +1118,10 @@ def upload_data():
         mac_address = data.get("mac") or data.get("mac_address") or data.get("device_mac")
         if not mac_address:
             return jsonify({"status": "error", "msg": "MAC address required"}), 400
-        
-        # Initialize status for this MAC if not exists
-        if mac_address not in DEVICE_STATUSES:
-            DEVICE_STATUSES[mac_address] = {
-                "connected": False, 
-                "wearing": False, 
-                "last_update": None,
-                "error_message": None,
-                "signal_quality": "unknown"
-            }
+        try:
+            mac_address = normalize_mac_address(mac_address)
+        except ValueError as e:
+            return jsonify({"status": "error", "msg": str(e)}), 400
        
         # ✅ Handle data formats
         if "average" in data:
@@ -1065,130 +1133,98 @@ def upload_data():
         else:
             return jsonify({"status": "error", "msg": "Invalid JSON format"}), 400
         
-        timestamp = datetime.now()
-       
-        # ✅ Analyze signal quality
-        quality, quality_msg = analyze_signal_quality(raw_values)
-        DEVICE_STATUSES[mac_address].update({
-            "connected": quality != "connection_error",
-            "last_update": timestamp,
-            "wearing": check_device_wearing(raw_values),
-            "signal_quality": quality,
-            "error_message": quality_msg if quality == "connection_error" else None
-        })
-        
-        # Process EEG data
-        band_powers, focus_level, mental_state = process_eeg_data(raw_values, mac_address)
-       
-        # ✅ Check if monitoring session is active
-        db = get_db_connection()
-        if not db:
-            return jsonify({"status": "error", "msg": "Database connection failed"}), 500
-        
-        cursor = db.cursor(dictionary=True)
-        
-        # Check for active monitoring session
-        cursor.execute("SELECT id FROM monitoring_sessions WHERE active = TRUE LIMIT 1")
-        active_monitoring = cursor.fetchone()
-        
-        if not active_monitoring:
-            # No active session - don't save
-            cursor.close()
-            db.close()
+        result, status_code = ingest_samples(mac_address, raw_values)
+        return jsonify(result), status_code
             
-            # Only log first time
-            if not hasattr(upload_data, 'no_session_logged'):
-                logger.warning(f"⚠️  No active session - Data from {mac_address} not saved")
-                upload_data.no_session_logged = True
-            
-            return jsonify({
-                "status": "ok",
-                "mac_address": mac_address,
-                "bands": band_powers,
-                "focus": focus_level,
-                "mental_state": mental_state,
-                "data_saved": False,
-                "message": "No active session"
-            }), 200
+    except Exception as e:
+        logger.error(f"Upload error: {e}")
+        return jsonify({"status": "error", "msg": "Server error"}), 500
+
+def ingest_stream(ws):
+    """
+    Long-lived ingest channel - one WebSocket per headset (/ws/ingest)
+    Each binary message carries one or more sample frames (same layout as binary /upload)
+    Every frame is answered with a small JSON ack holding the latest focus/state
+    Each open channel occupies one server thread, so at most WS_MAX_CHANNELS per process
+    are accepted; the rest are closed with 1013 and fall back to /upload
+    """
+    if not _ws_slots.acquire(blocking=False):
+        _ws_open["refused"] += 1
+        if _ws_open["refused"] % 100 == 1:
+            logger.warning(f"⚠️ Ingest channel limit reached ({WS_MAX_CHANNELS} per process) - "
+                           f"refused {_ws_open['refused']} channel(s) so far")
+        ws.close(reason=WS_TRY_AGAIN_LATER, message="Channel limit reached - send frames to /upload")
+        return
+    
+    _ws_open["channels"] += 1
+    try:
+        receive_sample_frames(ws)
+    finally:
+        _ws_open["channels"] -= 1
+        _ws_slots.release()
+
+def receive_sample_frames(ws):
+    """Process and acknowledge frames until the channel closes"""
+    mac_address = None
+    while True:
+        message = ws.receive()
+        if message is None:
+            continue
+        
+        if isinstance(message, str):
+            ws.send(json.dumps({"error": "Binary sample frames expected"}))
+            continue
         
-        # Active session exists - save data
         try:
-            # Get or create student
-            cursor.execute("SELECT id FROM students WHERE device_mac = %s", (mac_address,))
-            student = cursor.fetchone()
-            student_id = student['id'] if student else None
-            
-            if not student_id:
-                cursor.execute(
-                    "INSERT INTO students (name, device_mac) VALUES (%s, %s)",
-                    (f"Student-{mac_address[-8:]}", mac_address)
-                )
-                student_id = cursor.lastrowid
-                logger.info(f"✅ New student registered: {mac_address}")
-            
-            # Store raw values
-            for raw_val in raw_values:
-                cursor.execute("""
-                    INSERT INTO raw_data (timestamp, adc_value, mac_address, student_id) 
-                    VALUES (%s, %s, %s, %s)
-                """, (timestamp, raw_val, mac_address, student_id))
-           
-            # Store processed EEG data
-            cursor.execute("""
-                INSERT INTO eeg_data (timestamp, delta, theta, alpha, beta, gamma, focus, signal_quality, mac_address, student_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                timestamp,
-                band_powers['delta'], band_powers['theta'], band_powers['alpha'],
-                band_powers['beta'], band_powers['gamma'], focus_level, quality,
-                mac_address, student_id
-            ))
-            
-            db.commit()
-           
-            # Log only occasionally (every 10 requests)
-            if not hasattr(upload_data, 'request_count'):
-                upload_data.request_count = 0
-            upload_data.request_count += 1
-            
-            if upload_data.request_count % 10 == 1:
-                logger.info(f"💾 Saving data from {mac_address} | Focus: {focus_level*100:.0f}% | {mental_state}")
+            frames = list(iter_sample_frames(message))
+        except FrameError as e:
+            ws.send(json.dumps({"error": f"Invalid frame: {e}"}))
+            continue
+        
+        for frame in frames:
+            if mac_address != frame.mac_address:
+                mac_address = frame.mac_address
+                logger.info(f"🔗 Streaming ingest channel open for {mac_address}")
             
-            return jsonify({
-                "status": "ok",
-                "mac_address": mac_address,
-                "bands": band_powers,
-                "focus": focus_level,
-                "mental_state": mental_state,
-                "data_saved": True
-            }), 200
-            
-        except mysql.connector.Error as db_err:
-            db.rollback()
-            logger.error(f"Database error: {db_err}")
-            return jsonify({"status": "error", "msg": f"Database error"}), 500
-        finally:
-            cursor.close()
-            db.close()
+            try:
+                result, status_code = ingest_samples(frame.mac_address, frame.samples, frame.sequence)
+            except Exception as e:
+                logger.error(f"Stream ingest error for {frame.mac_address}: {e}")
+                result, status_code = {"msg": "Server error"}, 500
             
-    except Exception as e:
-        logger.error(f"Upload error: {e}")
-        return jsonify({"status": "error", "msg": "Server error"}), 500
+            if status_code != 200:
+                ack = {"seq": frame.sequence, "error": result.get("msg", "Server error")}
+            elif result.get("duplicate"):
+                ack = {"seq": frame.sequence, "duplicate": True}
+            else:
+                ack = {
+                    "seq": frame.sequence,
+                    "focus": round(result["focus"], 4),
+                    "state": result["mental_state"],
+                    "saved": result.get("data_saved", False)
+                }
+            ws.send(json.dumps(ack, separators=(",", ":")))
+
+if sock:
+    sock.route("/ws/ingest")(ingest_stream)
+else:
+    logger.warning("⚠️ flask-sock not installed - /ws/ingest streaming channel disabled")
+
 @app.route("/latest", methods=['GET'])
 def latest():
-    global DEVICE_STATUSES, EEG_BUFFERS
     try:
         # Get MAC address filter from query params (optional)
         mac_address = request.args.get('mac_address')
+        statuses = DEVICE_STATE.statuses()
         
         # If no specific MAC requested, get the most recent one
-        if not mac_address and DEVICE_STATUSES:
+        if not mac_address and statuses:
             # Get the MAC with most recent update
-            mac_address = max(DEVICE_STATUSES.keys(), 
-                            key=lambda k: DEVICE_STATUSES[k]["last_update"] or datetime.min)
+            mac_address = max(statuses.keys(), 
+                            key=lambda k: statuses[k]["last_update"] or datetime.min)
         
         # Get device status for this MAC
-        device_status = DEVICE_STATUSES.get(mac_address, {
+        device_status = statuses.get(mac_address, {
             "connected": False,
             "wearing": False,
             "signal_quality": "no_data",
@@ -1239,7 +1275,7 @@ def latest():
                 mental_state = get_mental_state(band_powers)
                 
                 # Get samples from buffer for this MAC
-                samples = list(EEG_BUFFERS.get(row_mac, [])[-100:]) if row_mac in EEG_BUFFERS else []
+                samples = DEVICE_STATE.last_samples(row_mac, 100).tolist()
                 
                 return jsonify({
                     "status": "ok",
@@ -1248,7 +1284,7 @@ def latest():
                     "bands": band_powers,
                     "focus": float(focus),
                     "mental_state": mental_state,
-                    "device_status": DEVICE_STATUSES.get(row_mac, device_status),
+                    "device_status": statuses.get(row_mac, device_status),
                     "timestamp": timestamp.isoformat(),
                     "signal_quality": signal_quality,
                     "samples": samples
@@ -1273,21 +1309,19 @@ def latest():
 
 @app.route("/status", methods=['GET'])
 def device_status():
-    global DEVICE_STATUSES, EEG_BUFFERS
-    
     # Get MAC address filter from query params (optional)
     mac_address = request.args.get('mac_address')
     
     if mac_address:
         # Return status for specific device
-        device_status = DEVICE_STATUSES.get(mac_address, {
+        device_status = DEVICE_STATE.get_status(mac_address) or ({
             "connected": False,
             "wearing": False,
             "signal_quality": "no_data",
             "error_message": "Device not found",
             "last_update": None
         })
-        buffer_size = len(EEG_BUFFERS.get(mac_address, []))
+        buffer_size = DEVICE_STATE.sample_count(mac_address)
         
         return jsonify({
             "status": "ok",
@@ -1299,23 +1333,22 @@ def device_status():
     else:
         # Return status for all connected devices
         all_statuses = {}
-        for mac, status in DEVICE_STATUSES.items():
+        for mac, status in DEVICE_STATE.statuses().items():
             all_statuses[mac] = {
                 "device_status": status,
-                "buffer_size": len(EEG_BUFFERS.get(mac, []))
+                "buffer_size": DEVICE_STATE.sample_count(mac)
             }
         
         return jsonify({
             "status": "ok",
             "devices": all_statuses,
-            "total_devices": len(DEVICE_STATUSES),
+            "total_devices": len(all_statuses),
             "server_time": datetime.now().isoformat()
         })
 
 @app.route("/devices", methods=['GET'])
 def get_connected_devices():
     """Get list of currently connected devices"""
-    global DEVICE_STATUSES
     try:
         db = get_db_connection()
         if db:
@@ -1345,17 +1378,18 @@ def get_connected_devices():
             # Build connected students list
             connected_students = []
             current_time = datetime.now()
+            live_statuses = DEVICE_STATE.statuses()
             
             for student in all_students:
                 mac = student['device_mac']
                 
                 # Check if device has sent data recently (either in memory or in database)
-                in_memory = mac in DEVICE_STATUSES
+                in_memory = mac in live_statuses
                 in_database = mac in recent_macs
                 
                 # Priority 1: Check memory (most recent)
                 if in_memory:
-                    device_status = DEVICE_STATUSES[mac]
+                    device_status = live_statuses[mac]
                     if device_status.get('connected') and device_status.get('last_update'):
                         time_diff = (current_time - device_status['last_update']).total_seconds()
                         
@@ -1412,7 +1446,7 @@ def index():
 def get_performance_metrics(mac_address):
     """Get performance metrics for a student"""
     try:
-        metrics = calculate_performance_metrics(mac_address)
+        metrics = AnalyticsContext(mac_address).performance_metrics()
         return jsonify({"status": "ok", "metrics": metrics})
     except Exception as e:
         logger.error(f"Performance metrics error: {e}")
@@ -1463,18 +1497,28 @@ def get_student_data(mac_address):
 
 
 @app.route("/analytics/<mac_address>", methods=['GET'])
+@cached_response(mac_scope, ANALYTICS_CACHE_SECONDS)
 def get_student_analytics(mac_address):
     """Get comprehensive analytics for a student"""
     try:
         # Get time window from query params (default 60 minutes)
         time_window = request.args.get('time_window', 60, type=int)
-        
-        # Calculate all analytics
-        attention_periods = calculate_attention_periods(mac_address, time_window)
-        session_stats = calculate_session_stats(mac_address, time_window)
-        recommendation = generate_recommendation(mac_address)
-        performance_metrics = calculate_performance_metrics(mac_address, time_window)
-        wave_timeline = get_wave_timeline_data(mac_address, min(30, time_window))
+        # Points per wave timeline series (longer timelines are min/max downsampled)
+        max_points = request.args.get('max_points', TIMELINE_MAX_POINTS, type=int)
+        if max_points < TIMELINE_MIN_POINTS:
+            return jsonify({"status": "error", "msg": f"max_points must be at least {TIMELINE_MIN_POINTS}"}), 400
+        # format=columnar: wave timeline as base64 typed arrays instead of per-point lists
+        encode_timeline = encode_columnar if request.args.get('format') == 'columnar' else format_timeline
+        
+        # Calculate all analytics from one load of the student's window
+        context = AnalyticsContext(mac_address, max(time_window, RECOMMENDATION_WINDOW_MINUTES),
+                                   tracked=DEVICE_STATE.attention_periods(mac_address))
+        attention_periods = context.attention_periods(time_window)
+        session_stats = context.session_stats(time_window)
+        recommendation = context.recommendation()
+        performance_metrics = context.performance_metrics(time_window)
+        timeline = context.timeline_data(min(30, time_window), max_points)
+        wave_timeline = encode_timeline(timeline) if timeline else None
         
         return jsonify({
             "status": "ok",
@@ -1494,11 +1538,15 @@ def get_student_analytics(mac_address):
 
 
 @app.route("/analytics/<mac_address>/periods", methods=['GET'])
+@cached_response(mac_scope, ANALYTICS_CACHE_SECONDS)
 def get_attention_periods(mac_address):
     """Get attention periods only"""
     try:
         time_window = request.args.get('time_window', 60, type=int)
-        periods = calculate_attention_periods(mac_address, time_window)
+        # Served from the ingest-side tracker when it covers the window
+        periods = AnalyticsContext(
+            mac_address, time_window, tracked=DEVICE_STATE.attention_periods(mac_address)
+        ).attention_periods()
         
         return jsonify({
             "status": "ok",
@@ -1511,11 +1559,14 @@ def get_attention_periods(mac_address):
 
 
 @app.route("/analytics/<mac_address>/stats", methods=['GET'])
+@cached_response(mac_scope, ANALYTICS_CACHE_SECONDS)
 def get_session_stats(mac_address):
     """Get session statistics only"""
     try:
         time_window = request.args.get('time_window', 60, type=int)
-        stats = calculate_session_stats(mac_address, time_window)
+        stats = AnalyticsContext(
+            mac_address, time_window, tracked=DEVICE_STATE.attention_periods(mac_address)
+        ).session_stats()
         
         return jsonify({
             "status": "ok",
@@ -1528,11 +1579,12 @@ def get_session_stats(mac_address):
 
 
 @app.route("/analytics/<mac_address>/metrics", methods=['GET'])
+@cached_response(mac_scope, ANALYTICS_CACHE_SECONDS)
 def get_analytics_metrics(mac_address):
     """Get analytics metrics only"""
     try:
         time_window = request.args.get('time_window', 60, type=int)
-        metrics = calculate_performance_metrics(mac_address, time_window)
+        metrics = AnalyticsContext(mac_address, time_window).performance_metrics()
         
         return jsonify({
             "status": "ok",
@@ -1545,17 +1597,24 @@ def get_analytics_metrics(mac_address):
 
 
 @app.route("/analytics/<mac_address>/timeline", methods=['GET'])
+@cached_response(mac_scope, ANALYTICS_CACHE_SECONDS)
 def get_wave_timeline(mac_address):
     """Get brain wave timeline for charting"""
     try:
         time_window = request.args.get('time_window', 30, type=int)
-        timeline = get_wave_timeline_data(mac_address, time_window)
+        max_points = request.args.get('max_points', TIMELINE_MAX_POINTS, type=int)
+        if max_points < TIMELINE_MIN_POINTS:
+            return jsonify({"status": "error", "msg": f"max_points must be at least {TIMELINE_MIN_POINTS}"}), 400
+        timeline = AnalyticsContext(mac_address, time_window).timeline_data(time_window, max_points)
         
         if timeline:
+            if wants_binary(request.accept_mimetypes):
+                return Response(encode_binary(timeline), mimetype=TIMELINE_MIMETYPE)
+            encode_timeline = encode_columnar if request.args.get('format') == 'columnar' else format_timeline
             return jsonify({
                 "status": "ok",
                 "mac_address": mac_address,
-                "timeline": timeline
+                "timeline": encode_timeline(timeline)
             }), 200
         else:
             return jsonify({
@@ -1569,31 +1628,92 @@ def get_wave_timeline(mac_address):
         return jsonify({"status": "error", "msg": str(e)}), 500
 
 
+def is_device_live(device_status, current_time):
+    """
+    Device is disconnected if:
+    1. Never received data (last_update is None)
+    2. No data received in last 10 seconds
+    3. Signal quality is connection_error
+    4. Not marked as connected
+    """
+    last_update = device_status.get('last_update')
+    return not (
+        last_update is None or 
+        (current_time - last_update).total_seconds() > 10 or
+        device_status.get('signal_quality') == 'connection_error' or
+        not device_status.get('connected', False)
+    )
+
+
+# Devices already looked up by backfill_live_snapshot in this process
+SNAPSHOT_BACKFILL_MINUTES = 2
+_backfill_attempted = set()
+
+def backfill_live_snapshot(mac_addresses):
+    """
+    Cold start: publish the newest stored reading for live devices that have no result in
+    DEVICE_STATE yet (e.g. just after a restart), with one windowed query for all of them
+    """
+    pending = [mac for mac in mac_addresses if mac not in _backfill_attempted]
+    if not pending:
+        return
+    _backfill_attempted.update(pending)
+    
+    db = get_db_connection()
+    if not db:
+        return
+    cursor = db.cursor(dictionary=True)
+    placeholders = ", ".join(["%s"] * len(pending))
+    cursor.execute(f"""
+        SELECT e.mac_address, e.delta, e.theta, e.alpha, e.beta, e.gamma, e.focus
+        FROM eeg_data e
+        JOIN (
+            SELECT mac_address, MAX(id) AS id
+            FROM eeg_data
+            WHERE mac_address IN ({placeholders})
+              AND timestamp > DATE_SUB(NOW(), INTERVAL {SNAPSHOT_BACKFILL_MINUTES} MINUTE)
+            GROUP BY mac_address
+        ) latest ON latest.id = e.id
+    """, tuple(pending))
+    rows = cursor.fetchall()
+    cursor.close()
+    db.close()
+    
+    for row in rows:
+        band_powers = {band: float(row[band]) for band in EEG_BANDS}
+        DEVICE_STATE.publish(row['mac_address'], band_powers, float(row['focus']), get_mental_state(band_powers))
+    logger.info(f"📥 Live snapshot backfilled for {len(rows)}/{len(pending)} device(s)")
+
+
 @app.route("/api/students-list", methods=['GET'])
 def get_students_list():
     """
     Get real-time list of all students with their latest EEG data and connection status
-    This API is called by the dashboard for live updates
+    This API is called by the dashboard for live updates. Served from the cached roster
+    and the live device snapshot that ingest maintains - no per-student queries.
     """
     try:
-        db = get_db_connection()
-        if not db:
+        # All students (cached; reloaded when a student is added)
+        students = get_student_roster()
+        if students is None:
             return jsonify({"status": "error", "msg": "Database connection failed"}), 500
         
-        cursor = db.cursor(dictionary=True)
-        
-        # Get all students
-        cursor.execute("SELECT id, name, device_mac FROM students ORDER BY name")
-        students = cursor.fetchall()
-        
         students_data = []
         current_time = datetime.now()
+        snapshots = DEVICE_STATE.snapshots()
+        
+        # Live devices without a result yet (only right after a restart)
+        missing = [mac for mac, snapshot in snapshots.items()
+                   if snapshot['mental_state'] is None and is_device_live(snapshot, current_time)]
+        if missing:
+            backfill_live_snapshot(missing)
+            snapshots = DEVICE_STATE.snapshots()
         
         for student in students:
             mac = student['device_mac']
             
             # Check device status in memory (real-time connection tracking)
-            device_status = DEVICE_STATUSES.get(mac)
+            device_status = snapshots.get(mac)
             
             # If no status in memory, device never connected
             if device_status is None:
@@ -1617,19 +1737,7 @@ def get_students_list():
             
             last_update = device_status.get('last_update')
             
-            # Device is disconnected if:
-            # 1. Never received data (last_update is None)
-            # 2. No data received in last 10 seconds
-            # 3. Signal quality is connection_error
-            # 4. Not marked as connected
-            is_disconnected = (
-                last_update is None or 
-                (current_time - last_update).total_seconds() > 10 or
-                device_status.get('signal_quality') == 'connection_error' or
-                not device_status.get('connected', False)
-            )
-            
-            if is_disconnected:
+            if not is_device_live(device_status, current_time):
                 # Device disconnected - show as offline
                 students_data.append({
                     "id": student['id'],
@@ -1649,49 +1757,27 @@ def get_students_list():
                 })
                 continue
             
-            # Device is connected - get latest EEG data
-            cursor.execute("""
-                SELECT timestamp, delta, theta, alpha, beta, gamma, focus, signal_quality
-                FROM eeg_data 
-                WHERE student_id = %s
-                ORDER BY timestamp DESC
-                LIMIT 1
-            """, (student['id'],))
-            
-            latest_data = cursor.fetchone()
-            
-            if latest_data:
-                # Determine mental state from band powers
-                band_powers = {
-                    'delta': latest_data['delta'],
-                    'theta': latest_data['theta'],
-                    'alpha': latest_data['alpha'],
-                    'beta': latest_data['beta'],
-                    'gamma': latest_data['gamma']
-                }
-                
-                # Get mental state using same logic as backend
-                mental_state = get_mental_state(band_powers)
-                focus_level = latest_data['focus']
-                
+            # Device is connected - latest reading published by ingest
+            band_powers = device_status['bands']
+            if band_powers is not None:
                 students_data.append({
                     "id": student['id'],
                     "name": student['name'],
                     "mac_address": mac,
-                    "state": mental_state,
-                    "focus": round(focus_level * 100, 1),
-                    "delta": round(latest_data['delta'], 2),
-                    "theta": round(latest_data['theta'], 2),
-                    "alpha": round(latest_data['alpha'], 2),
-                    "beta": round(latest_data['beta'], 2),
-                    "gamma": round(latest_data['gamma'], 2),
+                    "state": device_status['mental_state'],
+                    "focus": round(device_status['focus'] * 100, 1),
+                    "delta": round(band_powers['delta'], 2),
+                    "theta": round(band_powers['theta'], 2),
+                    "alpha": round(band_powers['alpha'], 2),
+                    "beta": round(band_powers['beta'], 2),
+                    "gamma": round(band_powers['gamma'], 2),
                     "connected": True,
                     "wearing": device_status.get('wearing', True),
-                    "signal_quality": latest_data['signal_quality'],
-                    "last_update": latest_data['timestamp'].strftime("%H:%M:%S")
+                    "signal_quality": device_status['signal_quality'],
+                    "last_update": last_update.strftime("%H:%M:%S")
                 })
             else:
-                # No data in database yet - show as monitoring
+                # No reading yet - show as monitoring
                 students_data.append({
                     "id": student['id'],
                     "name": student['name'],
@@ -1709,9 +1795,6 @@ def get_students_list():
                     "last_update": "Just connected"
                 })
         
-        cursor.close()
-        db.close()
-        
         return jsonify({
             "status": "success",
             "students": students_data,
@@ -1731,7 +1814,7 @@ def get_all_device_status():
         current_time = datetime.now()
         device_statuses = {}
         
-        for mac, status in DEVICE_STATUSES.items():
+        for mac, status in DEVICE_STATE.statuses().items():
             last_update = status.get('last_update')
             is_active = False
             
@@ -1762,7 +1845,7 @@ def get_all_device_status():
 def get_device_status(mac_address):
     """Get real-time status of a specific device"""
     try:
-        status = DEVICE_STATUSES.get(mac_address, {})
+        status = DEVICE_STATE.get_status(mac_address) or {}
         last_update = status.get('last_update')
         
         is_active = False
@@ -1785,6 +1868,112 @@ def get_device_status(mac_address):
         return jsonify({"status": "error", "msg": str(e)}), 500
 
 
+def live_device_event(mac_address, snapshot, current_time):
+    """SSE payload for one device (same disconnect rules as /api/students-list)"""
+    last_update = snapshot.get('last_update')
+    connected = is_device_live(snapshot, current_time)
+    return {
+        "mac_address": mac_address,
+        "connected": connected,
+        "wearing": snapshot.get('wearing', False) if connected else False,
+        "signal_quality": snapshot.get('signal_quality') if connected else "offline",
+        "mental_state": (snapshot.get('mental_state') or "monitoring") if connected else "disconnected",
+        "focus": snapshot.get('focus') or 0,
+        "bands": snapshot.get('bands') or {band: 0 for band in EEG_BANDS},
+        "last_update": last_update.strftime("%H:%M:%S") if last_update else None
+    }
+
+
+@app.route("/api/stream", methods=['GET'])
+def stream_live_updates():
+    """
+    Server-Sent Events stream of device state, focus and band powers as uploads are processed
+    The first events are a snapshot of every device; reconnecting with Last-Event-ID
+    (EventSource does this itself) or ?last_event_id= only sends what changed since.
+    Optional ?mac_address= limits the stream to one device.
+    """
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({"status": "error", "msg": "Too many live streams - use polling"}), 503
+    
+    try:
+        mac_address = request.args.get('mac_address')
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            start_version = int(last_event_id) if last_event_id else 0
+        except ValueError:
+            start_version = 0
+        if start_version > DEVICE_STATE.current_version():
+            start_version = 0  # the counter restarted with the server - resend everything
+        
+        def generate(cursor):
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+            last_write = time.monotonic()
+            while time.monotonic() < deadline:
+                if DEVICE_STATE.current_version() > cursor:
+                    cursor, changes = DEVICE_STATE.changes_since(cursor, mac_address)
+                    current_time = datetime.now()
+                    for version, mac, snapshot in changes:
+                        event = live_device_event(mac, snapshot, current_time)
+                        yield f"id: {version}\nevent: device\ndata: {json.dumps(event)}\n\n"
+                        last_write = time.monotonic()
+                if time.monotonic() - last_write >= SSE_HEARTBEAT_SECONDS:
+                    # Carries the cursor so a resume skips changes to other devices
+                    yield f"id: {cursor}\n: heartbeat\n\n"
+                    last_write = time.monotonic()
+                time.sleep(SSE_POLL_SECONDS)
+        
+        response = Response(generate(start_version), mimetype="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # don't let a reverse proxy buffer the stream
+        })
+        # Released when the server closes the response (client gone or stream finished)
+        response.call_on_close(_sse_slots.release)
+        return response
+    except Exception as e:
+        _sse_slots.release()
+        logger.error(f"Live stream error: {e}")
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
+@app.route("/api/metrics", methods=['GET'])
+def get_ingest_metrics():
+    """Internal pipeline metrics (write-behind queue, inference batching, DSP shards, response cache)"""
+    try:
+        return jsonify({
+            "status": "ok",
+            "write_behind": persistence_writer.stats(),
+            "inference": dict(INFERENCE_BATCHER.stats(), model_loaded=ML_MODEL is not None),
+            "dsp_engine": DSP_ENGINE.stats() if DSP_ENGINE is not None else {"shards": 0},
+            "response_cache": response_cache.stats(),
+            "ingest_channels": dict(_ws_open, max=WS_MAX_CHANNELS),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }), 200
+    except Exception as e:
+        logger.error(f"Metrics error: {e}")
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
+@app.route("/ready", methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once this worker has run its startup hooks (model, warm-up, background tasks)"""
+    try:
+        state = lifecycle.readiness()
+        state["model_loaded"] = ML_MODEL is not None
+        state["status"] = "ok" if state["ready"] else "starting"
+        return jsonify(state), 200 if state["ready"] else 503
+    except Exception as e:
+        logger.error(f"Readiness check error: {e}")
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
+@app.before_request
+def ensure_worker_started():
+    """Fallback when the server didn't call lifecycle hooks (e.g. started without gunicorn.conf.py)"""
+    if not lifecycle.worker_started():
+        lifecycle.run_worker_start()
+
+
 def cleanup_stale_connections():
     """
     Background task to clean up stale device connections
@@ -1802,7 +1991,7 @@ def cleanup_stale_connections():
                 stale_devices = []
                 
                 # Check all devices for stale connections
-                for mac, status in list(DEVICE_STATUSES.items()):
+                for mac, status in DEVICE_STATE.statuses().items():
                     last_update = status.get('last_update')
                     if last_update:
                         seconds_since = (current_time - last_update).total_seconds()
@@ -1811,11 +2000,9 @@ def cleanup_stale_connections():
                 
                 # Mark stale devices as disconnected (don't delete completely)
                 for mac in stale_devices:
-                    if mac in DEVICE_STATUSES:  # Safety check
-                        logger.info(f"🧹 Cleaning up stale connection: {mac}")
-                        DEVICE_STATUSES[mac]['connected'] = False
-                        DEVICE_STATUSES[mac]['wearing'] = False
-                        DEVICE_STATUSES[mac]['signal_quality'] = 'timeout'
+                    logger.info(f"🧹 Cleaning up stale connection: {mac}")
+                    DEVICE_STATE.update_status(mac, connected=False, wearing=False, signal_quality='timeout')
+                    DEVICE_STATE.publish(mac)  # push the disconnect to live dashboards
                     
             except Exception as e:
                 logger.error(f"Cleanup error: {e}")
@@ -1826,26 +2013,108 @@ def cleanup_stale_connections():
     logger.info("🧹 Started connection cleanup background task")
 
 
+def start_schema_catchups():
+    """
+    Background task that re-applies backfills to the readings the previous release stored
+    after them (see migrations.py); ends once no catch-up is scheduled
+    """
+    import threading
+    import time
+
+    def catchup_worker():
+        while True:
+            time.sleep(60)
+            try:
+                db = get_db_connection()
+                try:
+                    remaining = run_due_catchups(db)
+                finally:
+                    db.close()
+                if not remaining:
+                    return
+            except Exception as e:
+                logger.error(f"❌ Schema catch-up error: {e}")
+
+    threading.Thread(target=catchup_worker, name="schema-catchups", daemon=True).start()
+
+
 # Register route modules with access to hybrid prediction functions
-register_students_routes(app, None, predict_state_hybrid, extract_ml_features)
+register_students_routes(app, DEVICE_STATE, predict_state_hybrid, extract_ml_features)
 register_session_routes(app)
 
+
+# ----- Lifecycle Hooks (run by gunicorn.conf.py, or by __main__ below) -----
+@lifecycle.on_preload
+def preload_ml_model():
+    """Load the model before fork so all workers share it copy-on-write"""
+    if ML_MODEL is None and not load_ml_model():
+        raise RuntimeError("ML model not loaded - using formula-based prediction only")
+    return type(ML_MODEL).__name__
+
+
+@lifecycle.on_preload
+def start_dsp_engine():
+    """Fork the DSP shards after the model is loaded (they inherit it) and before any thread starts"""
+    if DSP_ENGINE is None:
+        return "disabled"
+    if not isinstance(DEVICE_STATE, SharedMemoryDeviceState):
+        raise RuntimeError("DSP shards need shared device state - processing in the web workers")
+    DSP_ENGINE.start()
+    return {"shards": DSP_ENGINE.n_shards}
+
+
+@lifecycle.on_worker_start(required=True)
+def check_database_schema():
+    # Per worker: the MySQL connection pool must not be created before fork. Migrations
+    # run once per deploy (release step), never here: /ready stays 503 until they have.
+    return init_database()
+
+
+@lifecycle.on_worker_start
+def start_background_tasks():
+    cleanup_stale_connections()
+    start_schema_catchups()
+    persistence_writer.start()
+    if INFERENCE_BATCHER.enabled:
+        INFERENCE_BATCHER.start()
+
+
+@lifecycle.on_worker_start
+def warm_up_pipeline():
+    """Push one synthetic window through DSP + prediction so the first real upload isn't slow"""
+    t = np.arange(BUFFER_SIZE) / SAMPLE_RATE
+    raw_window = 2048 + 400 * np.sin(2 * np.pi * 10 * t) + 150 * np.sin(2 * np.pi * 20 * t)
+    signal = StreamingFilter(SAMPLE_RATE).process((raw_window - 2048) / 2048.0)
+    band_powers = compute_band_power(signal)
+    focus_level = calculate_focus(band_powers)
+    state = predict_state_hybrid(band_powers, focus_level, raw_window)
+    return {"state": state, "ml": ML_MODEL is not None}
+
+
+@lifecycle.on_shutdown
+def flush_pending_writes():
+    persistence_writer.stop()
+
 if __name__ == "__main__":
     logger.info("🚀 Starting Enhanced EEG Monitor Server with HYBRID Prediction (Formula + ML)")
     
-    # Initialize database
-    init_database()
-    
-    # Load ML model for hybrid prediction
-    ml_loaded = load_ml_model()
-    if ml_loaded:
+    # No worker boot timeout here, so migrate in-process (gunicorn deploys run `python migrations.py`)
+    try:
+        db = get_db_connection()
+        try:
+            apply_migrations(db)
+        finally:
+            db.close()
+    except Exception as e:
+        logger.error(f"❌ Schema migration failed: {e}")
+
+    # Same hooks gunicorn runs: load the ML model, check the schema, start background tasks, warm up
+    lifecycle.run_worker_start()
+    if ML_MODEL is not None:
         logger.info("✅ ML Model loaded - Using HYBRID prediction (Formula + ML)")
     else:
         logger.warning("⚠️  ML Model not loaded - Using Formula-based prediction only")
     
-    # Start background cleanup task for stale connections
-    cleanup_stale_connections()
-    
     logger.info("🌐 Server ready to accept connections from multiple devices")
     logger.info("📊 Prediction Method: HYBRID (NASA Engagement Index + XGBoost/LightGBM/CatBoost)")
     logger.info("🔄 Auto-cleanup enabled for disconnected devices (30s timeout)")
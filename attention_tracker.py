@@ -0,0 +1,173 @@
+"""
+Attention Tracker Module
+Incremental attention-period detection, one state machine per device, fed at ingest
+
+A period is a run of focused readings (focus >= FOCUS_THRESHOLD) with no more than
+MAX_PERIOD_GAP seconds between consecutive readings; it counts once it has
+MIN_PERIOD_POINTS readings. These are the rules analytics.compute_attention_periods
+applies to stored eeg_data, applied here one reading at a time: the tracker keeps the
+open period's bounds and running focus / beta / gamma sums, and moves it to a ring of
+the last CLOSED_PERIODS closed periods when a reading ends it.
+
+The state is plain float arrays so the shared-memory device store can keep it in a
+device slot (every gunicorn worker updates the same tracker) and the local store in
+ordinary arrays:
+
+    state    f8[STATE_SIZE]  tracked-since, newest evicted period end, open period
+                             (start, end, readings, focus / beta / gamma sums)
+    periods  f8[CLOSED_PERIODS, 6]  closed periods, same six fields
+    ring     i8[2]           [head, size] of periods
+
+Times are epoch seconds. Closed periods are also written to the attention_periods
+table by the write-behind writer (see period_rows).
+"""
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FOCUS_THRESHOLD = 0.6     # Minimum focus level to count as "focused"
+MAX_PERIOD_GAP = 10       # seconds between readings that still continue a period
+MIN_PERIOD_POINTS = 3     # readings a period needs to count
+
+CLOSED_PERIODS = 64       # closed periods kept per device
+
+STATE_SIZE = 8
+_SINCE, _EVICTED, _START, _END, _COUNT, _FOCUS, _BETA, _GAMMA = range(STATE_SIZE)
+PERIOD_FIELDS = ("start", "end", "readings", "focus_sum", "beta_sum", "gamma_sum")
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS attention_periods (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    mac_address VARCHAR(50) NOT NULL,
+    student_id INT,
+    monitoring_session_id INT,
+    start_time DATETIME NOT NULL,
+    end_time DATETIME NOT NULL,
+    readings INT NOT NULL,
+    focus_sum DOUBLE NOT NULL,
+    beta_sum DOUBLE NOT NULL,
+    gamma_sum DOUBLE NOT NULL,
+    quality_score INT NOT NULL,
+    INDEX idx_mac_end (mac_address, end_time),
+    INDEX idx_session (monitoring_session_id)
+)
+"""
+
+INSERT = """
+    INSERT INTO attention_periods (
+        mac_address, student_id, monitoring_session_id, start_time, end_time,
+        readings, focus_sum, beta_sum, gamma_sum, quality_score
+    )
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def new_state(since):
+    """Empty tracker state, complete for every reading from `since` (epoch seconds) on"""
+    state = np.zeros(STATE_SIZE)
+    state[_SINCE] = since
+    state[_EVICTED] = -np.inf
+    return state
+
+
+def quality_score(period):
+    """Weighted average of focus (60%), beta (25%), gamma (15%) over the period's readings"""
+    readings = period["readings"]
+    return int(period["focus_sum"] / readings * 60 + period["beta_sum"] / readings * 25 +
+               period["gamma_sum"] / readings * 15)
+
+
+class AttentionTracker:
+    """View over one device's tracker arrays (the caller holds the device's lock)"""
+
+    def __init__(self, state, periods, ring):
+        self.state = state
+        self.periods = periods
+        self.ring = ring
+
+    @classmethod
+    def create(cls, since):
+        return cls(new_state(since), np.zeros((CLOSED_PERIODS, len(PERIOD_FIELDS))), np.zeros(2, dtype=np.int64))
+
+    def update(self, timestamp, focus, beta, gamma):
+        """
+        Feed one reading (timestamp in epoch seconds)
+        Returns the period this reading closed, as a dict, or None
+        """
+        state = self.state
+        if focus >= FOCUS_THRESHOLD:
+            if state[_COUNT] and timestamp - state[_END] <= MAX_PERIOD_GAP:
+                state[_END] = max(state[_END], timestamp)  # concurrent uploads may land out of order
+                state[_COUNT] += 1
+                state[_FOCUS] += focus
+                state[_BETA] += beta
+                state[_GAMMA] += gamma
+                return None
+            closed = self._close()
+            state[_START:] = (timestamp, timestamp, 1, focus, beta, gamma)
+        else:
+            closed = self._close()
+        return closed
+
+    def _close(self):
+        """End the open period; keep it (and return it) if it has enough readings"""
+        state = self.state
+        if state[_COUNT] < MIN_PERIOD_POINTS:
+            state[_COUNT] = 0
+            return None
+        period = state[_START:].copy()
+        state[_COUNT] = 0
+
+        head, size = int(self.ring[0]), int(self.ring[1])
+        if size == CLOSED_PERIODS:
+            # Oldest period leaves memory: windows reaching back past it aren't complete any more
+            state[_EVICTED] = self.periods[head][1]
+            head = (head + 1) % CLOSED_PERIODS
+            size -= 1
+        self.periods[(head + size) % CLOSED_PERIODS] = period
+        self.ring[:] = (head, size + 1)
+        return self._as_dict(period)
+
+    @staticmethod
+    def _as_dict(period, active=False):
+        return {
+            "start": datetime.fromtimestamp(period[0]),
+            "end": datetime.fromtimestamp(period[1]),
+            "readings": int(period[2]),
+            "focus_sum": float(period[3]),
+            "beta_sum": float(period[4]),
+            "gamma_sum": float(period[5]),
+            "active": active
+        }
+
+    def snapshot(self):
+        """
+        (tracked_since, evicted_until, periods): the time from which the tracker has seen
+        every reading, the end of the newest period dropped from the ring (None if none)
+        and the periods oldest first - closed ones, then the open one once it counts
+        """
+        state = self.state
+        head, size = int(self.ring[0]), int(self.ring[1])
+        periods = [self._as_dict(self.periods[(head + i) % CLOSED_PERIODS]) for i in range(size)]
+        if state[_COUNT] >= MIN_PERIOD_POINTS:
+            periods.append(self._as_dict(state[_START:], active=True))
+        evicted = float(state[_EVICTED])
+        return (datetime.fromtimestamp(state[_SINCE]),
+                None if np.isinf(evicted) else datetime.fromtimestamp(evicted),
+                periods)
+
+
+def period_rows(readings, student_ids):
+    """INSERT parameter tuples for the periods closed by a batch of write-behind Readings"""
+    rows = []
+    for r in readings:
+        p = r.attention_period
+        if p is not None:
+            rows.append((
+                r.mac_address, student_ids.get(r.mac_address), r.session_id, p["start"], p["end"],
+                p["readings"], p["focus_sum"], p["beta_sum"], p["gamma_sum"], quality_score(p)
+            ))
+    return rows
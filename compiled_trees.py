@@ -0,0 +1,642 @@
+"""
+Compiled Tree Module
+Flattens the trained tree ensemble into NumPy arrays and evaluates it without the ML libraries
+
+export_model() walks the loaded estimator (Pipeline -> StandardScaler -> XGBoost,
+LightGBM, CatBoost or scikit-learn trees, or a soft VotingClassifier over them) and
+copies every tree into flat arrays: split feature, threshold, left/right child,
+missing-value direction and leaf values. CompiledTreeModel then evaluates all trees of
+an ensemble together with NumPy fancy indexing, one step per tree level, and applies
+the same link function (softmax / sigmoid / forest average) as the library.
+
+Only the export needs xgboost / lightgbm / catboost. Loading the .npz and predicting
+imports NumPy alone, and np.load runs with allow_pickle=False.
+
+Tolerance: predict_proba of the compiled model matches the original estimator to
+PROBA_TOLERANCE (max abs difference per probability). Splits are decided exactly as
+the libraries do (float32 inputs for XGBoost / CatBoost / scikit-learn, float64 for
+LightGBM), so the only differences are float summation order of the leaf values,
+in practice around 1e-7. Every export is verified against the source model before
+it is written.
+
+Usage:
+    python compiled_trees.py optimized_eeg_model_78.joblib
+    python compiled_trees.py model.joblib --output model.trees.npz --rows 5000
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 1
+PROBA_TOLERANCE = 1e-5
+
+# LightGBM missing_type per split node; XGBoost / CatBoost / scikit-learn use MISSING_NAN
+MISSING_NAN = 0    # NaN follows default_left
+MISSING_NONE = 1   # NaN is treated as 0.0 before the comparison
+MISSING_ZERO = 2   # NaN and |x| <= 1e-35 follow default_left
+_ZERO_THRESHOLD = 1e-35
+
+SCALER_TYPES = ("StandardScaler",)
+FOREST_TYPES = ("DecisionTreeClassifier", "RandomForestClassifier", "ExtraTreesClassifier")
+
+
+class ExportError(ValueError):
+    """The estimator (or part of it) can't be represented by the compiled evaluator"""
+
+
+# ----- Evaluator -----
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores
+
+
+def _apply_link(scores, link, n_trees):
+    if link == "softmax":
+        return _softmax(scores)
+    if link == "sigmoid":
+        positive = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+        return np.column_stack([1.0 - positive, positive])
+    if link == "mean":
+        return scores / n_trees
+    raise ExportError(f"Unknown link function: {link}")
+
+
+class _Ensemble:
+    """Trees of one estimator plus the link that turns their summed leaves into probabilities"""
+
+    kind = None
+    array_names = ()
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.arrays = arrays
+        self.input_dtype = np.dtype(meta["input_dtype"])
+        self.n_trees = len(arrays["tree_output"])
+        self.n_outputs = meta["n_outputs"]
+        self.weight = meta.get("weight", 1.0)
+
+        # Column each tree adds into; trees with a full-width leaf vector add into all columns
+        value = arrays["value"]
+        if value.shape[1] == self.n_outputs:
+            self._output_matrix = None
+        else:
+            self._output_matrix = np.zeros((self.n_trees, self.n_outputs))
+            self._output_matrix[np.arange(self.n_trees), arrays["tree_output"]] = 1.0
+
+    def leaves(self, X):
+        raise NotImplementedError
+
+    def predict_proba(self, X):
+        X = np.asarray(X).astype(self.input_dtype, copy=False)
+        contributions = self.arrays["value"][self.leaves(X)]  # (rows, trees, width)
+        if self._output_matrix is None:
+            scores = contributions.sum(axis=1)
+        else:
+            scores = contributions[..., 0] @ self._output_matrix
+        scores = scores * self.meta.get("scale", 1.0) + self.arrays["base"]
+        return _apply_link(scores, self.meta["link"], self.n_trees)
+
+
+class NodeEnsemble(_Ensemble):
+    """
+    Binary trees stored as one node table (XGBoost, LightGBM, scikit-learn)
+
+    Leaves point to themselves, so every row walks max_depth steps without branching
+    on whether it has already reached a leaf.
+    """
+
+    kind = "nodes"
+    array_names = ("feature", "threshold", "left", "right", "default_left", "missing",
+                   "value", "roots", "tree_output", "base")
+
+    def __init__(self, meta, arrays):
+        super().__init__(meta, arrays)
+        self._strict = meta["compare"] == "lt"
+        missing = arrays["missing"]
+        self._has_none = bool(np.any(missing == MISSING_NONE))
+        self._has_zero = bool(np.any(missing == MISSING_ZERO))
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self._children = np.column_stack([arrays["left"], arrays["right"]]).astype(np.intp).ravel()
+        self._feature = arrays["feature"].astype(np.intp)
+
+    def leaves(self, X):
+        a = self.arrays
+        n_rows, n_features = X.shape
+        # Comparisons run in float64: exact for float32 inputs and float32 split values
+        flat = np.ascontiguousarray(X, dtype=np.float64).ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        nodes = np.repeat(a["roots"].astype(np.intp)[None, :], n_rows, axis=0)
+        has_nan = bool(np.isnan(flat).any())
+
+        for _ in range(self.meta["max_depth"]):
+            values = flat.take(self._feature.take(nodes) + row_offsets)
+            thresholds = a["threshold"].take(nodes)
+            if has_nan and self._has_none:
+                values = np.where(np.isnan(values) & (a["missing"].take(nodes) == MISSING_NONE), 0.0, values)
+            go_right = ~(values < thresholds) if self._strict else ~(values <= thresholds)
+
+            if has_nan or self._has_zero:
+                kind = a["missing"].take(nodes)
+                is_nan = np.isnan(values)
+                use_default = (is_nan & (kind == MISSING_NAN)) | (
+                    (kind == MISSING_ZERO) & (is_nan | (np.abs(values) <= _ZERO_THRESHOLD))
+                )
+                go_right = np.where(use_default, ~a["default_left"].take(nodes), go_right)
+
+            nodes = self._children.take(2 * nodes + go_right)
+        return nodes
+
+
+class ObliviousEnsemble(_Ensemble):
+    """
+    Symmetric trees (CatBoost): each level uses one split for the whole tree
+
+    All splits of all trees are evaluated in one comparison; the leaf index of a tree
+    is the sum of its split bits weighted by powers of two.
+    """
+
+    kind = "oblivious"
+    array_names = ("split_feature", "split_border", "split_nan_true", "split_weight",
+                   "split_offsets", "leaf_offsets", "value", "tree_output", "base")
+
+    def leaves(self, X):
+        a = self.arrays
+        values = X[:, a["split_feature"]]
+        bits = values > a["split_border"]
+        nan = np.isnan(values)
+        if nan.any():
+            bits = np.where(nan, a["split_nan_true"], bits)
+        # One trailing zero column keeps reduceat valid for depth-0 trees at the end
+        weighted = np.zeros((X.shape[0], bits.shape[1] + 1), dtype=np.int64)
+        weighted[:, :-1] = bits * a["split_weight"]
+        offsets = a["split_offsets"]
+        index = np.add.reduceat(weighted, offsets, axis=1)[:, :self.n_trees]
+        # reduceat returns the element itself for empty segments (depth-0 trees)
+        index[:, offsets[:-1] == offsets[1:]] = 0
+        return a["leaf_offsets"] + index
+
+
+ENSEMBLE_TYPES = {cls.kind: cls for cls in (NodeEnsemble, ObliviousEnsemble)}
+
+
+class CompiledTreeModel:
+    """
+    NumPy-only stand-in for the trained classifier
+
+    Exposes classes_, predict_proba() and predict() like the scikit-learn estimator it
+    was exported from, so InferenceBatcher and predict_state_hybrid use it unchanged.
+    """
+
+    def __init__(self, classes, n_features, ensembles, mean=None, scale=None, source=None):
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(n_features)
+        self.ensembles = list(ensembles)
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.source = source or {}
+
+    @property
+    def n_trees(self):
+        return sum(e.n_trees for e in self.ensembles)
+
+    def _transform(self, X):
+        """StandardScaler.transform: float32 input stays float32, mean/scale cast to the input dtype"""
+        X = np.asarray(X)
+        dtype = X.dtype if X.dtype in (np.float32, np.float64) else np.float64
+        X = np.array(X, dtype=dtype, ndmin=2)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got {X.shape[1]}")
+        if self.mean is not None:
+            X -= self.mean.astype(dtype)
+        if self.scale is not None:
+            X /= self.scale.astype(dtype)
+        return X
+
+    def predict_proba(self, X):
+        X = self._transform(X)
+        if len(self.ensembles) == 1:
+            return self.ensembles[0].predict_proba(X)
+        probas = [e.predict_proba(X) for e in self.ensembles]
+        return np.average(probas, axis=0, weights=[e.weight for e in self.ensembles])
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    # ----- Persistence -----
+    def save(self, path):
+        meta = {
+            "format": FORMAT_VERSION,
+            "n_features": self.n_features_in_,
+            "source": self.source,
+            "ensembles": [dict(e.meta, kind=e.kind) for e in self.ensembles],
+        }
+        arrays = {"meta": np.array(json.dumps(meta)), "classes": self.classes_}
+        if self.mean is not None:
+            arrays["mean"] = self.mean
+        if self.scale is not None:
+            arrays["scale"] = self.scale
+        for i, ensemble in enumerate(self.ensembles):
+            for name in ensemble.array_names:
+                arrays[f"e{i}_{name}"] = ensemble.arrays[name]
+        # savez appends .npz to names without it; write to the exact path instead
+        with open(path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+
+    def matches_source(self, path):
+        """True when `path` is the exact file this model was exported from (sha256 recorded at export)"""
+        return self.source.get("sha256") == file_sha256(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format") != FORMAT_VERSION:
+                raise ExportError(f"Unsupported compiled model format: {meta.get('format')}")
+            ensembles = []
+            for i, ensemble_meta in enumerate(meta["ensembles"]):
+                ensemble_cls = ENSEMBLE_TYPES[ensemble_meta["kind"]]
+                arrays = {name: data[f"e{i}_{name}"] for name in ensemble_cls.array_names}
+                ensembles.append(ensemble_cls(ensemble_meta, arrays))
+            return cls(
+                data["classes"], meta["n_features"], ensembles,
+                mean=data["mean"] if "mean" in data else None,
+                scale=data["scale"] if "scale" in data else None,
+                source=meta.get("source")
+            )
+
+
+# ----- Export: flattening trees -----
+class _NodeTables:
+    """Accumulates trees with local child indices (-1 = leaf) into one global node table"""
+
+    def __init__(self):
+        self.parts = {name: [] for name in ("feature", "threshold", "left", "right", "default_left", "missing", "value")}
+        self.roots = []
+        self.tree_output = []
+        self.size = 0
+        self.max_depth = 0
+
+    def add(self, feature, threshold, left, right, default_left, missing, value, output=0):
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        n = len(left)
+        local = np.arange(n)
+        is_leaf = left < 0
+        offset = self.size
+
+        self.parts["feature"].append(np.where(is_leaf, 0, feature).astype(np.int32))
+        self.parts["threshold"].append(np.where(is_leaf, 0.0, threshold).astype(np.float64))
+        self.parts["left"].append(np.where(is_leaf, local, left) + offset)
+        self.parts["right"].append(np.where(is_leaf, local, right) + offset)
+        self.parts["default_left"].append(np.asarray(default_left, dtype=bool))
+        self.parts["missing"].append(np.broadcast_to(np.asarray(missing, dtype=np.int8), (n,)))
+        self.parts["value"].append(np.asarray(value, dtype=np.float64).reshape(n, -1))
+        self.roots.append(offset)
+        self.tree_output.append(output)
+        self.size += n
+        self.max_depth = max(self.max_depth, _tree_depth(left, right))
+
+    def build(self, meta, base):
+        arrays = {name: np.concatenate(parts) for name, parts in self.parts.items()}
+        arrays["left"] = arrays["left"].astype(np.int32)
+        arrays["right"] = arrays["right"].astype(np.int32)
+        arrays["roots"] = np.asarray(self.roots, dtype=np.int32)
+        arrays["tree_output"] = np.asarray(self.tree_output, dtype=np.int32)
+        arrays["base"] = np.asarray(base, dtype=np.float64).reshape(-1)
+        return NodeEnsemble(dict(meta, max_depth=self.max_depth), arrays)
+
+
+def _tree_depth(left, right):
+    depth, level = 0, [0]
+    while True:
+        level = [child for node in level if left[node] >= 0 for child in (left[node], right[node])]
+        if not level:
+            return depth
+        depth += 1
+
+
+def _export_xgboost(model):
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    objective = learner["objective"]["name"]
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise ExportError(f"XGBoost booster '{gbm['name']}' is not supported (gbtree only)")
+
+    trees = gbm["model"]["trees"]
+    tree_info = gbm["model"]["tree_info"]
+    # Same iteration range as XGBClassifier.predict_proba after early stopping
+    try:
+        best_iteration = model.best_iteration
+    except AttributeError:
+        best_iteration = None
+    if best_iteration is not None:
+        limit = gbm["model"]["iteration_indptr"][best_iteration + 1]
+        trees, tree_info = trees[:limit], tree_info[:limit]
+
+    base = np.atleast_1d(np.asarray(json.loads(learner["learner_model_param"]["base_score"]), dtype=np.float64))
+    if objective == "multi:softprob" or objective == "multi:softmax":
+        n_outputs, link = int(learner["learner_model_param"]["num_class"]), "softmax"
+        base = np.broadcast_to(base, (n_outputs,))
+    elif objective == "binary:logistic":
+        n_outputs, link = 1, "sigmoid"
+        base = np.log(base / (1.0 - base))  # base_score is stored as a probability
+    else:
+        raise ExportError(f"XGBoost objective '{objective}' is not supported")
+
+    tables = _NodeTables()
+    for tree, output in zip(trees, tree_info):
+        if any(tree["split_type"]):
+            raise ExportError("XGBoost categorical splits are not supported")
+        # XGBoost compares float32 inputs with float32 split values: x < split
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        left = np.asarray(tree["left_children"])
+        tables.add(
+            tree["split_indices"], conditions, left, tree["right_children"],
+            tree["default_left"], MISSING_NAN,
+            np.where(left < 0, conditions, 0.0), output
+        )
+    meta = {"source": "xgboost", "link": link, "n_outputs": n_outputs, "compare": "lt", "input_dtype": "float32"}
+    return tables.build(meta, base)
+
+
+def _export_lightgbm(model):
+    dump = model.booster_.dump_model()
+    if dump.get("average_output"):
+        raise ExportError("LightGBM random forest mode (average_output) is not supported")
+
+    objective = dump["objective"].split()
+    per_iteration = dump["num_tree_per_iteration"]
+    params = dict(item.split(":", 1) for item in objective[1:] if ":" in item)
+    if objective[0] in ("multiclass", "softmax"):
+        n_outputs, link, scale = dump["num_class"], "softmax", 1.0
+    elif objective[0] == "binary":
+        n_outputs, link, scale = 1, "sigmoid", float(params.get("sigmoid", 1.0))
+    else:
+        raise ExportError(f"LightGBM objective '{dump['objective']}' is not supported")
+
+    missing_codes = {"NaN": MISSING_NAN, "None": MISSING_NONE, "Zero": MISSING_ZERO}
+    tables = _NodeTables()
+    for tree in dump["tree_info"]:
+        nodes = []
+        stack = [tree["tree_structure"]]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            if "leaf_value" not in node:
+                stack.extend((node["right_child"], node["left_child"]))
+        position = {id(node): i for i, node in enumerate(nodes)}
+
+        feature, threshold, left, right, default_left, missing, value = ([] for _ in range(7))
+        for node in nodes:
+            if "leaf_value" in node:
+                feature.append(0); threshold.append(0.0); left.append(-1); right.append(-1)
+                default_left.append(True); missing.append(MISSING_NAN); value.append(node["leaf_value"])
+                continue
+            if node["decision_type"] != "<=":
+                raise ExportError("LightGBM categorical splits are not supported")
+            feature.append(node["split_feature"])
+            threshold.append(node["threshold"])
+            left.append(position[id(node["left_child"])])
+            right.append(position[id(node["right_child"])])
+            default_left.append(node["default_left"])
+            missing.append(missing_codes[node["missing_type"]])
+            value.append(0.0)
+        tables.add(feature, threshold, left, right, default_left, missing, value, tree["tree_index"] % per_iteration)
+
+    meta = {"source": "lightgbm", "link": link, "n_outputs": n_outputs, "scale": scale,
+            "compare": "le", "input_dtype": "float64"}
+    return tables.build(meta, np.zeros(n_outputs))
+
+
+def _export_sklearn_forest(model):
+    estimators = getattr(model, "estimators_", [model])
+    n_classes = len(model.classes_)
+    tables = _NodeTables()
+    for estimator in estimators:
+        tree = estimator.tree_
+        if tree.n_outputs != 1:
+            raise ExportError("Multi-output scikit-learn trees are not supported")
+        value = tree.value[:, 0, :]
+        # Older releases store class counts, newer ones fractions; predict_proba normalises both
+        totals = value.sum(axis=1, keepdims=True)
+        value = np.divide(value, totals, out=np.zeros_like(value), where=totals > 0)
+        missing_left = getattr(tree, "missing_go_to_left", np.ones(tree.node_count, dtype=bool))
+        tables.add(tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                   missing_left, MISSING_NAN, value)
+
+    meta = {"source": "sklearn", "link": "mean", "n_outputs": n_classes, "compare": "le", "input_dtype": "float32"}
+    return tables.build(meta, np.zeros(n_classes))
+
+
+def _export_catboost(model):
+    import tempfile
+
+    # The JSON dump is the documented way to read CatBoost's trees
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.json")
+        model.save_model(path, format="json")
+        with open(path) as f:
+            dump = json.load(f)
+
+    if "oblivious_trees" not in dump:
+        raise ExportError("Only symmetric (oblivious) CatBoost trees are supported")
+    if dump["features_info"].get("categorical_features"):
+        raise ExportError("CatBoost categorical features are not supported")
+
+    loss = model.get_all_params()["loss_function"]
+    float_features = {f["feature_index"]: f for f in dump["features_info"]["float_features"]}
+    scale, bias = dump.get("scale_and_bias", [1.0, [0.0]])
+    bias = np.atleast_1d(np.asarray(bias, dtype=np.float64))
+
+    trees = dump["oblivious_trees"]
+    width = len(trees[0]["leaf_values"]) // (1 << len(trees[0]["splits"])) if trees else 1
+    if loss == "MultiClass":
+        link, n_outputs = "softmax", width
+    elif loss in ("Logloss", "CrossEntropy"):
+        link, n_outputs = "sigmoid", 1
+    else:
+        raise ExportError(f"CatBoost loss '{loss}' is not supported")
+
+    split_feature, split_border, split_nan_true, split_weight = [], [], [], []
+    split_offsets, leaf_offsets, values = [], [], []
+    n_leaves = 0
+    for tree in trees:
+        split_offsets.append(len(split_feature))
+        leaf_offsets.append(n_leaves)
+        # Split i of a tree sets bit i of the leaf index when x > border
+        for bit, split in enumerate(tree.get("splits") or []):
+            if split["split_type"] != "FloatFeature":
+                raise ExportError(f"CatBoost split type '{split['split_type']}' is not supported")
+            info = float_features[split["float_feature_index"]]
+            split_feature.append(info["flat_feature_index"])
+            split_border.append(np.float32(split["border"]))
+            split_nan_true.append(info.get("nan_value_treatment") == "AsTrue")
+            split_weight.append(1 << bit)
+        leaf_values = np.asarray(tree["leaf_values"], dtype=np.float64).reshape(-1, width)
+        values.append(leaf_values)
+        n_leaves += len(leaf_values)
+    split_offsets.append(len(split_feature))
+
+    arrays = {
+        "split_feature": np.asarray(split_feature, dtype=np.int32),
+        "split_border": np.asarray(split_border, dtype=np.float64),
+        "split_nan_true": np.asarray(split_nan_true, dtype=bool),
+        "split_weight": np.asarray(split_weight, dtype=np.int64),
+        "split_offsets": np.asarray(split_offsets, dtype=np.int64),
+        "leaf_offsets": np.asarray(leaf_offsets, dtype=np.int64),
+        "value": np.concatenate(values) if values else np.zeros((0, width)),
+        "tree_output": np.zeros(len(trees), dtype=np.int32),
+        "base": np.broadcast_to(bias, (n_outputs,)).astype(np.float64),
+    }
+    meta = {"source": "catboost", "link": link, "n_outputs": n_outputs, "scale": float(scale),
+            "input_dtype": "float32"}
+    return ObliviousEnsemble(meta, arrays)
+
+
+EXPORTERS = {
+    "XGBClassifier": _export_xgboost,
+    "LGBMClassifier": _export_lightgbm,
+    "CatBoostClassifier": _export_catboost,
+}
+EXPORTERS.update({name: _export_sklearn_forest for name in FOREST_TYPES})
+
+
+def _export_classifier(model):
+    name = type(model).__name__
+    if name == "VotingClassifier":
+        if model.voting != "soft":
+            raise ExportError("Only soft voting can be reproduced from probabilities")
+        weights = model.weights if model.weights is not None else [1.0] * len(model.estimators_)
+        ensembles = []
+        for estimator, weight in zip(model.estimators_, weights):
+            member = _export_classifier(estimator)
+            if len(member) != 1:
+                raise ExportError("Nested voting classifiers are not supported")
+            member[0].weight = member[0].meta["weight"] = float(weight)
+            ensembles.extend(member)
+        return ensembles
+    if name not in EXPORTERS:
+        raise ExportError(f"Unsupported estimator: {name}")
+    return [EXPORTERS[name](model)]
+
+
+def export_model(estimator, source=None):
+    """
+    Flatten a fitted classifier (optionally a Pipeline with a StandardScaler) into a CompiledTreeModel
+    Raises ExportError for anything the evaluator can't reproduce
+    """
+    mean = scale = None
+    model = estimator
+    if type(estimator).__name__ == "Pipeline":
+        *preprocessing, (_, model) = estimator.steps
+        for step_name, step in preprocessing:
+            if step is None or step == "passthrough":
+                continue
+            if type(step).__name__ not in SCALER_TYPES:
+                raise ExportError(f"Unsupported pipeline step '{step_name}': {type(step).__name__}")
+            if mean is not None or scale is not None:
+                raise ExportError("Only one scaling step is supported")
+            mean, scale = step.mean_, step.scale_
+
+    n_features = getattr(estimator, "n_features_in_", None) or getattr(model, "n_features_in_")
+    return CompiledTreeModel(model.classes_, n_features, _export_classifier(model), mean, scale, source)
+
+
+# ----- Export: verification -----
+def verification_inputs(n_features, rows=2000, seed=0, mean=None, scale=None):
+    """
+    Rows to compare the two models on: realistic feature vectors from synthetic band
+    powers (when the model takes the 148 ML features) plus Gaussian rows around the
+    training distribution to exercise as many branches as possible
+    """
+    rng = np.random.default_rng(seed)
+    blocks = []
+    from ml_features import N_FEATURES, extract_ml_features_batch
+    if n_features == N_FEATURES:
+        bands = rng.lognormal(mean=-2.0, sigma=1.0, size=(rows, 5))
+        focus = rng.uniform(0.0, 1.0, rows)
+        raw = rng.normal(0.0, 0.2, size=(rows, 250))
+        with_raw = rng.random(rows) < 0.5
+        blocks.append(extract_ml_features_batch(bands[with_raw], focus[with_raw], raw[with_raw], dtype=np.float64))
+        blocks.append(extract_ml_features_batch(bands[~with_raw], focus[~with_raw], dtype=np.float64))
+    center = np.zeros(n_features) if mean is None else mean
+    spread = np.ones(n_features) if scale is None else scale
+    blocks.append(center + spread * rng.normal(size=(rows, n_features)) * 1.5)
+    return np.vstack(blocks)
+
+
+def verify_export(estimator, compiled, X, tolerance=PROBA_TOLERANCE):
+    """
+    Compare predict_proba of the source estimator and the compiled model
+    Returns: (max abs difference, fraction of rows with the same predicted class)
+    Raises ExportError when the difference exceeds the tolerance
+    """
+    expected = np.asarray(estimator.predict_proba(X), dtype=np.float64)
+    actual = compiled.predict_proba(X)
+    if expected.shape != actual.shape:
+        raise ExportError(f"Probability shape mismatch: {actual.shape} vs {expected.shape}")
+    max_error = float(np.max(np.abs(actual - expected))) if expected.size else 0.0
+    agreement = float(np.mean(np.argmax(actual, axis=1) == np.argmax(expected, axis=1))) if len(X) else 1.0
+    if not max_error <= tolerance:
+        raise ExportError(f"Compiled model differs from the source model by {max_error:.3e} (> {tolerance:.0e})")
+    return max_error, agreement
+
+
+def _select_model(loaded):
+    """Same lookup order as app.load_ml_model"""
+    if not isinstance(loaded, dict):
+        return loaded
+    for key in ("model", "voting_classifier", "best_model"):
+        if key in loaded:
+            return loaded[key]
+    for value in loaded.values():
+        if hasattr(value, "predict") and hasattr(value, "predict_proba"):
+            return value
+    raise ExportError("No model found in the saved dict")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def main():
+    import argparse
+
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Export the trained tree model to a NumPy-only .npz")
+    parser.add_argument("model", help="Path to the .joblib model (or the dict saved by the training notebook)")
+    parser.add_argument("--output", default=None, help="Default: <model>.trees.npz next to the input")
+    parser.add_argument("--rows", type=int, default=2000, help="Verification rows per input family")
+    parser.add_argument("--tolerance", type=float, default=PROBA_TOLERANCE)
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + ".trees.npz"
+    digest = file_sha256(args.model)
+    estimator = _select_model(joblib.load(args.model))
+
+    compiled = export_model(estimator, source={"path": os.path.basename(args.model), "sha256": digest,
+                                               "estimator": type(estimator).__name__})
+    X = verification_inputs(compiled.n_features_in_, args.rows, mean=compiled.mean, scale=compiled.scale)
+    max_error, agreement = verify_export(estimator, compiled, X, args.tolerance)
+
+    compiled.save(output)
+    reloaded = CompiledTreeModel.load(output)
+    verify_export(estimator, reloaded, X, args.tolerance)
+
+    print(f"✅ Exported {compiled.n_trees} trees in {len(compiled.ensembles)} ensemble(s) to {output}")
+    print(f"   Max probability difference: {max_error:.2e} over {len(X)} rows (tolerance {args.tolerance:.0e})")
+    print(f"   Predicted class agreement: {agreement * 100:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+EEG Headset Simulator
+Simulates one or more ESP32 headsets streaming binary sample frames to the server
+
+Usage:
+    python device_simulator.py --devices 5 --seconds 30
+    python device_simulator.py --url ws://localhost:5000/ws/ingest --devices 60
+    python device_simulator.py --http --url http://localhost:5000/upload
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from ingest_protocol import BINARY_FRAME_MIMETYPES, encode_sample_frame
+
+SAMPLE_RATE = 250
+TRY_AGAIN_LATER = 1013  # WebSocket close code for "channel limit reached"
+
+
+def synthetic_samples(rng, t0, count, dominant_hz):
+    """Generate one chunk of 12-bit ADC samples around mid-scale (2048)"""
+    t = (t0 + np.arange(count)) / SAMPLE_RATE
+    signal = (
+        300 * np.sin(2 * np.pi * dominant_hz * t)
+        + 120 * np.sin(2 * np.pi * 6 * t)
+        + 60 * rng.standard_normal(count)
+    )
+    return np.clip(2048 + signal, 0, 4095).astype(np.uint16)
+
+
+def device_mac(index):
+    """Locally administered MAC so simulated devices never collide with real headsets"""
+    return "02:00:00:00:{:02X}:{:02X}".format((index >> 8) & 0xFF, index & 0xFF)
+
+
+def upload_url(ws_url):
+    """The /upload endpoint next to a ws://.../ws/ingest URL"""
+    return ws_url.replace("ws://", "http://", 1).replace("wss://", "https://", 1).replace("/ws/ingest", "/upload")
+
+
+def run_websocket_device(index, args, results):
+    """Keep one WebSocket open and push a frame every interval (POSTs instead when the server is full)"""
+    from simple_websocket import Client, ConnectionClosed
+
+    rng = np.random.default_rng(index)
+    mac = device_mac(index)
+    dominant_hz = rng.choice([5.0, 10.0, 20.0])
+    ws = Client.connect(args.url)
+    acks = 0
+    refused = False
+    try:
+        for seq in range(args.seconds * args.rate):
+            chunk = SAMPLE_RATE // args.rate
+            ws.send(encode_sample_frame(mac, seq, synthetic_samples(rng, seq * chunk, chunk, dominant_hz)))
+            ack = json.loads(ws.receive(timeout=10))
+            acks += 1
+            if args.verbose:
+                print(f"{mac} {ack}")
+            time.sleep(1.0 / args.rate)
+    except ConnectionClosed as e:
+        # A full server accepts the handshake, then closes with 1013 (try again later)
+        if e.reason != TRY_AGAIN_LATER or acks:
+            raise
+        refused = True
+    finally:
+        if ws.connected:
+            ws.close()
+        if not refused:
+            results[mac] = acks
+
+    if refused:
+        print(f"{mac} channel refused (server full) - falling back to /upload")
+        run_http_device(index, argparse.Namespace(**dict(vars(args), url=upload_url(args.url))), results)
+
+
+def run_http_device(index, args, results):
+    """POST one binary frame per interval (new request each time)"""
+    rng = np.random.default_rng(index)
+    mac = device_mac(index)
+    dominant_hz = rng.choice([5.0, 10.0, 20.0])
+    acks = 0
+    for seq in range(args.seconds * args.rate):
+        chunk = SAMPLE_RATE // args.rate
+        body = encode_sample_frame(mac, seq, synthetic_samples(rng, seq * chunk, chunk, dominant_hz))
+        req = urllib.request.Request(args.url, data=body, headers={"Content-Type": BINARY_FRAME_MIMETYPES[0]})
+        with urllib.request.urlopen(req, timeout=10) as response:
+            ack = json.loads(response.read())
+        acks += 1
+        if args.verbose:
+            print(f"{mac} {ack}")
+        time.sleep(1.0 / args.rate)
+    results[mac] = acks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate EEG headsets streaming to the server")
+    parser.add_argument("--url", default=None, help="ws://.../ws/ingest (default) or http://.../upload with --http")
+    parser.add_argument("--devices", type=int, default=3)
+    parser.add_argument("--seconds", type=int, default=10)
+    parser.add_argument("--rate", type=int, default=1, help="Frames per second per device")
+    parser.add_argument("--http", action="store_true", help="Use one POST per frame instead of a WebSocket")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.url is None:
+        args.url = "http://localhost:5000/upload" if args.http else "ws://localhost:5000/ws/ingest"
+    target = run_http_device if args.http else run_websocket_device
+
+    results = {}
+    started = time.time()
+    threads = [threading.Thread(target=target, args=(i, args, results), daemon=True) for i in range(args.devices)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.time() - started
+    total = sum(results.values())
+    print(f"✅ {len(results)} device(s), {total} frames acknowledged in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
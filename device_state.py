@@ -0,0 +1,529 @@
+"""
+Device State Module
+Per-device connection status and sample windows behind one interface
+
+app.py and students_routes.py use a DeviceStateStore instead of module-level dicts:
+
+    LocalDeviceState          dicts in this process (python app.py, a single worker)
+    SharedMemoryDeviceState   fixed-size slots in multiprocessing.shared_memory plus a
+                              MAC index, shared by every gunicorn worker forked from the
+                              preloading master, so all workers see the same status,
+                              ring buffers and filter state for a device
+
+Select with EEG_DEVICE_STATE=local|shared (gunicorn.conf.py defaults to shared).
+All methods return copies: callers never hold references into the store.
+
+Each device also keeps its latest processing result (bands, focus, mental state) with
+a version taken from one store-wide counter, so live views (the /api/stream SSE
+endpoint) can ask for "everything that changed since version N" without the database.
+
+Each device also runs an AttentionTracker (attention_tracker.py) over its stored
+readings, so attention periods can be answered without reading eeg_data back.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from attention_tracker import CLOSED_PERIODS, PERIOD_FIELDS, STATE_SIZE, AttentionTracker, new_state
+from eeg_dsp import SampleRingBuffer, design_eeg_filter_sos, filter_chunk
+from ingest_protocol import MAC_ADDRESS_MAX_LENGTH
+
+logger = logging.getLogger(__name__)
+
+STATUS_DEFAULTS = {
+    "connected": False,
+    "wearing": False,
+    "last_update": None,
+    "error_message": None,
+    "signal_quality": "unknown",
+    "last_sequence": None
+}
+
+RESULT_BANDS = ("delta", "theta", "alpha", "beta", "gamma")
+
+
+class DeviceStateStore(ABC):
+    """
+    Interface shared by the backends
+
+    Status dicts have the STATUS_DEFAULTS keys (last_update is a datetime or None).
+    Sample windows: the raw ADC samples and the same window after the notch +
+    band-pass filter, both holding the newest buffer_size samples.
+    """
+
+    def __init__(self, buffer_size, fs):
+        self.buffer_size = int(buffer_size)
+        self.sos = design_eeg_filter_sos(fs)
+        # Attention trackers of devices first seen by this store have every reading since now
+        self.started_at = datetime.now().timestamp()
+
+    @abstractmethod
+    def get_status(self, mac_address):
+        """Status dict copy, or None for a device this store hasn't seen"""
+
+    @abstractmethod
+    def update_status(self, mac_address, **fields):
+        """Set status fields, registering the device with STATUS_DEFAULTS first if needed"""
+
+    @abstractmethod
+    def statuses(self):
+        """{mac_address: status dict} for every known device"""
+
+    @abstractmethod
+    def record_sequence(self, mac_address, expected, sequence):
+        """
+        Store a handled frame's sequence number if the stored one is still `expected`
+        (None = no sequence yet); returns whether it was stored
+        """
+
+    @abstractmethod
+    def process_chunk(self, mac_address, raw_values, chunk):
+        """
+        Append raw samples and their filtered form (chunk is the normalised signal)
+        Returns: (raw window float64, filtered window float64), both copies
+        """
+
+    @abstractmethod
+    def last_samples(self, mac_address, n):
+        """Newest n raw samples as a float32 array (empty for unknown devices)"""
+
+    @abstractmethod
+    def sample_count(self, mac_address):
+        """Raw samples held for the device (0 for unknown devices)"""
+
+    @abstractmethod
+    def snapshots(self):
+        """{mac_address: status dict plus "bands", "focus", "mental_state"} for every known device"""
+
+    @abstractmethod
+    def publish(self, mac_address, band_powers=None, focus=None, mental_state=None):
+        """
+        Store the device's latest result (fields left as None keep their value) and give
+        the device a new version, so changes_since() reports it; returns that version
+        """
+
+    @abstractmethod
+    def current_version(self):
+        """Newest version handed out by publish() (0 before the first one)"""
+
+    @abstractmethod
+    def changes_since(self, version, mac_address=None):
+        """
+        Devices published after `version`, optionally only one MAC
+        Returns: (cursor, [(version, mac_address, snapshot)] oldest first), where the
+        snapshot is the status dict plus "bands", "focus" and "mental_state" (None until
+        the first result) and cursor is the version to pass next time
+        """
+
+    @abstractmethod
+    def track_attention(self, mac_address, timestamp, focus, beta, gamma):
+        """
+        Feed one stored reading (timestamp a datetime) to the device's attention tracker
+        Returns the attention period it closed (dict, see AttentionTracker) or None
+        """
+
+    @abstractmethod
+    def attention_periods(self, mac_address):
+        """AttentionTracker.snapshot() for the device, or None for a device this store hasn't seen"""
+
+    def __contains__(self, mac_address):
+        return self.get_status(mac_address) is not None
+
+    def __len__(self):
+        return len(self.statuses())
+
+
+class LocalDeviceState(DeviceStateStore):
+    """In-process dicts guarded by one lock (the original single-process behaviour)"""
+
+    def __init__(self, buffer_size, fs):
+        super().__init__(buffer_size, fs)
+        self._statuses = {}
+        self._raw = {}  # MAC -> SampleRingBuffer of raw samples
+        self._filtered = {}  # MAC -> SampleRingBuffer of filtered samples
+        self._zi = {}  # MAC -> filter state carried between uploads
+        self._results = {}  # MAC -> {"bands", "focus", "mental_state", "version"}
+        self._attention = {}  # MAC -> AttentionTracker
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get_status(self, mac_address):
+        with self._lock:
+            status = self._statuses.get(mac_address)
+            return dict(status) if status is not None else None
+
+    def update_status(self, mac_address, **fields):
+        with self._lock:
+            self._statuses.setdefault(mac_address, dict(STATUS_DEFAULTS)).update(fields)
+
+    def statuses(self):
+        with self._lock:
+            return {mac: dict(status) for mac, status in self._statuses.items()}
+
+    def record_sequence(self, mac_address, expected, sequence):
+        with self._lock:
+            status = self._statuses.setdefault(mac_address, dict(STATUS_DEFAULTS))
+            if status["last_sequence"] != expected:
+                return False
+            status["last_sequence"] = sequence
+            return True
+
+    def process_chunk(self, mac_address, raw_values, chunk):
+        with self._lock:
+            if mac_address not in self._raw:
+                self._raw[mac_address] = SampleRingBuffer(self.buffer_size)
+                self._filtered[mac_address] = SampleRingBuffer(self.buffer_size, dtype=np.float64)
+                self._zi[mac_address] = None
+            filtered, self._zi[mac_address] = filter_chunk(self.sos, chunk, self._zi[mac_address])
+            self._raw[mac_address].append(raw_values)
+            self._filtered[mac_address].append(filtered)
+            return (self._raw[mac_address].view().astype(np.float64),
+                    self._filtered[mac_address].view().copy())
+
+    def last_samples(self, mac_address, n):
+        with self._lock:
+            ring = self._raw.get(mac_address)
+            return ring.last(n).copy() if ring is not None else np.zeros(0, dtype=np.float32)
+
+    def sample_count(self, mac_address):
+        with self._lock:
+            ring = self._raw.get(mac_address)
+            return len(ring) if ring is not None else 0
+
+    def _snapshot(self, mac_address):
+        result = self._results.get(mac_address) or {}
+        return dict(self._statuses[mac_address],
+                    bands=dict(result["bands"]) if result.get("bands") else None,
+                    focus=result.get("focus"), mental_state=result.get("mental_state"))
+
+    def snapshots(self):
+        with self._lock:
+            return {mac: self._snapshot(mac) for mac in self._statuses}
+
+    def publish(self, mac_address, band_powers=None, focus=None, mental_state=None):
+        with self._lock:
+            self._statuses.setdefault(mac_address, dict(STATUS_DEFAULTS))
+            result = self._results.setdefault(mac_address, {"bands": None, "focus": None, "mental_state": None})
+            if band_powers is not None:
+                result["bands"] = {band: float(band_powers[band]) for band in RESULT_BANDS}
+            if focus is not None:
+                result["focus"] = float(focus)
+            if mental_state is not None:
+                result["mental_state"] = mental_state
+            self._version += 1
+            result["version"] = self._version
+            return self._version
+
+    def current_version(self):
+        with self._lock:
+            return self._version
+
+    def changes_since(self, version, mac_address=None):
+        with self._lock:
+            changes = [
+                (result["version"], mac, self._snapshot(mac))
+                for mac, result in self._results.items()
+                if result["version"] > version and (mac_address is None or mac == mac_address)
+            ]
+            return self._version, sorted(changes, key=lambda change: change[0])
+
+    def track_attention(self, mac_address, timestamp, focus, beta, gamma):
+        with self._lock:
+            tracker = self._attention.get(mac_address)
+            if tracker is None:
+                tracker = self._attention[mac_address] = AttentionTracker.create(self.started_at)
+            return tracker.update(timestamp.timestamp(), float(focus), float(beta), float(gamma))
+
+    def attention_periods(self, mac_address):
+        with self._lock:
+            tracker = self._attention.get(mac_address)
+            return tracker.snapshot() if tracker is not None else None
+
+
+class SharedMemoryDeviceState(DeviceStateStore):
+    """
+    One fixed-size slot per device in a shared-memory block
+
+    The block and its locks must be created before the workers fork (gunicorn
+    preload_app); they are inherited, not re-attached by name. Each slot is guarded
+    by one of LOCK_STRIPES process-shared locks, and the MAC index (slot allocation)
+    by its own lock, always taken before a stripe lock. When every slot is in use the
+    device with the oldest update is evicted; a device that gets a slot back later has
+    lost its attention history, so its tracker starts at that moment.
+
+    publish() takes the version and writes it into the slot while holding the shared
+    version counter's lock (after the stripe lock), so versions become visible in order
+    and a reader scanning under that lock never skips one.
+    """
+
+    LOCK_STRIPES = 16
+    SIGNAL_QUALITY_BYTES = 32
+    ERROR_MESSAGE_BYTES = 192
+    MENTAL_STATE_BYTES = 16
+
+    def __init__(self, buffer_size, fs, max_devices=256):
+        super().__init__(buffer_size, fs)
+        self.max_devices = int(max_devices)
+        self.dtype = np.dtype([
+            ("mac", f"S{MAC_ADDRESS_MAX_LENGTH}"),
+            ("in_use", "?"),
+            ("connected", "?"),
+            ("wearing", "?"),
+            ("has_zi", "?"),
+            ("last_update", "f8"),  # epoch seconds, NaN = never
+            ("last_sequence", "i8"),  # -1 = none (sequences are uint32)
+            ("signal_quality", f"S{self.SIGNAL_QUALITY_BYTES}"),
+            ("error_message", f"S{self.ERROR_MESSAGE_BYTES}"),
+            ("raw_ring", "i8", (2,)),  # SampleRingBuffer [head, size]
+            ("filtered_ring", "i8", (2,)),
+            ("version", "i8"),  # 0 = no result published
+            ("focus", "f8"),  # NaN = none
+            ("bands", "f8", (len(RESULT_BANDS),)),  # NaN = none
+            ("mental_state", f"S{self.MENTAL_STATE_BYTES}"),
+            ("attention", "f8", (STATE_SIZE,)),  # AttentionTracker state
+            ("attention_ring", "i8", (2,)),  # [head, size] of attention_periods
+            ("attention_periods", "f8", (CLOSED_PERIODS, len(PERIOD_FIELDS))),
+            ("zi", "f8", self.sos.shape[:1] + (2,)),
+            ("raw", "f4", (2 * self.buffer_size,)),
+            ("filtered", "f8", (2 * self.buffer_size,)),
+        ], align=True)
+
+        self._owner_pid = os.getpid()
+        self._shm = shared_memory.SharedMemory(create=True, size=self.dtype.itemsize * self.max_devices)
+        self._slots = np.ndarray((self.max_devices,), dtype=self.dtype, buffer=self._shm.buf)
+        self._slots[:] = np.zeros(1, dtype=self.dtype)
+        self._index_lock = multiprocessing.Lock()
+        self._stripes = [multiprocessing.Lock() for _ in range(self.LOCK_STRIPES)]
+        self._version = multiprocessing.Value("q", 0)
+        self._index = {}  # per-process cache MAC -> slot, validated against the slot's MAC
+        atexit.register(self.close)
+        logger.info(f"🧠 Shared device state: {self.max_devices} slots x {self.dtype.itemsize} bytes ({self._shm.name})")
+
+    def close(self):
+        """Release the block; only the creating process unlinks it"""
+        if self._shm is None:
+            return
+        self._slots = None
+        try:
+            self._shm.close()
+            if os.getpid() == self._owner_pid:
+                self._shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+        self._shm = None
+
+    # ----- MAC index -----
+    def _find_slot(self, key):
+        matches = np.flatnonzero(self._slots["in_use"] & (self._slots["mac"] == key))
+        return int(matches[0]) if matches.size else None
+
+    def _allocate_slot(self, mac_address, key):
+        if len(key) > MAC_ADDRESS_MAX_LENGTH or key.endswith(b"\0"):
+            # Would be stored truncated / stripped and never match itself
+            raise ValueError(f"MAC address {mac_address!r} doesn't fit a device slot")
+        free = np.flatnonzero(~self._slots["in_use"])
+        since = self.started_at
+        if free.size:
+            slot = int(free[0])
+        else:
+            since = datetime.now().timestamp()
+            # Never-updated slots first (NaN), then the stalest device
+            slot = int(np.argmin(np.nan_to_num(self._slots["last_update"], nan=-np.inf)))
+            logger.warning(f"⚠️ Device state full ({self.max_devices} slots) - evicting {self._slots['mac'][slot].decode()}")
+        with self._stripes[slot % self.LOCK_STRIPES]:
+            record = self._slots[slot:slot + 1]
+            record[:] = np.zeros(1, dtype=self.dtype)
+            record["mac"] = key
+            record["in_use"] = True
+            record["last_update"] = np.nan
+            record["last_sequence"] = -1
+            record["focus"] = np.nan
+            record["bands"] = np.nan
+            record["signal_quality"] = STATUS_DEFAULTS["signal_quality"].encode()
+            record["attention"] = new_state(since)
+        return slot
+
+    @contextmanager
+    def _locked_slot(self, mac_address, create=False):
+        """Yield the slot index with its stripe lock held (None for an unknown device)"""
+        key = mac_address.encode()
+        while True:
+            slot = self._index.get(mac_address)
+            if slot is None or self._slots["mac"][slot] != key:
+                with self._index_lock:
+                    slot = self._find_slot(key)
+                    if slot is None and create:
+                        slot = self._allocate_slot(mac_address, key)
+                        if self._slots["mac"][slot] != key:
+                            # Looping would allocate (and evict) again on every pass
+                            raise ValueError(f"MAC address {mac_address!r} doesn't read back from its slot")
+                if slot is None:
+                    self._index.pop(mac_address, None)
+                    yield None
+                    return
+                self._index[mac_address] = slot
+
+            with self._stripes[slot % self.LOCK_STRIPES]:
+                # The slot may have been re-assigned while we weren't holding its lock
+                if self._slots["in_use"][slot] and self._slots["mac"][slot] == key:
+                    yield slot
+                    return
+            self._index.pop(mac_address, None)
+
+    def _status(self, slot):
+        record = self._slots[slot]
+        last_update = float(record["last_update"])
+        error_message = record["error_message"].decode(errors="replace")
+        return {
+            "connected": bool(record["connected"]),
+            "wearing": bool(record["wearing"]),
+            "last_update": None if np.isnan(last_update) else datetime.fromtimestamp(last_update),
+            "error_message": error_message or None,
+            "signal_quality": record["signal_quality"].decode(errors="replace"),
+            "last_sequence": None if record["last_sequence"] < 0 else int(record["last_sequence"])
+        }
+
+    def _snapshot(self, slot):
+        record = self._slots[slot]
+        snapshot = self._status(slot)
+        bands = record["bands"]
+        snapshot["bands"] = None if np.isnan(bands[0]) else dict(zip(RESULT_BANDS, bands.tolist()))
+        snapshot["focus"] = None if np.isnan(record["focus"]) else float(record["focus"])
+        snapshot["mental_state"] = record["mental_state"].decode(errors="replace") or None
+        return snapshot
+
+    # ----- DeviceStateStore -----
+    def get_status(self, mac_address):
+        with self._locked_slot(mac_address) as slot:
+            return None if slot is None else self._status(slot)
+
+    def update_status(self, mac_address, **fields):
+        with self._locked_slot(mac_address, create=True) as slot:
+            record = self._slots[slot:slot + 1]
+            for name, value in fields.items():
+                if name == "last_update":
+                    record["last_update"] = np.nan if value is None else value.timestamp()
+                elif name == "last_sequence":
+                    record["last_sequence"] = -1 if value is None else value
+                elif name in ("signal_quality", "error_message"):
+                    record[name] = (value or "").encode()
+                elif name in ("connected", "wearing"):
+                    record[name] = bool(value)
+                else:
+                    raise KeyError(f"Unknown device status field: {name}")
+
+    def statuses(self):
+        result = {}
+        for slot in np.flatnonzero(self._slots["in_use"]):
+            with self._stripes[slot % self.LOCK_STRIPES]:
+                if self._slots["in_use"][slot]:
+                    result[self._slots["mac"][slot].decode()] = self._status(slot)
+        return result
+
+    def record_sequence(self, mac_address, expected, sequence):
+        with self._locked_slot(mac_address, create=True) as slot:
+            if int(self._slots["last_sequence"][slot]) != (-1 if expected is None else expected):
+                return False
+            self._slots["last_sequence"][slot] = sequence
+            return True
+
+    def _rings(self, slot):
+        record = self._slots[slot]
+        return (SampleRingBuffer(self.buffer_size, data=record["raw"], state=record["raw_ring"]),
+                SampleRingBuffer(self.buffer_size, data=record["filtered"], state=record["filtered_ring"]))
+
+    def process_chunk(self, mac_address, raw_values, chunk):
+        with self._locked_slot(mac_address, create=True) as slot:
+            record = self._slots[slot]
+            zi = record["zi"].copy() if record["has_zi"] else None
+            filtered, zi = filter_chunk(self.sos, chunk, zi)
+            if zi is not None:
+                record["zi"] = zi
+                record["has_zi"] = True
+            raw_ring, filtered_ring = self._rings(slot)
+            raw_ring.append(raw_values)
+            filtered_ring.append(filtered)
+            return raw_ring.view().astype(np.float64), filtered_ring.view().copy()
+
+    def last_samples(self, mac_address, n):
+        with self._locked_slot(mac_address) as slot:
+            if slot is None:
+                return np.zeros(0, dtype=np.float32)
+            return self._rings(slot)[0].last(n).copy()
+
+    def sample_count(self, mac_address):
+        with self._locked_slot(mac_address) as slot:
+            return 0 if slot is None else int(self._slots["raw_ring"][slot][1])
+
+    def snapshots(self):
+        result = {}
+        for slot in np.flatnonzero(self._slots["in_use"]):
+            with self._stripes[slot % self.LOCK_STRIPES]:
+                if self._slots["in_use"][slot]:
+                    result[self._slots["mac"][slot].decode()] = self._snapshot(slot)
+        return result
+
+    def publish(self, mac_address, band_powers=None, focus=None, mental_state=None):
+        with self._locked_slot(mac_address, create=True) as slot:
+            record = self._slots[slot:slot + 1]
+            if band_powers is not None:
+                record["bands"] = [band_powers[band] for band in RESULT_BANDS]
+            if focus is not None:
+                record["focus"] = focus
+            if mental_state is not None:
+                record["mental_state"] = mental_state.encode()
+            with self._version.get_lock():
+                self._version.value += 1
+                record["version"] = self._version.value
+                return self._version.value
+
+    def current_version(self):
+        return self._version.value
+
+    def changes_since(self, version, mac_address=None):
+        with self._version.get_lock():
+            cursor = self._version.value
+            changed = self._slots["in_use"] & (self._slots["version"] > version)
+            if mac_address is not None:
+                changed &= self._slots["mac"] == mac_address.encode()
+            slots = np.flatnonzero(changed)
+            versions = self._slots["version"][slots]
+        changes = []
+        for slot, slot_version in sorted(zip(slots.tolist(), versions.tolist()), key=lambda item: item[1]):
+            with self._stripes[slot % self.LOCK_STRIPES]:
+                if self._slots["in_use"][slot]:
+                    # May already be newer than slot_version; the next call reports it again
+                    changes.append((slot_version, self._slots["mac"][slot].decode(), self._snapshot(slot)))
+        return cursor, changes
+
+    def _attention_tracker(self, slot):
+        record = self._slots[slot]
+        return AttentionTracker(record["attention"], record["attention_periods"], record["attention_ring"])
+
+    def track_attention(self, mac_address, timestamp, focus, beta, gamma):
+        with self._locked_slot(mac_address, create=True) as slot:
+            return self._attention_tracker(slot).update(timestamp.timestamp(), float(focus), float(beta), float(gamma))
+
+    def attention_periods(self, mac_address):
+        with self._locked_slot(mac_address) as slot:
+            return None if slot is None else self._attention_tracker(slot).snapshot()
+
+
+def create_device_state(backend, buffer_size, fs, max_devices=256):
+    """Build the configured store, falling back to local state if shared memory is unavailable"""
+    if backend == "shared":
+        try:
+            return SharedMemoryDeviceState(buffer_size, fs, max_devices)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Shared device state unavailable ({e}) - using per-process state")
+    elif backend != "local":
+        logger.warning(f"⚠️ Unknown EEG_DEVICE_STATE '{backend}' - using per-process state")
+    return LocalDeviceState(buffer_size, fs)
@@ -0,0 +1,282 @@
+"""
+DSP Engine Module
+Optional pool of signal-processing processes with per-device (MAC) affinity
+
+Each shard is a process forked from the app once at startup (gunicorn master during
+preload, or the `python app.py` process), so it inherits the loaded ML model and the
+processing functions without re-importing anything. A MAC address always maps to the
+same shard through a consistent-hash ring, so one process handles all of a device's
+uploads in order. Request threads in the web workers only forward
+(mac_address, samples) over a Unix-socket connection and wait for the result, which
+lets filtering, FFT and inference run on every core instead of under the web
+workers' GIL.
+
+Shard state that other processes need (device status, sample windows, filter state)
+belongs in the shared-memory device store; the engine itself only moves work. If a
+shard can't be reached the chunk was never delivered, so process() returns None and
+the caller processes it in-process instead. A shard that received the chunk but
+didn't answer in time raises ShardError: it may still apply the chunk to the device's
+filter state, so processing it again here would count those samples twice.
+
+Enable with EEG_DSP_SHARDS=<n> (Linux / fork only).
+"""
+import atexit
+import bisect
+import hashlib
+import logging
+import os
+import select
+import signal
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+logger = logging.getLogger(__name__)
+
+# Signals a shard must not inherit handlers for (gunicorn's master installs its own)
+_RESET_SIGNALS = ("SIGTERM", "SIGINT", "SIGHUP", "SIGQUIT", "SIGCHLD", "SIGUSR1", "SIGUSR2",
+                  "SIGTTIN", "SIGTTOU", "SIGWINCH")
+
+
+class ShardError(RuntimeError):
+    """A shard received a chunk but failed or timed out before replying"""
+
+
+class HashRing:
+    """Consistent hashing of keys onto shards (stable across processes and restarts)"""
+
+    def __init__(self, n_shards, virtual_nodes=64):
+        points = sorted(
+            (self._hash(f"shard-{shard}-{i}"), shard)
+            for shard in range(n_shards) for i in range(virtual_nodes)
+        )
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def shard_for(self, key):
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._shards[index]
+
+
+def _serve_shard(shard_id, address, authkey, ready_fd, processor, parent_pid):
+    """Shard process main loop: one handler thread per connected web process"""
+    for name in _RESET_SIGNALS:
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), signal.SIG_DFL)
+
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    os.write(ready_fd, b"1")
+    os.close(ready_fd)
+
+    def watch_parent():
+        # Exit with the process that forked us, even if it was killed without cleanup
+        while os.getppid() == parent_pid:
+            time.sleep(2)
+        os._exit(0)
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    op, mac_address, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op == "process":
+                        conn.send(("ok", processor(payload, mac_address)))
+                    elif op == "ping":
+                        conn.send(("ok", shard_id))
+                    else:
+                        conn.send(("error", f"Unknown operation: {op}"))
+                except Exception as e:
+                    logger.error(f"❌ DSP shard {shard_id} failed for {mac_address}: {e}")
+                    conn.send(("error", str(e)))
+
+    threading.Thread(target=watch_parent, daemon=True).start()
+    logger.info(f"⚙️ DSP shard {shard_id} running (pid {os.getpid()})")
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            logger.error(f"DSP shard {shard_id} accept error: {e}")
+            continue
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+class _ShardClient:
+    """One connection per (web process, shard); requests on it are serialised"""
+
+    def __init__(self, address, authkey):
+        self.conn = Client(address, family="AF_UNIX", authkey=authkey)
+        self.lock = threading.Lock()
+
+
+class DspEngine:
+    """Forks the shard processes and routes each device's chunks to its shard"""
+
+    def __init__(self, n_shards, processor, timeout=2.0):
+        """
+        Args:
+            n_shards: number of shard processes
+            processor: callable(raw_values, mac_address) run inside the shard; with fork
+                it is inherited, never pickled
+            timeout: seconds to wait for a shard's reply before giving up on the chunk
+        """
+        self.n_shards = int(n_shards)
+        self.processor = processor
+        self.timeout = timeout
+        self.ring = HashRing(self.n_shards)
+        self._authkey = os.urandom(16)
+        self._socket_dir = None
+        self._addresses = []
+        self._pids = []
+        self._owner_pid = None
+        self._clients = {}  # shard -> _ShardClient, valid for self._clients_pid only
+        self._clients_pid = None
+        self._clients_lock = threading.Lock()
+        self._stats = {"forwarded": 0, "fallbacks": 0, "errors": 0, "timeouts": 0}
+
+    @property
+    def started(self):
+        return bool(self._pids)
+
+    def start(self):
+        """Fork the shards (call once, before web workers fork and before starting threads)"""
+        if self.started:
+            return
+        self._owner_pid = os.getpid()
+        self._socket_dir = tempfile.mkdtemp(prefix="eeg-dsp-")
+        for shard_id in range(self.n_shards):
+            address = os.path.join(self._socket_dir, f"shard-{shard_id}.sock")
+            ready_r, ready_w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(ready_r)
+                try:
+                    _serve_shard(shard_id, address, self._authkey, ready_w, self.processor, self._owner_pid)
+                finally:
+                    os._exit(0)
+            # Wait until the shard listens so the first upload doesn't fall back
+            os.close(ready_w)
+            if not select.select([ready_r], [], [], 10)[0]:
+                logger.warning(f"⚠️ DSP shard {shard_id} not listening yet")
+            os.close(ready_r)
+            self._addresses.append(address)
+            self._pids.append(pid)
+        atexit.register(self.stop)
+        logger.info(f"⚙️ Started {self.n_shards} DSP shard process(es): {self._pids}")
+
+    def stop(self):
+        """Terminate the shards (only from the process that forked them)"""
+        if os.getpid() != self._owner_pid:
+            return
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        for address in self._addresses:
+            try:
+                os.unlink(address)
+            except FileNotFoundError:
+                pass
+        if self._socket_dir:
+            try:
+                os.rmdir(self._socket_dir)
+            except OSError:
+                pass
+        self._pids = []
+
+    def shard_for(self, mac_address):
+        return self.ring.shard_for(mac_address)
+
+    def _client(self, shard):
+        with self._clients_lock:
+            if self._clients_pid != os.getpid():
+                # Connections from before a fork belong to the parent
+                self._clients = {}
+                self._clients_pid = os.getpid()
+            client = self._clients.get(shard)
+            if client is None:
+                client = self._clients[shard] = _ShardClient(self._addresses[shard], self._authkey)
+            return client
+
+    def _drop_client(self, shard, client):
+        with self._clients_lock:
+            if self._clients.get(shard) is client:
+                del self._clients[shard]
+        try:
+            client.conn.close()
+        except OSError:
+            pass
+
+    def _call(self, mac_address, op, payload):
+        shard = self.shard_for(mac_address)
+        try:
+            client = self._client(shard)
+        except (OSError, EOFError) as e:
+            self._stats["errors"] += 1
+            logger.error(f"❌ DSP shard {shard} unreachable: {e}")
+            return None
+
+        with client.lock:
+            try:
+                client.conn.send((op, mac_address, payload))
+            except (OSError, EOFError) as e:
+                # Nothing was delivered - safe for the caller to process the chunk itself
+                self._stats["errors"] += 1
+                logger.error(f"❌ DSP shard {shard} connection failed: {e}")
+                self._drop_client(shard, client)
+                return None
+            try:
+                if not client.conn.poll(self.timeout):
+                    # The late reply would desynchronise the connection - start a new one
+                    self._stats["timeouts"] += 1
+                    self._drop_client(shard, client)
+                    raise ShardError(f"DSP shard {shard} timed out after {self.timeout}s")
+                status, result = client.conn.recv()
+            except (OSError, EOFError) as e:
+                self._stats["errors"] += 1
+                self._drop_client(shard, client)
+                raise ShardError(f"DSP shard {shard} connection lost: {e}") from e
+
+        if status != "ok":
+            self._stats["errors"] += 1
+            raise ShardError(f"DSP shard {shard} error: {result}")
+        self._stats["forwarded"] += 1
+        return result
+
+    def process(self, mac_address, raw_values):
+        """
+        Run the processor on the device's shard
+        Returns the processor's result, or None when the shard couldn't be reached
+        (process the chunk in-process). Raises ShardError if the shard got the chunk
+        but didn't answer.
+        """
+        result = self._call(mac_address, "process", raw_values)
+        if result is None:
+            self._stats["fallbacks"] += 1
+        return result
+
+    def _alive(self, pid):
+        if os.getpid() == self._owner_pid:
+            try:
+                # Reap it if it died - a zombie still answers kill(pid, 0)
+                return os.waitpid(pid, os.WNOHANG) == (0, 0)
+            except ChildProcessError:
+                return False
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError:
+            return False
+
+    def stats(self):
+        alive = [self._alive(pid) for pid in self._pids]
+        return dict(self._stats, shards=self.n_shards, shard_pids=self._pids, shards_alive=alive)
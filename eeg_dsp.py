@@ -0,0 +1,228 @@
+"""
+EEG DSP Module
+Reusable signal-processing building blocks for the per-device EEG pipeline
+"""
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, iirnotch, sosfilt, sosfilt_zi, tf2sos
+
+
+class SampleRingBuffer:
+    """
+    Fixed-capacity float32 sample history for one device
+
+    Samples are written twice (at i and i + capacity) into a 2x array, so the
+    newest `len(self)` samples are always one contiguous slice: view() returns
+    it without copying and append() never reallocates.
+
+    `data` (2 * capacity samples) and `state` (int64 [head, size]) can be passed in
+    to keep the buffer in externally owned memory such as a shared-memory slot.
+    """
+
+    def __init__(self, capacity, dtype=np.float32, data=None, state=None):
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=dtype) if data is None else data
+        self._state = np.zeros(2, dtype=np.int64) if state is None else state
+
+    # head = next write position in [0, capacity); size = samples buffered
+    @property
+    def _head(self):
+        return int(self._state[0])
+
+    @_head.setter
+    def _head(self, value):
+        self._state[0] = value
+
+    @property
+    def _size(self):
+        return int(self._state[1])
+
+    @_size.setter
+    def _size(self, value):
+        self._state[1] = value
+
+    def __len__(self):
+        return self._size
+
+    def append(self, chunk):
+        """Append a chunk of samples, discarding the oldest ones beyond capacity"""
+        chunk = np.asarray(chunk, dtype=self._data.dtype).ravel()
+        cap = self.capacity
+        if len(chunk) >= cap:
+            chunk = chunk[-cap:]
+        k = len(chunk)
+        if k == 0:
+            return
+
+        pos = self._head
+        first = min(k, cap - pos)
+        self._data[pos:pos + first] = chunk[:first]
+        self._data[pos + cap:pos + cap + first] = chunk[:first]
+        rest = k - first
+        if rest:
+            self._data[:rest] = chunk[first:]
+            self._data[cap:cap + rest] = chunk[first:]
+
+        self._head = (pos + k) % cap
+        self._size = min(self._size + k, cap)
+
+    def view(self):
+        """Read-only contiguous view of the buffered samples, oldest first (no copy)"""
+        start = (self._head - self._size) % self.capacity
+        window = self._data[start:start + self._size]
+        window.flags.writeable = False
+        return window
+
+    def last(self, n):
+        """Read-only view of the newest n samples (or fewer if not buffered yet)"""
+        if n <= 0:
+            return self._data[:0]
+        return self.view()[-n:]
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+
+# ----- Filter design (cached per parameter set - treat returned arrays as read-only) -----
+@lru_cache(maxsize=32)
+def design_bandpass_sos(lowcut, highcut, fs, order):
+    """Butterworth band-pass in second-order sections (same edge clamping as the legacy filter)"""
+    nyq = 0.5 * fs
+    low = max(lowcut / nyq, 0.01)
+    high = min(highcut / nyq, 0.99)
+    sos = butter(order, [low, high], btype='band', output='sos')
+    return sos
+
+
+@lru_cache(maxsize=32)
+def design_notch_sos(freq, fs, Q):
+    """IIR notch (mains interference) in second-order sections"""
+    b, a = iirnotch(freq / (fs / 2), Q)
+    sos = tf2sos(b, a)
+    return sos
+
+
+@lru_cache(maxsize=32)
+def design_eeg_filter_sos(fs, notch_freq=50.0, notch_q=10.0, lowcut=0.5, highcut=48, order=2):
+    """Notch followed by band-pass as one SOS cascade"""
+    sos = np.vstack([design_notch_sos(notch_freq, fs, notch_q), design_bandpass_sos(lowcut, highcut, fs, order)])
+    return sos
+
+
+def filter_chunk(sos, chunk, zi=None):
+    """
+    Filter one chunk with carried SOS state
+    Returns: (filtered chunk, state for the next chunk); with zi=None the state starts
+    at the steady-state response for the first sample
+    """
+    chunk = np.asarray(chunk, dtype=np.float64)
+    if chunk.size == 0:
+        return chunk, zi
+    if zi is None:
+        zi = sosfilt_zi(sos) * chunk[0]
+    return sosfilt(sos, chunk, zi=zi)
+
+
+class StreamingFilter:
+    """
+    Notch + band-pass cascade applied chunk by chunk with carried filter state
+
+    Coefficients come from the design cache, so constructing one per device is cheap.
+    The state is initialised to the steady-state response for the first sample
+    (scipy.signal.sosfilt_zi), which avoids a start-up step transient.
+
+    Tolerance: feeding a stream in any chunking gives the same output as filtering
+    the concatenated stream offline with
+        sosfilt(sos, x, zi=sosfilt_zi(sos) * x[0])
+    to float64 round-off (max abs difference below 1e-9 for normalised EEG; in
+    practice the outputs are identical). With zero initial state the cascade also
+    matches the legacy lfilter(b, a) notch -> band-pass chain to about 1e-13.
+    """
+
+    def __init__(self, fs, notch_freq=50.0, notch_q=10.0, lowcut=0.5, highcut=48, order=2):
+        self.sos = design_eeg_filter_sos(fs, notch_freq, notch_q, lowcut, highcut, order)
+        self.zi = None
+
+    def process(self, chunk):
+        """Filter only the new samples and keep the state for the next chunk"""
+        filtered, self.zi = filter_chunk(self.sos, chunk, self.zi)
+        return filtered
+
+    def reset(self):
+        self.zi = None
+
+
+# ----- Spectral analysis -----
+class SpectralPlan:
+    """
+    Precomputed spectral setup for a fixed (n, fs, bands) combination
+
+    Holds the Hamming window, its power normalisation and each band's contiguous
+    bin range, so computing all band powers is one FFT plus one np.add.reduceat.
+    Bands are inclusive on both edges (freq >= low and freq <= high), like the
+    original per-band boolean masks.
+
+    mode="periodogram": one Hamming-windowed FFT over the whole signal (legacy output).
+    mode="welch": average of 50%-overlapping segments of `segment` samples, each
+    detrended and windowed, rescaled by n / segment so results stay in the same
+    units as the periodogram for a signal of length n.
+
+    band_powers() accepts a 1-D signal or a 2-D (rows, n) matrix, so offline tools
+    can score many windows in one call.
+    """
+
+    def __init__(self, n, fs, bands, mode="periodogram", segment=None, overlap=0.5):
+        if mode not in ("periodogram", "welch"):
+            raise ValueError(f"Unknown spectral mode: {mode}")
+        self.n = int(n)
+        self.fs = fs
+        self.mode = mode
+        self.band_names = [name for name, _ in bands]
+
+        if mode == "welch":
+            self.segment = int(segment or max(self.n // 2, 1))
+            self.step = max(int(self.segment * (1 - overlap)), 1)
+            fft_len = self.segment
+        else:
+            self.segment = self.n
+            self.step = self.n
+            fft_len = self.n
+
+        self.window = np.hamming(fft_len)
+        # Same normalisation as before: N * mean(window**2) == sum(window**2)
+        self.norm = float(np.sum(self.window ** 2))
+        self.scale = self.n / fft_len
+        self.freqs = np.fft.rfftfreq(fft_len, 1 / fs)
+
+        starts = np.searchsorted(self.freqs, [low for _, (low, _) in bands], side="left")
+        stops = np.searchsorted(self.freqs, [high for _, (_, high) in bands], side="right")
+        self.empty = stops <= starts
+        # reduceat needs every index < length; pad one zero bin when a band reaches the end
+        self._pad = bool(np.any(stops >= len(self.freqs)))
+        starts = np.minimum(starts, len(self.freqs) - 1 + self._pad)
+        self._indices = np.column_stack([starts, stops]).ravel()
+
+    def band_powers(self, signal):
+        """Band powers for one signal (-> (bands,)) or a matrix of signals (-> (rows, bands))"""
+        x = np.asarray(signal, dtype=np.float64)
+        if self.mode == "welch":
+            x = np.lib.stride_tricks.sliding_window_view(x, self.segment, axis=-1)[..., ::self.step, :]
+        x = x - x.mean(axis=-1, keepdims=True)
+        psd = np.abs(np.fft.rfft(x * self.window, axis=-1)) ** 2 / self.norm
+        if self.mode == "welch":
+            psd = psd.mean(axis=-2) * self.scale
+        if self._pad:
+            psd = np.concatenate([psd, np.zeros(psd.shape[:-1] + (1,))], axis=-1)
+
+        # Even slots hold sum(psd[start:stop]) for each band; odd slots are discarded
+        powers = np.add.reduceat(psd, self._indices, axis=-1)[..., ::2]
+        powers[..., self.empty] = 0.0
+        return powers
+
+
+@lru_cache(maxsize=64)
+def get_spectral_plan(n, fs, bands, mode="periodogram", segment=None):
+    """Cached SpectralPlan; bands must be hashable, e.g. tuple(EEG_BANDS.items())"""
+    return SpectralPlan(n, fs, bands, mode=mode, segment=segment)
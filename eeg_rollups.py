@@ -0,0 +1,251 @@
+"""
+EEG Rollups Module
+Per-device 1-minute and 1-hour buckets of eeg_data for the analytics queries
+
+    eeg_rollup_1m / eeg_rollup_1h   one row per (device MAC, bucket start): reading count,
+                                    sum / min / max of each band and of focus, focused
+                                    readings and signal quality counts
+
+The write-behind writer upserts both tables in the same transaction as the eeg_data
+rows they summarise, so a bucket is exactly as current as eeg_data. Averages are
+sum / sample_count; sums (not averages) are stored so batches add up exactly.
+
+fetch_window_totals() answers "everything since start" from the coarsest rows that
+cover the window exactly: raw eeg_data for the partial minute at its start, minute
+buckets up to the first whole hour and after the last one, hour buckets in between.
+A window of any length costs at most ~60 raw rows plus ~120 minute rows plus one row
+per hour.
+"""
+import logging
+from datetime import timedelta
+
+# focus is stored as 0-1; same threshold as the session rollups
+from session_summaries import FOCUSED_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("delta", "theta", "alpha", "beta", "gamma", "focus")
+
+# resolution -> (table, bucket length in seconds)
+RESOLUTIONS = {
+    "1m": ("eeg_rollup_1m", 60),
+    "1h": ("eeg_rollup_1h", 3600),
+}
+
+_METRIC_COLUMNS = ",\n".join(
+    f"    {m}_sum DOUBLE NOT NULL DEFAULT 0,\n    {m}_min FLOAT,\n    {m}_max FLOAT" for m in METRICS
+)
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    mac_address VARCHAR(50) NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    student_id INT,
+    sample_count INT NOT NULL DEFAULT 0,
+""" + _METRIC_COLUMNS + """,
+    focused_count INT NOT NULL DEFAULT 0,
+    good_count INT NOT NULL DEFAULT 0,
+    error_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (mac_address, bucket_start)
+)
+"""
+
+_COLUMNS = ["mac_address", "bucket_start", "student_id", "sample_count"] + [
+    f"{m}_{agg}" for m in METRICS for agg in ("sum", "min", "max")
+] + ["focused_count", "good_count", "error_count"]
+
+_COUNTERS = ["sample_count"] + [f"{m}_sum" for m in METRICS] + ["focused_count", "good_count", "error_count"]
+
+# Adds one set of per-bucket totals to a row (target columns qualified: the backfill
+# below inserts from a GROUP BY over eeg_data, which has columns of the same names)
+_ADD = ",\n        ".join(
+    [f"{{table}}.{c} = {{table}}.{c} + VALUES({c})" for c in _COUNTERS] +
+    [f"{{table}}.{m}_min = LEAST(COALESCE({{table}}.{m}_min, VALUES({m}_min)), VALUES({m}_min))" for m in METRICS] +
+    [f"{{table}}.{m}_max = GREATEST(COALESCE({{table}}.{m}_max, VALUES({m}_max)), VALUES({m}_max))" for m in METRICS] +
+    ["{table}.student_id = COALESCE(VALUES(student_id), {table}.student_id)"]
+)
+
+# Incremental: one batch's per-bucket totals (placeholders only inside VALUES for executemany)
+UPSERT = """
+    INSERT INTO {table} (""" + ", ".join(_COLUMNS) + """)
+    VALUES (""" + ", ".join(f"%({c})s" for c in _COLUMNS) + """)
+    ON DUPLICATE KEY UPDATE
+        """ + _ADD
+
+# Existing history, one eeg_data id range (%(lo)s <= id < %(hi)s) at a time. Ranges add
+# to the buckets they share, so each range must be applied exactly once (the migration
+# commits it in one transaction together with its progress).
+_BUCKET_EXPRESSIONS = {
+    "1m": "{ts} - INTERVAL SECOND({ts}) SECOND",
+    "1h": "{ts} - INTERVAL MINUTE({ts}) MINUTE - INTERVAL SECOND({ts}) SECOND",
+}
+
+_BACKFILL = """
+    INSERT INTO {table} (""" + ", ".join(_COLUMNS) + """)
+    SELECT mac_address, {bucket} AS bucket, MAX(student_id), COUNT(*),
+           """ + ",\n           ".join(
+    f"COALESCE(SUM({m}), 0), MIN({m}), MAX({m})" for m in METRICS
+) + f""",
+           SUM(focus >= {FOCUSED_THRESHOLD}), SUM(signal_quality = 'good'), SUM(signal_quality = 'connection_error')
+    FROM eeg_data
+    WHERE id >= %(lo)s AND id < %(hi)s AND mac_address IS NOT NULL AND timestamp IS NOT NULL
+    GROUP BY mac_address, bucket
+    ON DUPLICATE KEY UPDATE
+        """ + _ADD
+
+BACKFILL = {
+    resolution: _BACKFILL.format(table=table, bucket=_BUCKET_EXPRESSIONS[resolution].format(ts="timestamp"))
+    for resolution, (table, _) in RESOLUTIONS.items()
+}
+
+# Catch-up after a backfill: every bucket touched by an id range, recomputed from all of
+# its eeg_data rows and overwritten. Idempotent, so rows the writer already added to
+# a bucket are not counted twice.
+_RECOMPUTE = """
+    INSERT INTO {table} (""" + ", ".join(_COLUMNS) + """)
+    SELECT e.mac_address, {bucket} AS bucket, MAX(e.student_id), COUNT(*),
+           """ + ",\n           ".join(
+    f"COALESCE(SUM(e.{m}), 0), MIN(e.{m}), MAX(e.{m})" for m in METRICS
+) + f""",
+           SUM(e.focus >= {FOCUSED_THRESHOLD}), SUM(e.signal_quality = 'good'),
+           SUM(e.signal_quality = 'connection_error')
+    FROM (
+        SELECT DISTINCT mac_address, {{touched}} AS touched_start
+        FROM eeg_data
+        WHERE id >= %(lo)s AND id < %(hi)s AND mac_address IS NOT NULL AND timestamp IS NOT NULL
+    ) touched
+    JOIN eeg_data e ON e.mac_address = touched.mac_address
+        AND e.timestamp >= touched.touched_start AND e.timestamp < touched.touched_start + INTERVAL {{seconds}} SECOND
+    GROUP BY e.mac_address, bucket
+    ON DUPLICATE KEY UPDATE
+        """ + ",\n        ".join(f"{{table}}.{c} = VALUES({c})" for c in _COLUMNS[2:])
+
+RECOMPUTE = {
+    resolution: _RECOMPUTE.format(
+        table=table, bucket=_BUCKET_EXPRESSIONS[resolution].format(ts="e.timestamp"),
+        touched=_BUCKET_EXPRESSIONS[resolution].format(ts="timestamp"), seconds=seconds
+    )
+    for resolution, (table, seconds) in RESOLUTIONS.items()
+}
+
+# Totals of every reading of one device since a start time (see fetch_window_totals)
+_PART_COLUMNS = ", ".join(_COUNTERS[:1] + [f"{m}_{agg}" for m in METRICS for agg in ("sum", "min", "max")] + _COUNTERS[-3:])
+WINDOW_TOTALS = """
+    SELECT COALESCE(SUM(sample_count), 0) AS sample_count,
+           """ + ",\n           ".join(
+    f"COALESCE(SUM({m}_sum), 0) AS {m}_sum, MIN({m}_min) AS {m}_min, MAX({m}_max) AS {m}_max" for m in METRICS
+) + """,
+           COALESCE(SUM(focused_count), 0) AS focused_count,
+           COALESCE(SUM(good_count), 0) AS good_count,
+           COALESCE(SUM(error_count), 0) AS error_count
+    FROM (
+        SELECT COUNT(*) AS sample_count,
+               """ + ",\n               ".join(
+    f"SUM({m}) AS {m}_sum, MIN({m}) AS {m}_min, MAX({m}) AS {m}_max" for m in METRICS
+) + f""",
+               SUM(focus >= {FOCUSED_THRESHOLD}) AS focused_count,
+               SUM(signal_quality = 'good') AS good_count,
+               SUM(signal_quality = 'connection_error') AS error_count
+        FROM eeg_data
+        WHERE mac_address = %(mac)s AND timestamp >= %(start)s AND timestamp < %(minute_start)s
+        UNION ALL
+        SELECT {_PART_COLUMNS}
+        FROM eeg_rollup_1m
+        WHERE mac_address = %(mac)s
+          AND ((bucket_start >= %(minute_start)s AND bucket_start < %(hour_start)s) OR bucket_start >= %(hour_end)s)
+        UNION ALL
+        SELECT {_PART_COLUMNS}
+        FROM eeg_rollup_1h
+        WHERE mac_address = %(mac)s AND bucket_start >= %(hour_start)s AND bucket_start < %(hour_end)s
+    ) parts
+"""
+
+# Per-bucket averages for charting, with each bucket's extremes for downsampling
+SERIES = """
+    SELECT bucket_start, sample_count, """ + ", ".join(
+    f"{m}_sum / sample_count AS {m}, {m}_min, {m}_max" for m in METRICS
+) + """
+    FROM {table}
+    WHERE mac_address = %s AND bucket_start >= %s AND sample_count > 0
+    ORDER BY bucket_start ASC
+"""
+
+
+def create_rollup_tables(cursor):
+    for table, _ in RESOLUTIONS.values():
+        cursor.execute(CREATE_TABLE.format(table=table))
+
+
+def bucket_start(timestamp, seconds):
+    """Start of the bucket a reading falls in, as MySQL will store it (DATETIME rounds to the second)"""
+    stored = (timestamp + timedelta(microseconds=500000)).replace(microsecond=0)
+    if seconds == 3600:
+        return stored.replace(minute=0, second=0)
+    return stored.replace(second=0)
+
+
+def rollup_rows(readings, student_ids, resolution):
+    """UPSERT parameter dicts, one per (device, bucket), for a batch of write-behind Readings"""
+    seconds = RESOLUTIONS[resolution][1]
+    rows = {}
+    for r in readings:
+        key = (r.mac_address, bucket_start(r.timestamp, seconds))
+        values = {m: float(r.band_powers[m]) for m in METRICS[:-1]}
+        values["focus"] = float(r.focus)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {
+                "mac_address": r.mac_address, "bucket_start": key[1],
+                "student_id": student_ids.get(r.mac_address), "sample_count": 0,
+                "focused_count": 0, "good_count": 0, "error_count": 0
+            }
+            for m, value in values.items():
+                row.update({f"{m}_sum": 0.0, f"{m}_min": value, f"{m}_max": value})
+        row["sample_count"] += 1
+        for m, value in values.items():
+            row[f"{m}_sum"] += value
+            row[f"{m}_min"] = min(row[f"{m}_min"], value)
+            row[f"{m}_max"] = max(row[f"{m}_max"], value)
+        row["focused_count"] += values["focus"] >= FOCUSED_THRESHOLD
+        row["good_count"] += r.signal_quality == "good"
+        row["error_count"] += r.signal_quality == "connection_error"
+    return list(rows.values())
+
+
+def upsert_rollups(cursor, readings, student_ids):
+    """Add a batch of readings to both rollup tables (call in the eeg_data transaction)"""
+    for resolution, (table, _) in RESOLUTIONS.items():
+        cursor.executemany(UPSERT.format(table=table), rollup_rows(readings, student_ids, resolution))
+
+
+def fetch_window_totals(cursor, mac_address, start, end):
+    """
+    Totals of a device's readings with timestamp >= start (up to `end`, normally now):
+    sample_count, <metric>_sum / _min / _max, focused_count, good_count, error_count
+    One query over raw rows for the partial first minute and the 1m / 1h buckets after it
+    """
+    if start.microsecond:
+        # Stored timestamps are whole seconds
+        start = start.replace(microsecond=0) + timedelta(seconds=1)
+    minute_start = start if start.second == 0 else start.replace(second=0) + timedelta(minutes=1)
+    hour_start = minute_start if minute_start.minute == 0 else minute_start.replace(minute=0) + timedelta(hours=1)
+    hour_end = end.replace(minute=0, second=0, microsecond=0)
+    if hour_start >= hour_end:
+        # No whole hour inside the window - minute buckets all the way
+        hour_start = hour_end = minute_start
+
+    cursor.execute(WINDOW_TOTALS, {
+        "mac": mac_address, "start": start, "minute_start": minute_start,
+        "hour_start": hour_start, "hour_end": hour_end
+    })
+    return cursor.fetchone()
+
+
+def fetch_bucket_series(cursor, mac_address, start, resolution):
+    """
+    Per-bucket rows since start: bucket_start, sample_count and, per metric, the average
+    (<metric>) and the extremes (<metric>_min / <metric>_max)
+    """
+    table, seconds = RESOLUTIONS[resolution]
+    cursor.execute(SERIES.format(table=table), (mac_address, bucket_start(start, seconds)))
+    return cursor.fetchall()
@@ -0,0 +1,67 @@
+"""
+Gunicorn Configuration
+Loaded automatically from the working directory (or explicitly with -c gunicorn.conf.py)
+
+preload_app imports app.py once in the master and runs the lifecycle preload hooks
+(ML model) before forking, so the workers share those pages copy-on-write. Each worker
+then runs the worker hooks: database schema check, background threads and a warm-up
+prediction. Command-line flags still override anything set here.
+
+Schema migrations are not run here: run `python migrations.py` before starting the
+server (Procfile `release:` / Render pre-deploy command). Workers report not ready on
+/ready until it has completed.
+
+Device state lives in shared memory by default here (EEG_DEVICE_STATE=shared), created
+by the master during preload, so every worker sees the same statuses and sample windows.
+
+EEG_DSP_SHARDS=<n> also forks n DSP processes from the master during preload (see
+dsp_engine.py); each device's uploads are processed by one of them. The web workers
+then mostly wait on I/O, so a couple of workers with more threads is usually enough.
+
+Thread budget per worker (gthread: every request, including a long-lived one, holds a
+thread until it ends):
+
+    EEG_WS_MAX_CHANNELS       open /ws/ingest headset channels   (default 40)
+    EEG_SSE_MAX_STREAMS       open /api/stream dashboards         (default 16)
+    GUNICORN_REQUEST_THREADS  /upload, dashboard and API requests (default 8)
+
+threads is the sum, so full channel and stream caps never starve ordinary requests.
+Past its cap a worker closes new channels with 1013 (headsets fall back to /upload)
+and answers new streams with 503 (dashboards fall back to polling). Capacity of an
+instance is workers x cap: 2 x 40 = 80 headsets and 2 x 16 = 32 live dashboards by
+default, with 40 + 16 + 8 = 64 threads per worker. Idle threads cost little
+beyond their stack, so raise the caps rather than GUNICORN_THREADS, which overrides the
+sum and should only be set with the budget above in mind.
+"""
+import os
+
+os.environ.setdefault("EEG_DEVICE_STATE", "shared")
+os.environ.setdefault("EEG_WS_MAX_CHANNELS", "40")
+os.environ.setdefault("EEG_SSE_MAX_STREAMS", "16")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+threads = int(os.getenv("GUNICORN_THREADS", (
+    int(os.environ["EEG_WS_MAX_CHANNELS"]) + int(os.environ["EEG_SSE_MAX_STREAMS"])
+    + int(os.getenv("GUNICORN_REQUEST_THREADS", 8))
+)))
+timeout = 120
+preload_app = True
+
+
+def when_ready(server):
+    """Master process, after the app is imported and before the first worker is forked"""
+    if server.cfg.preload_app:
+        import lifecycle
+        lifecycle.run_preload()
+
+
+def post_worker_init(worker):
+    """Worker process, after the app is loaded and before it accepts requests"""
+    import lifecycle
+    lifecycle.run_worker_start()
+
+
+def worker_exit(server, worker):
+    import lifecycle
+    lifecycle.run_shutdown()
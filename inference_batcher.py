@@ -0,0 +1,147 @@
+"""
+Inference Batcher Module
+Micro-batches ML predictions from all devices into one predict_proba call
+
+Request threads submit a single feature row and wait; a background thread
+collects rows for up to max_wait seconds (or max_batch rows), runs one
+predict_proba over the stacked matrix, derives each label as
+classes_[argmax(proba)] and hands every caller its own row.
+"""
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingPrediction:
+    __slots__ = ("features", "done", "label", "proba", "error")
+
+    def __init__(self, features):
+        self.features = features
+        self.done = threading.Event()
+        self.label = None
+        self.proba = None
+        self.error = None
+
+
+class InferenceBatcher:
+    """Collects single-row predictions from many request threads into batched model calls"""
+
+    def __init__(self, model_getter, max_batch=64, max_wait=0.03, timeout=2.0):
+        """
+        Args:
+            model_getter: callable returning the current model (or None); read at call time
+                so a model loaded after startup is picked up
+            max_batch: flush as soon as this many rows are waiting
+            max_wait: seconds to wait for more rows after the first one arrives
+            timeout: seconds a caller waits for its batch before predicting on its own
+        """
+        self.model_getter = model_getter
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "rows": 0,
+            "max_batch_rows": 0,
+            "sync_predictions": 0,
+            "errors": 0,
+            "last_batch_ms": None
+        }
+
+    @property
+    def enabled(self):
+        return self.max_wait > 0 and self.max_batch > 1
+
+    def start(self):
+        """Start the batching thread (safe to call repeatedly, e.g. after a fork)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+            self._thread.start()
+            logger.info(f"🤖 Started inference batcher (max {self.max_batch} rows / {self.max_wait * 1000:.0f} ms)")
+
+    def predict(self, features):
+        """
+        Predict one (1, n_features) row
+        Returns: (label, probabilities) or None when no model is loaded
+        """
+        model = self.model_getter()
+        if model is None:
+            return None
+
+        if not self.enabled:
+            return self._predict_sync(model, features)
+
+        self.start()
+        pending = _PendingPrediction(features)
+        self._queue.put(pending)
+        if not pending.done.wait(self.timeout):
+            # Batch thread stalled - don't hold the request any longer
+            logger.warning("⚠️ Inference batch timed out, predicting synchronously")
+            return self._predict_sync(model, features)
+        if pending.error is not None:
+            raise pending.error
+        return pending.label, pending.proba
+
+    def stats(self):
+        rows, batches = self._stats["rows"], self._stats["batches"]
+        return dict(
+            self._stats,
+            queue_depth=self._queue.qsize(),
+            avg_batch_rows=round(rows / batches, 2) if batches else 0,
+            running=self._thread is not None and self._thread.is_alive()
+        )
+
+    def _predict_sync(self, model, features):
+        self._stats["sync_predictions"] += 1
+        proba = model.predict_proba(features)[0]
+        return model.classes_[int(np.argmax(proba))], proba
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        started = time.monotonic()
+        try:
+            model = self.model_getter()
+            if model is None:
+                raise RuntimeError("ML model unloaded")
+            matrix = np.vstack([p.features for p in batch])
+            probas = model.predict_proba(matrix)
+            labels = model.classes_[np.argmax(probas, axis=1)]
+            for pending, label, proba in zip(batch, labels, probas):
+                pending.label = label
+                pending.proba = proba
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.error(f"❌ Batched inference failed ({len(batch)} rows): {e}")
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+        self._stats["batches"] += 1
+        self._stats["rows"] += len(batch)
+        self._stats["max_batch_rows"] = max(self._stats["max_batch_rows"], len(batch))
+        self._stats["last_batch_ms"] = round((time.monotonic() - started) * 1000, 2)
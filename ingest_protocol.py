@@ -0,0 +1,120 @@
+"""
+Ingest Protocol Module
+Binary sample frame format used by headsets to upload raw ADC samples
+
+Frame layout (little-endian):
+    magic        2 bytes   b"EG"
+    version      uint8     FRAME_VERSION
+    flags        uint8     bit 0 set -> samples are int16, clear -> uint16
+    mac          6 bytes   device MAC address (raw bytes)
+    sequence     uint32    per-device frame counter (wraps at 2**32)
+    count        uint16    number of samples that follow
+    samples      count * 2 bytes
+
+Several frames may be concatenated in one request body.
+"""
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+FRAME_MAGIC = b"EG"
+FRAME_VERSION = 1
+FLAG_SIGNED = 0x01
+
+FRAME_HEADER = struct.Struct("<2sBB6sIH")
+
+# Content types accepted on /upload for binary frames
+BINARY_FRAME_MIMETYPES = ("application/octet-stream", "application/x-eeg-frame")
+
+# Device identifiers are stored in VARCHAR(50) columns (students.device_mac, eeg_data.mac_address)
+# and in fixed-size device state slots
+MAC_ADDRESS_MAX_LENGTH = 50
+
+_SAMPLE_DTYPES = {
+    0: np.dtype("<u2"),
+    FLAG_SIGNED: np.dtype("<i2"),
+}
+
+SampleFrame = namedtuple("SampleFrame", ["mac_address", "sequence", "samples"])
+
+
+class FrameError(ValueError):
+    """Raised when a binary sample frame is malformed"""
+
+
+def format_mac(mac_bytes):
+    """Format 6 raw MAC bytes the way the ESP32 reports them (AA:BB:CC:DD:EE:FF)"""
+    return ":".join(f"{b:02X}" for b in mac_bytes)
+
+
+def normalize_mac_address(value):
+    """
+    Device identifier from a JSON upload, without surrounding whitespace
+    Raises ValueError unless it is 1 to MAC_ADDRESS_MAX_LENGTH printable ASCII characters
+    """
+    if not isinstance(value, str):
+        raise ValueError("MAC address must be a string")
+    mac_address = value.strip()
+    if not mac_address:
+        raise ValueError("MAC address required")
+    if len(mac_address) > MAC_ADDRESS_MAX_LENGTH:
+        raise ValueError(f"MAC address longer than {MAC_ADDRESS_MAX_LENGTH} characters")
+    if not (mac_address.isascii() and mac_address.isprintable()):
+        raise ValueError("MAC address must be printable ASCII")
+    return mac_address
+
+
+def parse_mac(mac_address):
+    """Convert an 'AA:BB:CC:DD:EE:FF' string back into 6 raw bytes"""
+    parts = mac_address.replace("-", ":").split(":")
+    if len(parts) != 6:
+        raise FrameError(f"Invalid MAC address: {mac_address}")
+    return bytes(int(p, 16) for p in parts)
+
+
+def decode_sample_frame(buffer, offset=0):
+    """
+    Decode one frame starting at offset
+    Returns (SampleFrame, next_offset); samples is a read-only view into buffer
+    """
+    if len(buffer) - offset < FRAME_HEADER.size:
+        raise FrameError("Truncated frame header")
+
+    magic, version, flags, mac_bytes, sequence, count = FRAME_HEADER.unpack_from(buffer, offset)
+    if magic != FRAME_MAGIC:
+        raise FrameError("Bad frame magic")
+    if version != FRAME_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+
+    dtype = _SAMPLE_DTYPES[flags & FLAG_SIGNED]
+    start = offset + FRAME_HEADER.size
+    end = start + count * dtype.itemsize
+    if end > len(buffer):
+        raise FrameError(f"Frame declares {count} samples but body is truncated")
+
+    samples = np.frombuffer(buffer, dtype=dtype, count=count, offset=start)
+    return SampleFrame(format_mac(mac_bytes), sequence, samples), end
+
+
+def iter_sample_frames(buffer):
+    """Yield every frame in a body made of one or more concatenated frames"""
+    offset = 0
+    while offset < len(buffer):
+        frame, offset = decode_sample_frame(buffer, offset)
+        yield frame
+
+
+def encode_sample_frame(mac_address, sequence, samples, signed=False):
+    """Build a frame (used by device simulators and firmware test tools)"""
+    dtype = _SAMPLE_DTYPES[FLAG_SIGNED if signed else 0]
+    body = np.asarray(samples).astype(dtype, copy=False).tobytes()
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC,
+        FRAME_VERSION,
+        FLAG_SIGNED if signed else 0,
+        parse_mac(mac_address),
+        sequence & 0xFFFFFFFF,
+        len(body) // dtype.itemsize,
+    )
+    return header + body
@@ -0,0 +1,147 @@
+"""
+Application Lifecycle Module
+Startup / shutdown hooks shared by `python app.py` and gunicorn (see gunicorn.conf.py)
+
+Hooks run in three phases:
+    preload   once in the gunicorn master before workers are forked (preload_app = True),
+              for read-only state such as the ML model, so every worker shares those
+              pages copy-on-write instead of loading its own copy
+    worker    once in every worker process after the fork: warm-up and background
+              threads (threads and DB connection pools don't survive a fork, and
+              OpenMP-based libraries must not run before one)
+    shutdown  when a worker exits, e.g. to flush queued writes
+
+Without preload (or under `python app.py`) run_worker_start() runs the preload phase
+first in the same process; app.py also calls it on the first request when no server
+hook did. Each hook's outcome is recorded and reported by /ready.
+
+A required worker hook that fails (e.g. MySQL briefly unreachable at boot, or the
+release step still migrating) is retried with exponential backoff each time /ready
+asks - health checks poll it - and the worker becomes ready once it succeeds.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("preload", "worker", "shutdown")
+
+_hooks = {phase: [] for phase in PHASES}
+_results = {phase: {} for phase in PHASES}
+_completed = {phase: False for phase in PHASES}
+_lock = threading.RLock()  # first requests may race to run the worker phase lazily
+_started_at = time.time()
+_retries = {}  # failed required worker hook name -> (attempts, time.monotonic() of the next attempt)
+
+RETRY_FIRST_SECONDS = 1
+RETRY_MAX_SECONDS = 60
+
+
+def _register(phase, func=None, required=False):
+    def decorator(f):
+        _hooks[phase].append((f.__name__, f, required))
+        return f
+    return decorator(func) if func is not None else decorator
+
+
+def on_preload(func=None, required=False):
+    """Register a hook for the master process, before fork (decorator)"""
+    return _register("preload", func, required)
+
+
+def on_worker_start(func=None, required=False):
+    """Register a hook for each worker process, after fork (decorator)"""
+    return _register("worker", func, required)
+
+
+def on_shutdown(func=None, required=False):
+    """Register a hook for worker exit (decorator)"""
+    return _register("shutdown", func, required)
+
+
+def _run_phase(phase):
+    with _lock:
+        if _completed[phase]:
+            return
+        _execute(phase)
+        _completed[phase] = True
+
+
+def _run_hook(phase, name, func, required):
+    started = time.monotonic()
+    try:
+        detail = func()
+        _results[phase][name] = {"ok": True, "required": required, "detail": detail}
+        _retries.pop(name, None)
+    except Exception as e:
+        logger.error(f"❌ {phase} hook '{name}' failed: {e}")
+        _results[phase][name] = {"ok": False, "required": required, "error": str(e)}
+        if required and phase == "worker":
+            attempts = _retries.get(name, (0, 0))[0] + 1
+            delay = min(RETRY_MAX_SECONDS, RETRY_FIRST_SECONDS * 2 ** (attempts - 1))
+            _retries[name] = (attempts, time.monotonic() + delay)
+            _results[phase][name].update(attempts=attempts, retry_in_seconds=delay)
+    _results[phase][name]["ms"] = round((time.monotonic() - started) * 1000, 1)
+
+
+def _execute(phase):
+    for name, func, required in _hooks[phase]:
+        _run_hook(phase, name, func, required)
+    logger.info(f"🔁 Lifecycle '{phase}' phase done in pid {os.getpid()} ({len(_hooks[phase])} hook(s))")
+
+
+def run_preload():
+    """Run preload hooks (no-op when they already ran, including in the parent before fork)"""
+    _run_phase("preload")
+
+
+def run_worker_start():
+    """Run worker hooks in this process (runs the preload phase first if it never ran)"""
+    run_preload()
+    _run_phase("worker")
+
+
+def run_shutdown():
+    _run_phase("shutdown")
+
+
+def worker_started():
+    return _completed["worker"]
+
+
+def retry_failed_hooks():
+    """Re-run failed required worker hooks whose backoff has elapsed"""
+    if not _retries:
+        return
+    with _lock:
+        now = time.monotonic()
+        for name, func, required in _hooks["worker"]:
+            retry = _retries.get(name)
+            if retry is not None and retry[1] <= now:
+                logger.info(f"🔁 Retrying worker hook '{name}' (attempt {retry[0] + 1})")
+                _run_hook("worker", name, func, required)
+
+
+def readiness():
+    """
+    Readiness of this process for /ready
+    Ready once the worker phase has run and no required hook failed (failed ones are
+    retried first, see retry_failed_hooks); optional hook failures (e.g. no ML model)
+    only mark the process as degraded
+    """
+    retry_failed_hooks()
+    hooks = {phase: dict(_results[phase]) for phase in ("preload", "worker")}
+    failed = [f"{phase}.{name}" for phase, results in hooks.items()
+              for name, result in results.items() if not result["ok"]]
+    required_failed = [f"{phase}.{name}" for phase, results in hooks.items()
+                       for name, result in results.items() if not result["ok"] and result["required"]]
+    return {
+        "ready": _completed["worker"] and not required_failed,
+        "degraded": bool(failed),
+        "failed_hooks": failed,
+        "hooks": hooks,
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.time() - _started_at, 1)
+    }
@@ -0,0 +1,554 @@
+"""
+Schema Migrations Module
+Baseline tables and versioned schema changes, applied once per deploy by `python migrations.py`
+
+The CREATE TABLE IF NOT EXISTS statements in BASELINE_TABLES are the baseline schema;
+they never touch a table that already exists. Everything after the baseline is a
+migration registered here with @migration(version, name). Applied versions are recorded
+in schema_migrations, and each migration checks information_schema before changing
+anything, so a migration interrupted halfway (DDL commits implicitly in MySQL) is
+simply re-run. The runner holds a MySQL named lock, so two deploys can't interleave.
+
+Migrations run as a release step (Procfile `release:`, Render pre-deploy command), not
+in gunicorn workers: a backfill over the whole history can take far longer than a
+worker's boot timeout. Workers only call pending_migrations() and stay unready (/ready
+returns 503) until the schema is up to date. Backfills go through backfill_in_chunks:
+one id range per explicit transaction (connections are opened with autocommit on),
+committed together with the migration's progress, so a run can stop anywhere
+(--max-seconds, a crash, a deploy timeout) and the next one continues from the last
+committed range.
+
+The previous release keeps storing readings until the new workers take over, and it
+knows nothing of the new columns and tables. A backfill therefore schedules a catch-up
+(registered with catchup()) from where it stopped: CATCHUP_DELAY_SECONDS later, once the old instances
+have stopped and flushed, one new worker re-applies an idempotent form of the backfill
+to every row stored since (run_due_catchups).
+
+    python migrations.py                   create the baseline and apply pending migrations
+    python migrations.py --max-seconds N   stop between backfill chunks after N seconds (exit 2)
+    python migrations.py --check           EXPLAIN every query in HOT_QUERIES, exit 1 on a full scan
+"""
+import logging
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import mysql.connector  # Only for error handling
+
+# Import centralized database connection
+from db import get_db_connection
+
+# Baseline summary tables (student_summaries is filled from eeg_data by migration 5)
+from student_summaries import (
+    BACKFILL_CHUNK as SUMMARY_BACKFILL, RECOMPUTE as SUMMARY_RECOMPUTE, create_student_summaries
+)
+from session_summaries import create_session_summaries
+
+# Tables introduced by migrations
+from eeg_rollups import BACKFILL as ROLLUP_BACKFILL, RECOMPUTE as ROLLUP_RECOMPUTE, WINDOW_TOTALS, create_rollup_tables
+from attention_tracker import CREATE_TABLE as CREATE_ATTENTION_PERIODS
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK = "eeg_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 30  # seconds to wait for another deploy's run before failing
+
+BACKFILL_CHUNK_ROWS = 50000  # ids per backfill transaction
+
+CATCHUP_LOCK = "eeg_schema_catchups"
+CATCHUP_DELAY_SECONDS = 600  # after a backfill, before the rows stored since are re-applied
+
+Migration = namedtuple("Migration", ["version", "name", "apply"])
+MIGRATIONS = []
+
+# name -> (table, statements bounded by %(lo)s <= id < %(hi)s; safe to apply repeatedly)
+Catchup = namedtuple("Catchup", ["table", "statements"])
+CATCHUPS = {}
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    applied_at DATETIME NOT NULL
+)
+"""
+
+# Next id to backfill, per (migration, table), while a migration is partly applied
+CREATE_PROGRESS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migration_progress (
+    version INT NOT NULL,
+    table_name VARCHAR(64) NOT NULL,
+    next_id BIGINT NOT NULL,
+    PRIMARY KEY (version, table_name)
+)
+"""
+
+# Catch-ups scheduled by backfills, with the first id they still have to cover
+CREATE_CATCHUP_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_catchups (
+    name VARCHAR(64) PRIMARY KEY,
+    next_id BIGINT NOT NULL,
+    due_at DATETIME NOT NULL
+)
+"""
+
+# Order matters: students and monitoring_sessions first (referenced by foreign keys)
+BASELINE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS students (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100),
+        device_mac VARCHAR(50) UNIQUE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS monitoring_sessions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        teacher_name VARCHAR(100),
+        subject VARCHAR(100),
+        start_time DATETIME,
+        end_time DATETIME,
+        active BOOLEAN DEFAULT TRUE,
+        INDEX idx_active (active)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS raw_data (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        timestamp DATETIME,
+        adc_value INT,
+        mac_address VARCHAR(50),
+        student_id INT,
+        INDEX idx_timestamp (timestamp),
+        INDEX idx_mac (mac_address),
+        FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE SET NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS eeg_data (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        timestamp DATETIME,
+        delta FLOAT,
+        theta FLOAT,
+        alpha FLOAT,
+        beta FLOAT,
+        gamma FLOAT,
+        focus FLOAT,
+        signal_quality VARCHAR(20),
+        mac_address VARCHAR(50),
+        student_id INT,
+        INDEX idx_timestamp (timestamp),
+        INDEX idx_mac (mac_address),
+        FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE SET NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        student_id INT,
+        session_name VARCHAR(100),
+        start_time DATETIME,
+        end_time DATETIME,
+        active BOOLEAN DEFAULT TRUE,
+        monitoring_session_id INT,
+        FOREIGN KEY (student_id) REFERENCES students(id),
+        FOREIGN KEY (monitoring_session_id) REFERENCES monitoring_sessions(id) ON DELETE SET NULL
+    )
+    """,
+]
+
+
+class MigrationPaused(Exception):
+    """A backfill ran out of the run's time budget; the next run resumes it"""
+
+
+_deadline = None  # time.monotonic() after which backfills stop, for this run
+
+
+def migration(version, name):
+    """Register func(db, cursor) as schema migration `version` (decorator)"""
+    def decorator(func):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, func))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+    return decorator
+
+
+def catchup(name, table, statements):
+    """Register an idempotent re-application of a backfill, scheduled by backfill_in_chunks"""
+    if name in CATCHUPS:
+        raise ValueError(f"Duplicate catch-up {name}")
+    CATCHUPS[name] = Catchup(table, statements)
+
+
+# ----- Idempotent DDL helpers -----
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def add_column(cursor, table, column, definition):
+    """Add a column unless it exists; returns True when it was added"""
+    if column_exists(cursor, table, column):
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info(f"🧱 Added {table}.{column}")
+    return True
+
+
+def add_index(cursor, table, index, columns):
+    """Add an index unless one with that name exists; returns True when it was added"""
+    if index_exists(cursor, table, index):
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} ({', '.join(columns)})")
+    logger.info(f"🧱 Added index {table}.{index} ({', '.join(columns)})")
+    return True
+
+
+def create_baseline_schema(db, cursor):
+    for statement in BASELINE_TABLES:
+        cursor.execute(statement)
+    # Per-device summary counters
+    create_student_summaries(cursor)
+    db.commit()
+    # Per-session rollups
+    create_session_summaries(cursor)
+    db.commit()
+
+
+def _apply_in_chunks(db, cursor, lo, last_id, statements, save_progress):
+    """
+    Run statements for ids lo..last_id, one BACKFILL_CHUNK_ROWS range per transaction;
+    save_progress(next_id) runs in the same transaction. Returns rows changed.
+    Raises MigrationPaused when the run's --max-seconds budget is used up.
+    """
+    changed = 0
+    while lo <= last_id:
+        if _deadline is not None and time.monotonic() >= _deadline:
+            raise MigrationPaused(f"paused at id {lo} of {last_id}")
+        params = {"lo": lo, "hi": lo + BACKFILL_CHUNK_ROWS}
+        db.start_transaction()
+        try:
+            for statement in statements:
+                cursor.execute(statement, params)
+                changed += cursor.rowcount
+            save_progress(params["hi"])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        lo = params["hi"]
+    return changed
+
+
+def backfill_in_chunks(db, cursor, version, table, statements, catchup_name=None):
+    """
+    Run statements (each bounded by %(lo)s <= id < %(hi)s) over `table` one id range at
+    a time, committing each range together with the migration's progress so it is
+    applied exactly once however often the run is interrupted; returns rows changed
+    catchup_name: the registered catch-up to schedule for the rows stored after the backfill
+    """
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    last_id = cursor.fetchone()[0]
+    cursor.execute(
+        "SELECT next_id FROM schema_migration_progress WHERE version = %s AND table_name = %s", (version, table)
+    )
+    row = cursor.fetchone()
+    lo = row[0] if row else 0
+    if lo:
+        logger.info(f"🧱 Resuming {table} backfill at id {lo} of {last_id}")
+
+    def save_progress(next_id):
+        cursor.execute("""
+            INSERT INTO schema_migration_progress (version, table_name, next_id) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE next_id = VALUES(next_id)
+        """, (version, table, next_id))
+
+    try:
+        changed = _apply_in_chunks(db, cursor, lo, last_id, statements, save_progress)
+    except MigrationPaused as e:
+        raise MigrationPaused(f"Migration {version} {e} ({table})")
+
+    if catchup_name is not None:
+        # Rows from last_id on were (or will be) stored by the previous release
+        cursor.execute("""
+            INSERT INTO schema_catchups (name, next_id, due_at)
+            VALUES (%s, %s, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE next_id = LEAST(next_id, VALUES(next_id)), due_at = VALUES(due_at)
+        """, (catchup_name, max(lo, last_id + 1), CATCHUP_DELAY_SECONDS))
+        db.commit()
+    return changed
+
+
+def run_due_catchups(db):
+    """
+    Apply every catch-up that is due, from its next_id to the table's current end (one
+    worker at a time; the others skip). Returns the number of catch-ups still scheduled.
+    """
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (CATCHUP_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            return 1  # another worker is on it; check again later
+        try:
+            cursor.execute("SELECT name, next_id FROM schema_catchups WHERE due_at <= NOW()")
+            for name, next_id in cursor.fetchall():
+                table, statements = CATCHUPS[name]
+                cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+                last_id = cursor.fetchone()[0]
+                logger.info(f"🧱 Catching up {name} on {table} ids {next_id}..{last_id}")
+                changed = _apply_in_chunks(db, cursor, next_id, last_id, statements, lambda hi: cursor.execute(
+                    "UPDATE schema_catchups SET next_id = %s WHERE name = %s", (hi, name)
+                ))
+                cursor.execute("DELETE FROM schema_catchups WHERE name = %s", (name,))
+                db.commit()
+                logger.info(f"✅ Catch-up {name} done ({changed} row change(s))")
+            cursor.execute("SELECT COUNT(*) FROM schema_catchups")
+            return cursor.fetchone()[0]
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (CATCHUP_LOCK,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+# ----- Migrations (append only; never renumber or edit one that has shipped) -----
+# The session whose time range contains a row (the newest one where sessions overlap);
+# only untagged rows, so re-applying a range changes nothing
+TAG_SESSIONS = """
+    UPDATE {table} SET monitoring_session_id = (
+        SELECT MAX(ms.id) FROM monitoring_sessions ms
+        WHERE {table}.timestamp BETWEEN ms.start_time AND COALESCE(ms.end_time, NOW())
+    )
+    WHERE id >= %(lo)s AND id < %(hi)s AND monitoring_session_id IS NULL
+"""
+
+for _table in ("raw_data", "eeg_data"):
+    catchup(f"session_tags_{_table}", _table, [TAG_SESSIONS.format(table=_table)])
+
+
+@migration(1, "Tag raw_data and eeg_data rows with their monitoring session")
+def tag_readings_with_session(db, cursor):
+    for table in ("raw_data", "eeg_data"):
+        add_column(cursor, table, "monitoring_session_id", "INT")
+        add_index(cursor, table, "idx_session_mac_time", ("monitoring_session_id", "mac_address", "timestamp"))
+        tagged = backfill_in_chunks(db, cursor, 1, table, [TAG_SESSIONS.format(table=table)],
+                                    catchup_name=f"session_tags_{table}")
+        logger.info(f"🧱 Backfilled monitoring_session_id on {tagged} {table} row(s)")
+
+
+@migration(2, "Composite (mac_address, timestamp) and (student_id, timestamp) indexes on eeg_data")
+def eeg_data_time_indexes(db, cursor):
+    # Per-device recent readings and the live snapshot backfill
+    add_index(cursor, "eeg_data", "idx_mac_time", ("mac_address", "timestamp"))
+    # Per-student analytics windows (also serves the student_id foreign key)
+    add_index(cursor, "eeg_data", "idx_student_time", ("student_id", "timestamp"))
+
+
+catchup("eeg_rollups", "eeg_data", list(ROLLUP_RECOMPUTE.values()))
+
+
+@migration(3, "Per-device 1-minute and 1-hour eeg_data rollups")
+def eeg_rollup_tables(db, cursor):
+    create_rollup_tables(cursor)
+    # Minute and hour buckets both straight from eeg_data, one id range at a time
+    changed = backfill_in_chunks(db, cursor, 3, "eeg_data", list(ROLLUP_BACKFILL.values()),
+                                 catchup_name="eeg_rollups")
+    logger.info(f"📊 Backfilled eeg rollups ({changed} bucket row change(s))")
+
+
+@migration(4, "attention_periods table for periods closed by the ingest-side tracker")
+def attention_periods_table(db, cursor):
+    cursor.execute(CREATE_ATTENTION_PERIODS)
+
+
+catchup("student_summaries", "eeg_data", [SUMMARY_RECOMPUTE])
+
+
+@migration(5, "Fill student_summaries from existing eeg_data")
+def student_summaries_backfill(db, cursor):
+    cursor.execute("SELECT COUNT(*) FROM schema_migration_progress WHERE version = 5")
+    resuming = cursor.fetchone()[0] > 0
+    cursor.execute("SELECT COUNT(*) FROM student_summaries")
+    if cursor.fetchone()[0] and not resuming:
+        # Filled by the one-statement backfill of earlier releases and kept current since
+        logger.info("📇 student_summaries already filled - nothing to backfill")
+        return
+    changed = backfill_in_chunks(db, cursor, 5, "eeg_data", [SUMMARY_BACKFILL], catchup_name="student_summaries")
+    logger.info(f"📇 Backfilled student summaries from eeg_data ({changed} row change(s))")
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending_migrations(cursor):
+    """Versions not applied yet (all of them before the first run); read-only, for worker startup"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'schema_migrations'
+    """)
+    done = applied_versions(cursor) if cursor.fetchone()[0] else set()
+    return [m.version for m in MIGRATIONS if m.version not in done]
+
+
+def apply_migrations(db, max_seconds=None):
+    """
+    Create the baseline tables and apply pending migrations in version order
+    Returns the versions applied by this call. Raises on the first failure, and
+    MigrationPaused when max_seconds ran out inside a backfill (run again to resume).
+    """
+    global _deadline
+    cursor = db.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise RuntimeError("Schema migrations are locked by another process")
+
+    _deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+    applied = []
+    try:
+        create_baseline_schema(db, cursor)
+        cursor.execute(CREATE_TABLE)
+        cursor.execute(CREATE_PROGRESS_TABLE)
+        cursor.execute(CREATE_CATCHUP_TABLE)
+        done = applied_versions(cursor)
+        for m in MIGRATIONS:
+            if m.version in done:
+                continue
+            started = datetime.now()
+            logger.info(f"🧱 Applying migration {m.version}: {m.name}")
+            m.apply(db, cursor)
+            db.start_transaction()
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                (m.version, m.name, datetime.now())
+            )
+            cursor.execute("DELETE FROM schema_migration_progress WHERE version = %s", (m.version,))
+            db.commit()
+            applied.append(m.version)
+            logger.info(f"✅ Migration {m.version} applied in {(datetime.now() - started).total_seconds():.1f}s")
+    except MigrationPaused as e:
+        logger.warning(f"⏸️ {e} (applied so far: {applied})")
+        raise
+    except mysql.connector.Error as err:
+        logger.error(f"❌ Migration failed (applied so far: {applied}): {err}")
+        raise
+    finally:
+        _deadline = None
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+        cursor.fetchone()
+        cursor.close()
+    return applied
+
+
+# ----- Query plan check -----
+# Representative forms of the queries on the request path, with sample parameters.
+# The check fails when MySQL would read every row of a table outside SMALL_TABLES.
+SMALL_TABLES = {"students", "monitoring_sessions"}
+
+_recent = datetime.now() - timedelta(minutes=30)
+_mac = "AA:BB:CC:DD:EE:FF"
+
+HOT_QUERIES = {
+    "analytics window (analytics.py)": ("""
+        SELECT timestamp, focus, beta, gamma, theta, delta, alpha
+        FROM eeg_data WHERE student_id = %s AND timestamp >= %s ORDER BY timestamp ASC
+    """, (1, _recent)),
+    "latest reading for a device (/latest)": ("""
+        SELECT timestamp, focus FROM eeg_data WHERE mac_address = %s ORDER BY id DESC LIMIT 1
+    """, (_mac,)),
+    "recent readings for a device (/data/<mac>)": ("""
+        SELECT timestamp, focus FROM eeg_data WHERE mac_address = %s ORDER BY timestamp DESC LIMIT %s
+    """, (_mac, 100)),
+    "live snapshot backfill (/api/students-list)": ("""
+        SELECT e.mac_address, e.focus
+        FROM eeg_data e
+        JOIN (
+            SELECT mac_address, MAX(id) AS id FROM eeg_data
+            WHERE mac_address IN (%s) AND timestamp > DATE_SUB(NOW(), INTERVAL 2 MINUTE)
+            GROUP BY mac_address
+        ) latest ON latest.id = e.id
+    """, (_mac,)),
+    "window totals from rollups (analytics.py)": (WINDOW_TOTALS, {
+        "mac": _mac, "start": _recent - timedelta(hours=3), "minute_start": _recent - timedelta(hours=3),
+        "hour_start": _recent - timedelta(hours=2), "hour_end": _recent
+    }),
+    "session rollup rebuild (session_summaries.py)": ("""
+        SELECT mac_address, COUNT(*), SUM(focus), MAX(focus)
+        FROM eeg_data WHERE monitoring_session_id = %s AND mac_address IS NOT NULL
+        GROUP BY mac_address
+    """, (1,)),
+    "session students (/api/session-details/<id>)": ("""
+        SELECT s.name, sss.mac_address, sss.data_points
+        FROM session_student_summaries sss
+        JOIN students s ON s.device_mac = sss.mac_address
+        WHERE sss.session_id = %s
+    """, (1,)),
+    "student summary (/api/student-details/<mac>)": ("""
+        SELECT s.id, ss.total_readings
+        FROM students s LEFT JOIN student_summaries ss ON ss.mac_address = s.device_mac
+        WHERE s.device_mac = %s
+    """, (_mac,)),
+}
+
+
+def check_query_plans(cursor):
+    """EXPLAIN every HOT_QUERIES entry; returns a list of problems (empty when all use indexes)"""
+    problems = []
+    for name, (query, params) in HOT_QUERIES.items():
+        cursor.execute("EXPLAIN " + query, params)
+        for row in cursor.fetchall():
+            table = row["table"] or ""
+            if row["type"] == "ALL" and table not in SMALL_TABLES and not table.startswith("<"):
+                problems.append(f"{name}: full scan of {table} (~{row['rows']} rows)")
+    return problems
+
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO)
+    db = get_db_connection()
+    try:
+        if "--check" in argv:
+            cursor = db.cursor(dictionary=True)
+            problems = check_query_plans(cursor)
+            cursor.close()
+            for problem in problems:
+                print(f"❌ {problem}")
+            failing = {problem.split(":")[0] for problem in problems}
+            print(f"{'✅' if not problems else '❌'} {len(HOT_QUERIES) - len(failing)}/{len(HOT_QUERIES)} "
+                  f"hot queries avoid full scans")
+            return 1 if problems else 0
+        max_seconds = float(argv[argv.index("--max-seconds") + 1]) if "--max-seconds" in argv else None
+        try:
+            applied = apply_migrations(db, max_seconds)
+        except MigrationPaused as e:
+            print(f"⏸️ {e} - run again to continue")
+            return 2
+        except (mysql.connector.Error, RuntimeError) as e:
+            print(f"❌ Migrations failed: {e}")
+            return 1
+        print(f"✅ Applied migrations: {applied}" if applied else "✅ Schema is up to date")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,183 @@
+"""
+ML Feature Module
+Vectorized extraction of the 148-feature model input for many windows at once
+
+Layout (0-based columns, identical to the single-window extract_ml_features):
+    0-4      raw band powers (delta, theta, alpha, beta, gamma)
+    5-9      band percentages of total power
+    10       total power
+    11-24    band ratios
+    25       focus score
+    26-30    log1p band powers
+    31-35    sqrt of relative band powers
+    36-40    low / mid / high frequency ratios
+    41-45    band power differences
+    46-50    cross-band products
+    51-55    band power relative to the strongest band
+    56-70    raw EEG statistics (zeros when no raw window is given)
+    71-85    advanced spectral ratios
+    86-105   focus_score ** k * 0.1 for k = 1..20
+    106-147  zero padding
+"""
+import numpy as np
+
+N_FEATURES = 148
+BAND_ORDER = ("delta", "theta", "alpha", "beta", "gamma")
+RAW_FEATURE_COUNT = 15
+FOCUS_POLY_DEGREE = 20
+
+
+def _safe_div(numerator, denominator, condition=None):
+    """numerator / denominator where condition holds (default denominator > 0), else 0"""
+    if condition is None:
+        condition = denominator > 0
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=out, where=condition)
+    return out
+
+
+def _raw_statistics(raw_windows):
+    """Columns 56-70 for an (N, W) matrix of raw samples (computed in the input's dtype)"""
+    x = np.asarray(raw_windows)
+    diffs = np.diff(x, axis=1)
+    width = x.shape[1]
+    return [
+        np.mean(x, axis=1),
+        np.std(x, axis=1),
+        np.var(x, axis=1),
+        np.median(x, axis=1),
+        np.max(x, axis=1),
+        np.min(x, axis=1),
+        np.ptp(x, axis=1),
+        np.percentile(x, 25, axis=1),
+        np.percentile(x, 75, axis=1),
+        np.percentile(x, 90, axis=1),
+        np.mean(np.abs(diffs), axis=1),
+        np.std(diffs, axis=1),
+        np.full(x.shape[0], float(width)),
+        np.sum(x > 0, axis=1),
+        np.sum(x < 0, axis=1),
+    ]
+
+
+def extract_ml_features_batch(band_matrix, focus, raw_windows=None, dtype=np.float32):
+    """
+    Build the (N, 148) model input for N windows
+
+    Args:
+        band_matrix: (N, 5) band powers in BAND_ORDER
+        focus: (N,) focus scores from calculate_focus
+        raw_windows: optional (N, W) raw samples; the statistics block is zero when
+            omitted or when W <= 10 (same rule as the single-window version)
+        dtype: output dtype (float32 for batch inference, float64 for exact legacy values)
+    """
+    bands = np.asarray(band_matrix, dtype=np.float64).reshape(-1, len(BAND_ORDER))
+    n_rows = bands.shape[0]
+    delta, theta, alpha, beta, gamma = bands.T
+    focus = np.asarray(focus, dtype=np.float64).reshape(n_rows)
+
+    # Same summation order as sum(band_powers.values())
+    total = delta + theta + alpha + beta + gamma
+    total = np.where(total == 0, 1e-10, total)
+    total_positive = total > 0
+
+    features = np.zeros((n_rows, N_FEATURES), dtype=np.float64)
+    columns = []
+
+    # 1-5: Raw band powers
+    columns += [delta, theta, alpha, beta, gamma]
+
+    # 6-10: Normalized band powers (percentages)
+    columns += [delta / total * 100, theta / total * 100, alpha / total * 100,
+                beta / total * 100, gamma / total * 100]
+
+    # 11: Total power
+    columns.append(total)
+
+    # 12-25: Band ratios
+    alpha_theta = alpha + theta
+    beta_gamma = beta + gamma
+    theta_delta = theta + delta
+    columns += [
+        _safe_div(beta, theta),
+        _safe_div(beta, alpha),
+        _safe_div(alpha, theta),
+        _safe_div(beta + gamma, alpha_theta),
+        _safe_div(delta, theta),
+        _safe_div(gamma, beta),
+        _safe_div(alpha + theta, beta),
+        _safe_div(beta, alpha_theta),
+        _safe_div(theta + alpha, beta_gamma),
+        _safe_div(alpha, delta),
+        _safe_div(gamma, theta),
+        _safe_div(beta, delta),
+        _safe_div(beta + alpha, theta_delta),
+        _safe_div(gamma, alpha),
+    ]
+
+    # 26: Focus score
+    columns.append(focus)
+
+    # 27-31: Logarithmic band powers
+    columns += [np.log1p(delta), np.log1p(theta), np.log1p(alpha), np.log1p(beta), np.log1p(gamma)]
+
+    # 32-36: Square root normalized powers
+    with np.errstate(invalid="ignore"):
+        columns += [np.sqrt(_safe_div(x, total, total_positive)) for x in (delta, theta, alpha, beta, gamma)]
+
+    # 37-41: Low vs High frequency ratios
+    low_freq = delta + theta
+    high_freq = beta + gamma
+    mid_freq = alpha
+    columns += [
+        _safe_div(high_freq, low_freq),
+        _safe_div(low_freq, high_freq),
+        _safe_div(mid_freq, low_freq),
+        _safe_div(mid_freq, high_freq),
+        _safe_div(high_freq + mid_freq, low_freq),
+    ]
+
+    # 42-46: Band power differences
+    columns += [beta - theta, beta - alpha, alpha - theta, gamma - beta, beta - delta]
+
+    # 47-51: Cross-band interactions
+    columns += [beta * alpha, theta * delta, gamma * beta, alpha * theta, beta * gamma]
+
+    # 52-56: Relative band dominance
+    max_power = np.max(bands, axis=1)
+    columns += [_safe_div(x, max_power) for x in (delta, theta, alpha, beta, gamma)]
+
+    # 57-71: Statistical features from raw EEG (zeros when unavailable)
+    if raw_windows is not None and np.shape(raw_windows)[-1] > 10:
+        columns += _raw_statistics(np.reshape(raw_windows, (n_rows, -1)))
+    else:
+        columns += [np.zeros(n_rows)] * RAW_FEATURE_COUNT
+
+    # 72-86: Advanced spectral features
+    alpha_times_theta = alpha * theta
+    with np.errstate(invalid="ignore"):
+        sqrt_beta_alpha = np.sqrt(beta * alpha)
+    columns += [
+        _safe_div(beta + gamma, total, total_positive),
+        _safe_div(delta + theta, total, total_positive),
+        _safe_div(alpha, total, total_positive),
+        _safe_div(beta, delta + theta + alpha),
+        _safe_div(gamma, delta + theta + alpha + beta),
+        _safe_div(sqrt_beta_alpha, theta),
+        _safe_div(np.float_power(beta, 2), alpha_times_theta),
+        np.log1p(_safe_div(beta, theta)),
+        np.log1p(_safe_div(alpha, delta)),
+        _safe_div(beta + alpha + gamma, theta_delta),
+        _safe_div(beta * gamma, alpha_times_theta),
+        _safe_div(beta - theta, beta + theta),
+        _safe_div(alpha - delta, alpha + delta),
+        _safe_div(gamma, beta + alpha),
+        _safe_div(theta + delta + alpha, beta_gamma),
+    ]
+
+    # 87-106: Polynomial focus features (107-148 stay zero)
+    # float_power calls libm pow like Python's float ** int; np.power's SIMD path can differ by 1 ulp
+    columns += [np.float_power(focus, i + 1) * 0.1 for i in range(FOCUS_POLY_DEGREE)]
+
+    features[:, :len(columns)] = np.column_stack(columns)
+    return features.astype(dtype, copy=False)
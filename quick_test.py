@@ -41,6 +41,305 @@ for name, bands, expected in test_cases:
 accuracy = (passed / len(test_cases)) * 100
 print(f"\n   Formula Accuracy: {accuracy:.0f}%")
 
+# Test 3: Streaming filter matches offline filtering of the whole stream
+print("\n3. Streaming Filter Parity...")
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+from eeg_dsp import StreamingFilter, design_eeg_filter_sos
+
+rng = np.random.default_rng(0)
+stream = (rng.integers(1500, 2600, 5000) - 2048) / 2048.0
+stream_filter = StreamingFilter(250)
+chunks, start = [], 0
+while start < len(stream):
+    size = int(rng.integers(1, 400))
+    chunks.append(stream_filter.process(stream[start:start + size]))
+    start += size
+sos = design_eeg_filter_sos(250)
+offline, _ = sosfilt(sos, stream, zi=sosfilt_zi(sos) * stream[0])
+filter_error = float(np.max(np.abs(np.concatenate(chunks) - offline)))
+print(f"   {'✅' if filter_error < 1e-9 else '❌'} Max difference vs offline: {filter_error:.2e}")
+
+# Test 4: Compiled NumPy tree evaluator reproduces the loaded model
+print("\n4. Compiled Tree Parity...")
+from compiled_trees import CompiledTreeModel, ExportError, export_model, verification_inputs, verify_export
+
+if model is None:
+    print("   ⏭️ Skipped (no model loaded)")
+elif isinstance(model, CompiledTreeModel):
+    print(f"   ✅ Running compiled model ({model.n_trees} trees) - verified when it was exported")
+else:
+    try:
+        compiled = export_model(model)
+        X = verification_inputs(compiled.n_features_in_, 500, mean=compiled.mean, scale=compiled.scale)
+        max_error, agreement = verify_export(model, compiled, X)
+        print(f"   ✅ Max probability difference: {max_error:.2e} ({agreement * 100:.1f}% same class)")
+    except ExportError as e:
+        print(f"   ❌ {e}")
+
+# Test 5: Vectorized attention periods match the original per-row loop
+print("\n5. Attention Period Parity...")
+from datetime import datetime, timedelta
+from analytics import compute_attention_periods
+
+def loop_attention_periods(points):
+    """The original row-by-row period detection (reference)"""
+    periods, current = [], None
+    for point in points:
+        if point['focus'] >= 0.6:
+            if current is not None and (point['timestamp'] - current['end_time']).total_seconds() <= 10:
+                current['end_time'] = point['timestamp']
+                current['values'].append(point)
+                continue
+            if current and len(current['values']) >= 3:
+                periods.append(current)
+            current = {'start_time': point['timestamp'], 'end_time': point['timestamp'], 'values': [point]}
+        else:
+            if current and len(current['values']) >= 3:
+                periods.append(current)
+            current = None
+    if current and len(current['values']) >= 3:
+        periods.append(current)
+
+    formatted = []
+    for i, period in enumerate(periods):
+        duration_seconds = (period['end_time'] - period['start_time']).total_seconds()
+        quality = int(np.mean([p['focus'] for p in period['values']]) * 60 +
+                      np.mean([p['beta'] for p in period['values']]) * 25 +
+                      np.mean([p['gamma'] for p in period['values']]) * 15)
+        formatted.append({
+            'period_number': i + 1,
+            'start_time': period['start_time'].strftime('%H:%M'),
+            'end_time': period['end_time'].strftime('%H:%M'),
+            'duration_minutes': max(1, int(duration_seconds / 60)),
+            'quality_score': quality,
+            'quality_level': 'high' if quality >= 75 else ('medium' if quality >= 50 else 'low'),
+            'is_active': i == len(periods) - 1
+        })
+    return formatted
+
+period_mismatches, period_count = 0, 0
+for trial in range(200):
+    n = int(rng.integers(0, 400))
+    t = datetime(2025, 1, 6, 9, 0) + timedelta(seconds=int(rng.integers(0, 3600)))
+    points = []
+    for _ in range(n):
+        t += timedelta(seconds=int(rng.choice([1, 1, 1, 2, 10, 11, 30])))
+        points.append({'timestamp': t, 'focus': float(rng.choice([rng.random(), 0.6, 0.9])),
+                       'beta': float(rng.random()), 'gamma': float(rng.random())})
+    expected = loop_attention_periods(points)
+    timestamps = [p['timestamp'] for p in points]
+    seconds = np.array([(ts - timestamps[0]).total_seconds() for ts in timestamps])
+    got = compute_attention_periods(
+        timestamps, seconds, *(np.array([p[k] for p in points]) for k in ('focus', 'beta', 'gamma'))
+    )
+    period_count += len(expected)
+    period_mismatches += got != expected
+print(f"   {'✅' if period_mismatches == 0 else '❌'} {period_count} periods over 200 streams, "
+      f"{period_mismatches} stream(s) differ")
+
+# Test 6: The ingest-side tracker finds the same periods one reading at a time
+print("\n6. Attention Tracker Parity...")
+from analytics import tracked_attention_periods
+from attention_tracker import AttentionTracker, CLOSED_PERIODS
+
+tracker_mismatches, tracker_count = 0, 0
+for trial in range(200):
+    n = int(rng.integers(0, 400))
+    t = datetime.now().replace(microsecond=0) - timedelta(hours=3)
+    points = []
+    for _ in range(n):
+        t += timedelta(seconds=int(rng.choice([1, 1, 1, 2, 10, 11, 30])))
+        points.append({'timestamp': t, 'focus': float(rng.choice([rng.random(), 0.6, 0.9])),
+                       'beta': float(rng.random()), 'gamma': float(rng.random())})
+    tracker = AttentionTracker.create((datetime.now() - timedelta(hours=4)).timestamp())
+    for p in points:
+        tracker.update(p['timestamp'].timestamp(), p['focus'], p['beta'], p['gamma'])
+    expected = loop_attention_periods(points)
+    got = tracked_attention_periods(tracker.snapshot(), 4 * 60, datetime.now())
+    if len(expected) > CLOSED_PERIODS:
+        # Older periods have left the ring: the tracker must decline the window
+        tracker_mismatches += got is not None
+        continue
+    tracker_count += len(expected)
+    tracker_mismatches += got != expected
+print(f"   {'✅' if tracker_mismatches == 0 else '❌'} {tracker_count} periods over 200 streams, "
+      f"{tracker_mismatches} stream(s) differ")
+
+# Test 7: A flush that fails between statements is retried without storing anything twice
+print("\n7. Write-Behind Retry Atomicity...")
+import write_behind
+from write_behind import Reading, WriteBehindWriter
+
+class FakeConnection:
+    """MySQL connection stand-in opened with autocommit on, like db.get_db_connection()"""
+    def __init__(self, server):
+        self.server, self.pending = server, None
+    def start_transaction(self):
+        self.pending = []
+    def cursor(self):
+        return FakeCursor(self)
+    def commit(self):
+        self.server.rows.extend(self.pending or [])
+        self.pending = None
+    def rollback(self):
+        self.pending = None
+    def close(self):
+        self.pending = None  # the pool resets the session, discarding an open transaction
+
+class FakeCursor:
+    lastrowid = None
+    def __init__(self, connection):
+        self.connection = connection
+    def execute(self, query, params=None):
+        self._result = [(i + 1, mac) for i, mac in enumerate(params)] if "FROM students" in query else []
+    def fetchall(self):
+        return self._result
+    def executemany(self, query, rows):
+        table = query.split("INTO")[1].split()[0]
+        if table == self.connection.server.fail_table:
+            self.connection.server.fail_table = None
+            raise RuntimeError(f"injected failure writing {table}")
+        stored = [(table, row) for row in rows]
+        if self.connection.pending is None:
+            self.connection.server.rows.extend(stored)  # autocommit
+        else:
+            self.connection.pending.extend(stored)
+    def close(self):
+        pass
+
+class FakeServer:
+    def __init__(self, fail_table):
+        self.rows, self.fail_table = [], fail_table
+    def total(self, table, key=None):
+        rows = [row for name, row in self.rows if name == table]
+        return len(rows) if key is None else sum(row[key] for row in rows)
+
+t = datetime(2025, 1, 6, 9, 0)
+readings = [
+    Reading(t + timedelta(seconds=i), f"AA:BB:CC:DD:EE:0{i % 3}", np.full(250, 2048),
+            {band: 0.2 for band in ('delta', 'theta', 'alpha', 'beta', 'gamma')}, 0.7, 'good', None)
+    for i in range(30)
+]
+atomicity_failures = []
+for fail_table in ("eeg_data", "student_summaries", "eeg_rollup_1m", "eeg_rollup_1h"):
+    server = FakeServer(fail_table)
+    write_behind.get_db_connection = lambda: FakeConnection(server)
+    batch_writer = WriteBehindWriter()
+    batch_writer._write(readings)  # fails part way, keeps the readings for a retry
+    batch_writer._write([])        # the retry
+    totals = (server.total("raw_data"), server.total("eeg_data"), server.total("student_summaries", "count"),
+              server.total("eeg_rollup_1m", "sample_count"), server.total("eeg_rollup_1h", "sample_count"))
+    if batch_writer.stats()["failed_flushes"] != 1 or totals != (30 * 250, 30, 30, 30, 30):
+        atomicity_failures.append(f"{fail_table}: {totals}")
+print(f"   {'✅' if not atomicity_failures else '❌'} Failure injected before each of 4 statements, "
+      f"rows and counters stored once" + (f" - {atomicity_failures}" if atomicity_failures else ""))
+
+# Test 8: Vectorized 148-feature extraction matches the original per-window function
+print("\n8. ML Feature Batch Parity...")
+from ml_features import BAND_ORDER, N_FEATURES, extract_ml_features_batch
+
+def loop_ml_features(band_powers, focus_score, raw_eeg_buffer=None):
+    """The original single-window extract_ml_features (reference)"""
+    delta = band_powers.get('delta', 0)
+    theta = band_powers.get('theta', 0)
+    alpha = band_powers.get('alpha', 0)
+    beta = band_powers.get('beta', 0)
+    gamma = band_powers.get('gamma', 0)
+    total_power = sum(band_powers.values())
+    if total_power == 0:
+        total_power = 1e-10
+    features = [delta, theta, alpha, beta, gamma]
+    features.extend([x / total_power * 100 for x in (delta, theta, alpha, beta, gamma)])
+    features.append(total_power)
+    features.extend([
+        beta / theta if theta > 0 else 0,
+        beta / alpha if alpha > 0 else 0,
+        alpha / theta if theta > 0 else 0,
+        (beta + gamma) / (alpha + theta) if (alpha + theta) > 0 else 0,
+        delta / theta if theta > 0 else 0,
+        gamma / beta if beta > 0 else 0,
+        (alpha + theta) / beta if beta > 0 else 0,
+        beta / (alpha + theta) if (alpha + theta) > 0 else 0,
+        (theta + alpha) / (beta + gamma) if (beta + gamma) > 0 else 0,
+        alpha / delta if delta > 0 else 0,
+        gamma / theta if theta > 0 else 0,
+        beta / delta if delta > 0 else 0,
+        (beta + alpha) / (theta + delta) if (theta + delta) > 0 else 0,
+        gamma / alpha if alpha > 0 else 0
+    ])
+    features.append(focus_score)
+    features.extend([np.log1p(x) for x in (delta, theta, alpha, beta, gamma)])
+    features.extend([np.sqrt(x / total_power) if total_power > 0 else 0 for x in (delta, theta, alpha, beta, gamma)])
+    low_freq, high_freq, mid_freq = delta + theta, beta + gamma, alpha
+    features.extend([
+        high_freq / low_freq if low_freq > 0 else 0,
+        low_freq / high_freq if high_freq > 0 else 0,
+        mid_freq / low_freq if low_freq > 0 else 0,
+        mid_freq / high_freq if high_freq > 0 else 0,
+        (high_freq + mid_freq) / low_freq if low_freq > 0 else 0
+    ])
+    features.extend([beta - theta, beta - alpha, alpha - theta, gamma - beta, beta - delta])
+    features.extend([beta * alpha, theta * delta, gamma * beta, alpha * theta, beta * gamma])
+    max_power = max(band_powers.values())
+    features.extend([x / max_power if max_power > 0 else 0 for x in (delta, theta, alpha, beta, gamma)])
+    if raw_eeg_buffer is not None and len(raw_eeg_buffer) > 10:
+        eeg_array = np.array(raw_eeg_buffer)
+        features.extend([
+            np.mean(eeg_array), np.std(eeg_array), np.var(eeg_array), np.median(eeg_array),
+            np.max(eeg_array), np.min(eeg_array), np.ptp(eeg_array),
+            np.percentile(eeg_array, 25), np.percentile(eeg_array, 75), np.percentile(eeg_array, 90),
+            np.mean(np.abs(np.diff(eeg_array))),
+            np.std(np.diff(eeg_array)) if len(eeg_array) > 1 else 0,
+            len(eeg_array), np.sum(eeg_array > 0), np.sum(eeg_array < 0)
+        ])
+    else:
+        features.extend([0] * 15)
+    features.extend([
+        (beta + gamma) / total_power if total_power > 0 else 0,
+        (delta + theta) / total_power if total_power > 0 else 0,
+        alpha / total_power if total_power > 0 else 0,
+        beta / (delta + theta + alpha) if (delta + theta + alpha) > 0 else 0,
+        gamma / (delta + theta + alpha + beta) if (delta + theta + alpha + beta) > 0 else 0,
+        np.sqrt(beta * alpha) / theta if theta > 0 else 0,
+        (beta ** 2) / (alpha * theta) if (alpha * theta) > 0 else 0,
+        np.log1p(beta / theta) if theta > 0 else 0,
+        np.log1p(alpha / delta) if delta > 0 else 0,
+        (beta + alpha + gamma) / (theta + delta) if (theta + delta) > 0 else 0,
+        beta * gamma / (alpha * theta) if (alpha * theta) > 0 else 0,
+        (beta - theta) / (beta + theta) if (beta + theta) > 0 else 0,
+        (alpha - delta) / (alpha + delta) if (alpha + delta) > 0 else 0,
+        gamma / (beta + alpha) if (beta + alpha) > 0 else 0,
+        (theta + delta + alpha) / (beta + gamma) if (beta + gamma) > 0 else 0
+    ])
+    remaining_features = 148 - len(features)
+    if remaining_features > 0:
+        for i in range(min(remaining_features, 20)):
+            features.append(focus_score ** (i + 1) * 0.1)
+        while len(features) < 148:
+            features.append(0)
+    return np.array(features[:148]).reshape(1, -1)
+
+rng = np.random.default_rng(11)
+feature_rows = 400
+feature_bands = rng.gamma(1.5, 20.0, size=(feature_rows, 5))
+feature_bands[rng.random((feature_rows, 5)) < 0.1] = 0  # zero single bands hit the "if x > 0 else 0" branches
+feature_bands[::25] = 0                                    # zero total power
+feature_focus = rng.random(feature_rows)
+feature_mismatches, feature_cases = [], 0
+# Raw windows: full-length, short (<= 10 samples, statistics stay zero), empty, and none at all
+for width in (256, 11, 7, 0, None):
+    raw = None if width is None else rng.normal(0, 50, size=(feature_rows, width))
+    batch_features = extract_ml_features_batch(feature_bands, feature_focus, raw, dtype=np.float64)
+    for i in range(feature_rows):
+        reference = loop_ml_features(dict(zip(BAND_ORDER, feature_bands[i].tolist())), float(feature_focus[i]),
+                                     None if raw is None else raw[i].tolist())
+        feature_cases += 1
+        if batch_features.shape != (feature_rows, N_FEATURES) or not np.array_equal(batch_features[i], reference[0]):
+            feature_mismatches.append((width, i))
+print(f"   {'✅' if not feature_mismatches else '❌'} {feature_cases} windows compared exactly, "
+      f"{len(feature_mismatches)} mismatches" + (f" - first {feature_mismatches[:5]}" if feature_mismatches else ""))
+
 # Summary
 print("\n" + "="*60)
 if accuracy >= 75 and (model is not None):
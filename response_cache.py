@@ -0,0 +1,158 @@
+"""
+Response Cache Module
+In-memory cache of read-heavy JSON responses, invalidated when new data for a device is stored
+
+Several dashboard tabs polling the same student ask the same question within the same
+second. @cached_response(scope, seconds) serves repeats from memory:
+
+    key      endpoint, path + query string, Accept header, the scope's generation and
+             the time bucket (now // seconds), so every request in one aligned bucket
+             gets the same answer and a bucket never outlives its window
+    scope    what the response depends on: a device MAC (analytics, student details) or
+             SESSION_HISTORY_SCOPE
+    evicted  at the end of its bucket (TTL), least recently used first beyond
+             RESPONSE_CACHE_MAX_ENTRIES / RESPONSE_CACHE_MAX_BYTES
+
+invalidate_responses(scope) bumps the scope's generation, making every cached answer
+for it unreachable. The write-behind writer calls it for each MAC after committing a
+batch (the moment MySQL-backed answers change), session start / end for the session
+history. Generations live in a shared array created at import, so under gunicorn
+preload an invalidation in any worker reaches all of them; scopes are hashed onto
+GENERATION_SLOTS slots, and a collision only costs an extra miss.
+
+Entries themselves are per worker. Only 200 responses are cached.
+"""
+import logging
+import multiprocessing
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import Response, current_app, request
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+GENERATION_SLOTS = 4096
+
+SESSION_HISTORY_SCOPE = "session-history"
+
+# Bucket lengths: the dashboard polls analytics every 2 seconds
+ANALYTICS_CACHE_SECONDS = 2
+STUDENT_DETAILS_CACHE_SECONDS = 5
+SESSION_HISTORY_CACHE_SECONDS = 10
+
+CachedResponse = namedtuple("CachedResponse", ["body", "mimetype", "expires_at"])
+
+_generations = multiprocessing.Array("q", GENERATION_SLOTS)
+
+
+def _slot(scope):
+    return zlib.crc32(scope.encode()) % GENERATION_SLOTS
+
+
+def invalidate_responses(*scopes):
+    """Drop every cached response for these scopes (MACs or SESSION_HISTORY_SCOPE), in all workers"""
+    with _generations.get_lock():
+        for scope in scopes:
+            _generations[_slot(scope)] += 1
+
+
+class ResponseCache:
+    """TTL + LRU map of response bodies with entry and byte limits"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> CachedResponse, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "uncacheable": 0}
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry.body)
+        with self._lock:
+            if size > self.max_bytes:
+                self._stats["uncacheable"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evicted"] += 1
+
+    def _remove(self, key):
+        self._bytes -= len(self._entries.pop(key).body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit / miss counters and current size for the metrics endpoint"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                hit_rate=round(self._stats["hits"] / lookups, 3) if lookups else None,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes
+            )
+
+
+# Shared by every cached route in this worker
+response_cache = ResponseCache()
+
+
+def mac_scope(mac_address, **kwargs):
+    """Scope of routes that take a <mac_address>"""
+    return mac_address
+
+
+def cached_response(scope, seconds):
+    """
+    Cache a view's successful responses for aligned `seconds`-long buckets
+    scope: the scope string, or a function of the view's keyword arguments returning it
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            scope_name = scope(**kwargs) if callable(scope) else scope
+            now = time.time()
+            bucket = int(now // seconds)
+            key = (
+                request.endpoint, request.full_path, request.headers.get("Accept", ""),
+                _generations[_slot(scope_name)], bucket
+            )
+            entry = response_cache.get(key, now)
+            if entry is not None:
+                return Response(entry.body, mimetype=entry.mimetype)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                response_cache.put(key, CachedResponse(response.get_data(), response.mimetype, (bucket + 1) * seconds))
+            return response
+        return wrapper
+    return decorator
@@ -10,8 +10,18 @@ from datetime import datetime
 # Import centralized database connection
 from db import get_db_connection
 
+# Materialized per-session rollups
+from session_summaries import fetch_session_history, fetch_session_students, rebuild_session_summary
+
+# Polled history served from memory until a session changes
+from response_cache import SESSION_HISTORY_CACHE_SECONDS, SESSION_HISTORY_SCOPE, cached_response
+
 logger = logging.getLogger(__name__)
 
+def needs_rebuild(session):
+    """No rollup yet, or the session ended without its final rollup being written"""
+    return session['summary_id'] is None or (not session['active'] and not session['finalized'])
+
 def register_session_routes(app):
     """Register all session-related routes"""
     
@@ -21,8 +31,9 @@ def register_session_routes(app):
         return render_template("session-history.html")
 
     @app.route("/api/session-history", methods=['GET'])
+    @cached_response(SESSION_HISTORY_SCOPE, SESSION_HISTORY_CACHE_SECONDS)
     def get_session_history():
-        """Get all monitoring sessions with summary statistics"""
+        """Get all monitoring sessions with summary statistics (from the session rollups)"""
         try:
             db = get_db_connection()
             if not db:
@@ -30,52 +41,28 @@ def register_session_routes(app):
                 
             cursor = db.cursor(dictionary=True)
             
-            # Fetch all monitoring sessions with basic info
-            cursor.execute("""
-                SELECT 
-                    ms.id,
-                    ms.teacher_name,
-                    ms.subject,
-                    ms.start_time,
-                    ms.end_time,
-                    ms.active,
-                    COUNT(DISTINCT e.mac_address) as student_count
-                FROM monitoring_sessions ms
-                LEFT JOIN eeg_data e ON e.timestamp BETWEEN ms.start_time AND COALESCE(ms.end_time, NOW())
-                GROUP BY ms.id, ms.teacher_name, ms.subject, ms.start_time, ms.end_time, ms.active
-                ORDER BY ms.start_time DESC
-            """)
+            # Fetch all monitoring sessions with their materialized summaries
+            sessions = fetch_session_history(cursor)
             
-            sessions = cursor.fetchall()
+            # Rollups missing (sessions from before the rollup tables, or a failed end-of-session
+            # write) are built once from eeg_data and stored
+            stale = [session for session in sessions if needs_rebuild(session)]
+            if stale:
+                for session in stale:
+                    rebuild_session_summary(cursor, session['id'], finalize=not session['active'])
+                db.commit()
+                logger.info(f"Built summaries for {len(stale)} session(s)")
+                sessions = fetch_session_history(cursor)
             
-            # Convert datetime to ISO format and calculate avg attention span for each session
             for session in sessions:
-                session_start = session['start_time']
-                session_end = session['end_time']
-                
                 if session['start_time']:
                     session['start_time'] = session['start_time'].isoformat()
                 if session['end_time']:
                     session['end_time'] = session['end_time'].isoformat()
                 
-                # Calculate average attention span (in minutes) for this session
-                cursor.execute("""
-                    SELECT 
-                        COUNT(DISTINCT mac_address) as student_count,
-                        AVG(attention_minutes) as avg_attention_span
-                    FROM (
-                        SELECT 
-                            mac_address,
-                            COUNT(*) * 1.0 / 60 as attention_minutes
-                        FROM eeg_data
-                        WHERE timestamp BETWEEN %s AND COALESCE(%s, NOW())
-                        AND focus >= 60
-                        GROUP BY mac_address
-                    ) as student_attention
-                """, (session_start, session_end))
-                
-                result = cursor.fetchone()
-                session['avg_attention_span'] = round(result['avg_attention_span'] or 0, 1)
+                session['student_count'] = session['student_count'] or 0
+                session['avg_attention_span'] = round(session['avg_attention_span'] or 0, 1)
+                del session['summary_id'], session['finalized']
                 
                 # Add status based on active flag
                 session['status'] = 'active' if session['active'] else 'completed'
@@ -100,11 +87,13 @@ def register_session_routes(app):
                 
             cursor = db.cursor(dictionary=True)
             
-            # Get monitoring session info
+            # Get monitoring session info with its summary
             cursor.execute("""
-                SELECT id, teacher_name, subject, start_time, end_time, active
-                FROM monitoring_sessions
-                WHERE id = %s
+                SELECT ms.id, ms.teacher_name, ms.subject, ms.start_time, ms.end_time, ms.active,
+                       ss.session_id AS summary_id, ss.finalized
+                FROM monitoring_sessions ms
+                LEFT JOIN session_summaries ss ON ss.session_id = ms.id
+                WHERE ms.id = %s
             """, (session_id,))
             
             session = cursor.fetchone()
@@ -114,52 +103,17 @@ def register_session_routes(app):
                 db.close()
                 return jsonify({"status": "error", "msg": "Session not found"}), 404
             
-            # Get session statistics
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as data_points,
-                    COUNT(DISTINCT mac_address) as unique_students,
-                    ROUND(AVG(focus), 1) as avg_focus,
-                    ROUND(MAX(focus), 1) as peak_focus
-                FROM eeg_data
-                WHERE timestamp BETWEEN %s AND COALESCE(%s, NOW())
-            """, (session['start_time'], session['end_time']))
+            if needs_rebuild(session):
+                rebuild_session_summary(cursor, session_id, finalize=not session['active'])
+                db.commit()
             
+            # Session statistics
+            cursor.execute("SELECT * FROM session_summaries WHERE session_id = %s", (session_id,))
             stats = cursor.fetchone()
+            total_focus_minutes = round(stats['focus_minutes'] or 0, 1)
             
-            # Calculate total focus time in minutes
-            if session['end_time']:
-                duration = (session['end_time'] - session['start_time']).total_seconds() / 60
-            else:
-                duration = (datetime.now() - session['start_time']).total_seconds() / 60
-            
-            # Estimate focus time (assuming data points with focus >= 60)
-            cursor.execute("""
-                SELECT COUNT(*) * 1.0 / 60 as focus_minutes
-                FROM eeg_data
-                WHERE timestamp BETWEEN %s AND COALESCE(%s, NOW())
-                AND focus >= 60
-            """, (session['start_time'], session['end_time']))
-            
-            focus_time_result = cursor.fetchone()
-            total_focus_minutes = round(focus_time_result['focus_minutes'] or 0, 1)
-            
-            # Get students in session with their performance
-            cursor.execute("""
-                SELECT 
-                    s.name,
-                    s.device_mac as mac_address,
-                    AVG(e.focus) as avg_focus,
-                    MAX(e.focus) as peak_focus,
-                    COUNT(*) as data_points
-                FROM students s
-                JOIN eeg_data e ON s.device_mac = e.mac_address
-                WHERE e.timestamp BETWEEN %s AND COALESCE(%s, NOW())
-                GROUP BY s.name, s.device_mac
-                ORDER BY avg_focus DESC
-            """, (session['start_time'], session['end_time']))
-            
-            students = cursor.fetchall()
+            # Students in session with their performance
+            students = fetch_session_students(cursor, session_id)
             
             # Format student data
             for student in students:
@@ -180,10 +134,10 @@ def register_session_routes(app):
                     "active": session['active']
                 },
                 "data_points": stats['data_points'] or 0,
-                "avg_focus": stats['avg_focus'] or 0,
-                "peak_focus": stats['peak_focus'] or 0,
+                "avg_focus": round(stats['avg_focus'] or 0, 1),
+                "peak_focus": round(stats['peak_focus'] or 0, 1),
                 "total_focus_minutes": total_focus_minutes,
-                "avg_attention_span": total_focus_minutes / (stats['unique_students'] or 1),
+                "avg_attention_span": total_focus_minutes / (stats['student_count'] or 1),
                 "students": students
             })
             
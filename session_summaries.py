@@ -0,0 +1,182 @@
+"""
+Session Summaries Module
+Materialized per-session rollups for the session history pages
+
+    session_student_summaries   one row per (monitoring session, device): readings,
+                                focus sum / peak and focused readings
+    session_summaries           one row per session, recomputed from the rows above:
+                                student count, data points, avg / peak focus, focus
+                                minutes and average attention span
+
+The write-behind writer keeps the active session's rows current with each flush.
+Ending a session rebuilds its rows from eeg_data once and marks it finalized, and
+sessions from before these tables existed are rebuilt the first time they are read.
+Readings arrive about once per second per device, so minutes = readings / 60 (as
+the original queries assumed).
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# focus is stored as 0-1; a reading at or above this counts as focused time
+FOCUSED_THRESHOLD = 0.6
+READINGS_PER_MINUTE = 60
+
+CREATE_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS session_student_summaries (
+        session_id INT NOT NULL,
+        mac_address VARCHAR(50) NOT NULL,
+        student_id INT,
+        data_points INT NOT NULL DEFAULT 0,
+        focus_sum DOUBLE NOT NULL DEFAULT 0,
+        peak_focus FLOAT,
+        focused_points INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (session_id, mac_address),
+        FOREIGN KEY (session_id) REFERENCES monitoring_sessions(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS session_summaries (
+        session_id INT PRIMARY KEY,
+        student_count INT NOT NULL DEFAULT 0,
+        data_points INT NOT NULL DEFAULT 0,
+        avg_focus FLOAT,
+        peak_focus FLOAT,
+        focus_minutes FLOAT NOT NULL DEFAULT 0,
+        avg_attention_span FLOAT NOT NULL DEFAULT 0,
+        finalized BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at DATETIME,
+        FOREIGN KEY (session_id) REFERENCES monitoring_sessions(id) ON DELETE CASCADE
+    )
+    """
+)
+
+# Incremental: executemany adds one batch's per-device totals (multi-row INSERT)
+STUDENT_UPSERT = """
+    INSERT INTO session_student_summaries (
+        session_id, mac_address, student_id, data_points, focus_sum, peak_focus, focused_points
+    )
+    VALUES (%(session_id)s, %(mac)s, %(student_id)s, %(count)s, %(focus_sum)s, %(peak)s, %(focused)s)
+    ON DUPLICATE KEY UPDATE
+        data_points = data_points + VALUES(data_points),
+        focus_sum = focus_sum + VALUES(focus_sum),
+        peak_focus = GREATEST(COALESCE(peak_focus, VALUES(peak_focus)), VALUES(peak_focus)),
+        focused_points = focused_points + VALUES(focused_points),
+        student_id = COALESCE(VALUES(student_id), student_id)
+"""
+
+# Full: the per-device rows of one session from its tagged eeg_data rows
+STUDENT_REBUILD = f"""
+    INSERT INTO session_student_summaries (
+        session_id, mac_address, student_id, data_points, focus_sum, peak_focus, focused_points
+    )
+    SELECT %s, mac_address, MAX(student_id), COUNT(*), COALESCE(SUM(focus), 0), MAX(focus),
+           SUM(focus >= {FOCUSED_THRESHOLD})
+    FROM eeg_data
+    WHERE monitoring_session_id = %s AND mac_address IS NOT NULL
+    GROUP BY mac_address
+    ON DUPLICATE KEY UPDATE
+        data_points = VALUES(data_points), focus_sum = VALUES(focus_sum),
+        peak_focus = VALUES(peak_focus), focused_points = VALUES(focused_points),
+        student_id = VALUES(student_id)
+"""
+
+# Session rows from their per-device rows (a few dozen rows per session)
+ROLLUP = """
+    INSERT INTO session_summaries (
+        session_id, student_count, data_points, avg_focus, peak_focus,
+        focus_minutes, avg_attention_span, finalized, updated_at
+    )
+    SELECT ms.id,
+           COUNT(sss.mac_address),
+           COALESCE(SUM(sss.data_points), 0),
+           SUM(sss.focus_sum) / NULLIF(SUM(sss.data_points), 0),
+           MAX(sss.peak_focus),
+           COALESCE(SUM(sss.focused_points), 0) / {per_minute},
+           COALESCE(AVG(NULLIF(sss.focused_points, 0)) / {per_minute}, 0),
+           {finalized},
+           NOW()
+    FROM monitoring_sessions ms
+    LEFT JOIN session_student_summaries sss ON sss.session_id = ms.id
+    WHERE ms.id IN ({placeholders})
+    GROUP BY ms.id
+    ON DUPLICATE KEY UPDATE
+        student_count = VALUES(student_count), data_points = VALUES(data_points),
+        avg_focus = VALUES(avg_focus), peak_focus = VALUES(peak_focus),
+        focus_minutes = VALUES(focus_minutes), avg_attention_span = VALUES(avg_attention_span),
+        finalized = {finalized_update}, updated_at = VALUES(updated_at)
+"""
+
+
+def create_session_summaries(cursor):
+    """Create the rollup tables (call from create_baseline_schema, after monitoring_sessions)"""
+    for statement in CREATE_TABLES:
+        cursor.execute(statement)
+
+
+def session_student_rows(readings, student_ids):
+    """STUDENT_UPSERT parameter dicts for the readings of a batch that belong to a session"""
+    rows = {}
+    for r in readings:
+        if r.session_id is None:
+            continue
+        key = (r.session_id, r.mac_address)
+        focus = float(r.focus)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = {
+                "session_id": r.session_id, "mac": r.mac_address,
+                "student_id": student_ids.get(r.mac_address),
+                "count": 0, "focus_sum": 0.0, "peak": focus, "focused": 0
+            }
+        row["count"] += 1
+        row["focus_sum"] += focus
+        row["peak"] = max(row["peak"], focus)
+        row["focused"] += focus >= FOCUSED_THRESHOLD
+    return list(rows.values())
+
+
+def refresh_session_rollups(cursor, session_ids, finalize=False):
+    """Recompute session_summaries for these sessions (finalize marks them closed)"""
+    session_ids = sorted(set(session_ids))
+    if not session_ids:
+        return
+    cursor.execute(ROLLUP.format(
+        per_minute=READINGS_PER_MINUTE,
+        finalized="TRUE" if finalize else "FALSE",
+        finalized_update="TRUE" if finalize else "finalized",
+        placeholders=", ".join(["%s"] * len(session_ids))
+    ), tuple(session_ids))
+
+
+def rebuild_session_summary(cursor, session_id, finalize):
+    """Recompute one session's rollups from its eeg_data rows"""
+    cursor.execute(STUDENT_REBUILD, (session_id, session_id))
+    refresh_session_rollups(cursor, [session_id], finalize=finalize)
+
+
+def fetch_session_history(cursor):
+    """All monitoring sessions, newest first, with their rollup (NULL columns when missing)"""
+    cursor.execute("""
+        SELECT ms.id, ms.teacher_name, ms.subject, ms.start_time, ms.end_time, ms.active,
+               ss.session_id AS summary_id, ss.student_count, ss.avg_attention_span, ss.finalized
+        FROM monitoring_sessions ms
+        LEFT JOIN session_summaries ss ON ss.session_id = ms.id
+        ORDER BY ms.start_time DESC
+    """)
+    return cursor.fetchall()
+
+
+def fetch_session_students(cursor, session_id):
+    """Per-student aggregates for one session, best average focus first"""
+    cursor.execute("""
+        SELECT s.name, sss.mac_address,
+               sss.focus_sum / NULLIF(sss.data_points, 0) AS avg_focus,
+               sss.peak_focus, sss.data_points
+        FROM session_student_summaries sss
+        JOIN students s ON s.device_mac = sss.mac_address
+        WHERE sss.session_id = %s
+        ORDER BY avg_focus DESC
+    """, (session_id,))
+    return cursor.fetchall()
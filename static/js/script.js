@@ -4,6 +4,10 @@ let animationFrameId;
 let brainCircleAnimation;
 let studentsData = [];
 let selectedStudent = null;
+let liveStream = null;
+let pollingInterval = null;
+let lastRosterRefresh = 0;
+let renderScheduled = false;
 
 // ===== INITIALIZE ON LOAD =====
 document.addEventListener('DOMContentLoaded', () => {
@@ -1252,8 +1256,114 @@ function startRealTimeUpdates() {
     // Update immediately on start
     updateStudentData();
     
-    // Then update every 2 seconds for real-time monitoring
-    setInterval(updateStudentData, 2000);
+    // Server pushes changes as they happen; poll every 2 seconds only without the stream
+    if (!startLiveStream()) {
+        startPolling();
+    }
+}
+
+function startPolling() {
+    if (pollingInterval) return;
+    pollingInterval = setInterval(updateStudentData, 2000);
+}
+
+function startLiveStream() {
+    if (!window.EventSource || liveStream) return Boolean(liveStream);
+    
+    liveStream = new EventSource('/api/stream');
+    liveStream.addEventListener('device', (event) => {
+        applyLiveUpdate(JSON.parse(event.data));
+    });
+    liveStream.onerror = () => {
+        // EventSource reconnects (resuming from the last event id) unless the server refused the stream
+        if (liveStream.readyState === EventSource.CLOSED) {
+            console.warn('Live stream unavailable - falling back to polling');
+            liveStream = null;
+            startPolling();
+        }
+    };
+    
+    // A device that stops sending produces no event - age it out locally
+    setInterval(markStaleStudents, 2000);
+    return true;
+}
+
+function applyLiveUpdate(update) {
+    const student = studentsData.find(s => s.mac_address === update.mac_address);
+    if (!student) {
+        // New device/student: reload the roster (at most every 5 seconds)
+        if (Date.now() - lastRosterRefresh > 5000) {
+            lastRosterRefresh = Date.now();
+            updateStudentData();
+        }
+        return;
+    }
+    
+    const connected = update.connected;
+    student.state = connected ? update.mental_state : 'disconnected';
+    student.focus = connected ? Math.round(update.focus * 1000) / 10 : 0;
+    ['delta', 'theta', 'alpha', 'beta', 'gamma'].forEach(band => {
+        student[band] = connected ? Math.round(update.bands[band] * 100) / 100 : 0;
+    });
+    student.connected = connected;
+    student.wearing = update.wearing;
+    student.signal_quality = update.signal_quality;
+    student.last_update = update.last_update;
+    student.lastEventAt = Date.now();
+    
+    scheduleStudentRender();
+}
+
+function markStaleStudents() {
+    const now = Date.now();
+    let changed = false;
+    studentsData.forEach(student => {
+        if (student.lastEventAt && student.connected && now - student.lastEventAt > 10000) {
+            Object.assign(student, { state: 'disconnected', connected: false, wearing: false, signal_quality: 'offline', focus: 0 });
+            changed = true;
+        }
+    });
+    if (changed) scheduleStudentRender();
+}
+
+function scheduleStudentRender() {
+    // Many devices report within the same second - render once per batch of events
+    if (renderScheduled) return;
+    renderScheduled = true;
+    setTimeout(() => {
+        renderScheduled = false;
+        sortAndRenderStudents();
+    }, 250);
+}
+
+function sortAndRenderStudents() {
+    // Sort: disconnected last, then by state priority
+    const statePriority = { 
+        distracted: 0, 
+        drowsy: 1, 
+        relaxed: 2, 
+        focused: 3,
+        disconnected: 4 
+    };
+    studentsData.sort((a, b) => {
+        const priorityA = statePriority[a.state] || 4;
+        const priorityB = statePriority[b.state] || 4;
+        return priorityA - priorityB;
+    });
+    
+    renderStudentLists();
+    
+    // Update individual dashboard if viewing a student
+    if (selectedStudent && selectedStudent.id) {
+        const updatedStudent = studentsData.find(s => s.id === selectedStudent.id);
+        if (updatedStudent) {
+            selectedStudent = updatedStudent;
+            updateDashboardWithStudentData(updatedStudent);
+        } else {
+            // Student no longer exists or is disconnected
+            console.warn('Selected student not found in updated data');
+        }
+    }
 }
 
 async function updateStudentData() {
@@ -1268,34 +1378,8 @@ async function updateStudentData() {
         if (data.status === 'success' && data.students && Array.isArray(data.students)) {
             // Update all students data (including disconnected ones)
             studentsData = data.students;
-            
-            // Sort: disconnected last, then by state priority
-            const statePriority = { 
-                distracted: 0, 
-                drowsy: 1, 
-                relaxed: 2, 
-                focused: 3,
-                disconnected: 4 
-            };
-            studentsData.sort((a, b) => {
-                const priorityA = statePriority[a.state] || 4;
-                const priorityB = statePriority[b.state] || 4;
-                return priorityA - priorityB;
-            });
-            
-            renderStudentLists();
-            
-            // Update individual dashboard if viewing a student
-            if (selectedStudent && selectedStudent.id) {
-                const updatedStudent = studentsData.find(s => s.id === selectedStudent.id);
-                if (updatedStudent) {
-                    selectedStudent = updatedStudent;
-                    updateDashboardWithStudentData(updatedStudent);
-                } else {
-                    // Student no longer exists or is disconnected
-                    console.warn('Selected student not found in updated data');
-                }
-            }
+            lastRosterRefresh = Date.now();
+            sortAndRenderStudents();
         } else {
             console.warn('Invalid response format:', data);
         }
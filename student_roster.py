@@ -0,0 +1,60 @@
+"""
+Student Roster Module
+Cached list of all students (id, name, device_mac) for the live dashboard endpoints
+
+Students are only added by POST /students and by the write-behind writer's
+auto-registration; both call invalidate_roster(). The generation counter is created
+at import, so under gunicorn preload every worker inherits the same one and an
+invalidation in any worker reaches all of them. ROSTER_MAX_AGE bounds staleness for
+changes made outside the app (or when workers don't share the counter).
+"""
+import logging
+import multiprocessing
+import threading
+import time
+
+# Import centralized database connection
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+ROSTER_MAX_AGE = 300  # seconds
+
+_generation = multiprocessing.Value("q", 0)
+_roster = {"students": None, "generation": -1, "loaded_at": 0.0}
+_roster_lock = threading.Lock()  # also makes concurrent misses share one query
+
+
+def invalidate_roster():
+    """Mark the cached roster stale in every worker (call after adding/changing students)"""
+    with _generation.get_lock():
+        _generation.value += 1
+
+
+def get_student_roster():
+    """
+    All students ordered by name, as dicts with id, name and device_mac
+    Returns None when the roster isn't cached and the database is unreachable
+    """
+    with _roster_lock:
+        generation = _generation.value
+        fresh = (
+            _roster["students"] is not None and
+            _roster["generation"] == generation and
+            time.monotonic() - _roster["loaded_at"] < ROSTER_MAX_AGE
+        )
+        if not fresh:
+            db = get_db_connection()
+            if not db:
+                return None
+            try:
+                cursor = db.cursor(dictionary=True)
+                cursor.execute("SELECT id, name, device_mac FROM students ORDER BY name")
+                students = cursor.fetchall()
+                cursor.close()
+            finally:
+                db.close()
+            _roster.update(students=students, generation=generation, loaded_at=time.monotonic())
+            logger.debug(f"👥 Student roster loaded ({len(students)} students)")
+
+        return [dict(student) for student in _roster["students"]]
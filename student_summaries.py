@@ -0,0 +1,175 @@
+"""
+Student Summaries Module
+Per-device counters kept up to date by the write-behind writer
+
+One student_summaries row per device MAC holds what the students pages used to compute
+by scanning eeg_data for every student: distinct active days, first/last activity,
+reading count, focus sum and peak, and the latest reading. The writer upserts it in
+the same transaction as the eeg_data rows it summarises, so reads are a single
+students LEFT JOIN student_summaries.
+
+Counting active days incrementally relies on readings for a device arriving in
+timestamp order (they are stamped at ingest), so a batch only adds the days after
+the row's current last_active day.
+"""
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS student_summaries (
+    mac_address VARCHAR(50) PRIMARY KEY,
+    student_id INT,
+    active_days INT NOT NULL DEFAULT 0,
+    first_active DATETIME,
+    last_active DATETIME,
+    total_readings BIGINT NOT NULL DEFAULT 0,
+    focus_sum DOUBLE NOT NULL DEFAULT 0,
+    peak_focus FLOAT,
+    latest_delta FLOAT,
+    latest_theta FLOAT,
+    latest_alpha FLOAT,
+    latest_beta FLOAT,
+    latest_gamma FLOAT,
+    latest_focus FLOAT,
+    latest_signal_quality VARCHAR(20),
+    INDEX idx_student (student_id),
+    FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE SET NULL
+)
+"""
+
+_INSERT_COLUMNS = """
+    INSERT INTO student_summaries (
+        mac_address, student_id, active_days, first_active, last_active,
+        total_readings, focus_sum, peak_focus,
+        latest_delta, latest_theta, latest_alpha, latest_beta, latest_gamma,
+        latest_focus, latest_signal_quality
+    )
+"""
+
+# MySQL applies ON DUPLICATE KEY assignments left to right, and later ones see the
+# new values - so everything that compares against the old last_active comes first.
+# Target columns are qualified: BACKFILL_CHUNK selects columns of the same names.
+_ADD = """
+    ON DUPLICATE KEY UPDATE
+        student_summaries.active_days = student_summaries.active_days + VALUES(active_days)
+            - COALESCE(DATE(student_summaries.last_active) >= DATE(VALUES(first_active)), 0),
+""" + "".join(f"""        student_summaries.{column} = IF(
+            VALUES(last_active) >= student_summaries.last_active OR student_summaries.last_active IS NULL,
+            VALUES({column}), student_summaries.{column}),
+""" for column in ("latest_delta", "latest_theta", "latest_alpha", "latest_beta", "latest_gamma",
+                   "latest_focus", "latest_signal_quality")) + """\
+        student_summaries.last_active = GREATEST(COALESCE(student_summaries.last_active, VALUES(last_active)),
+                                                 VALUES(last_active)),
+        student_summaries.first_active = LEAST(COALESCE(student_summaries.first_active, VALUES(first_active)),
+                                               VALUES(first_active)),
+        student_summaries.total_readings = student_summaries.total_readings + VALUES(total_readings),
+        student_summaries.focus_sum = student_summaries.focus_sum + VALUES(focus_sum),
+        student_summaries.peak_focus = GREATEST(COALESCE(student_summaries.peak_focus, VALUES(peak_focus)),
+                                                VALUES(peak_focus)),
+        student_summaries.student_id = COALESCE(VALUES(student_id), student_summaries.student_id)
+"""
+
+# Placeholders only inside VALUES (...) so executemany can send one multi-row INSERT.
+UPSERT = _INSERT_COLUMNS + """
+    VALUES (%(mac)s, %(student_id)s, %(days)s, %(first)s, %(last)s,
+            %(count)s, %(focus_sum)s, %(peak)s,
+            %(delta)s, %(theta)s, %(alpha)s, %(beta)s, %(gamma)s,
+            %(focus)s, %(quality)s)
+""" + _ADD
+
+# Per-device totals of eeg_data rows matching {where}, with the newest row's values
+_AGGREGATE = """
+    SELECT agg.mac_address, agg.student_id, agg.active_days, agg.first_active, agg.last_active,
+           agg.total_readings, agg.focus_sum, agg.peak_focus,
+           e.delta, e.theta, e.alpha, e.beta, e.gamma, e.focus, e.signal_quality
+    FROM (
+        SELECT mac_address, MAX(student_id) AS student_id,
+               COUNT(DISTINCT DATE(timestamp)) AS active_days,
+               MIN(timestamp) AS first_active, MAX(timestamp) AS last_active,
+               COUNT(*) AS total_readings, COALESCE(SUM(focus), 0) AS focus_sum,
+               MAX(focus) AS peak_focus, MAX(id) AS latest_id
+        FROM eeg_data
+        WHERE mac_address IS NOT NULL AND {where}
+        GROUP BY mac_address
+    ) agg
+    JOIN eeg_data e ON e.id = agg.latest_id
+"""
+
+# Existing history, one eeg_data id range at a time and in id order (the way the writer
+# adds batches, so the active-days arithmetic holds). Ranges add to the counters, so
+# each must be applied exactly once (the migration commits it with its progress).
+BACKFILL_CHUNK = _INSERT_COLUMNS + _AGGREGATE.format(where="id >= %(lo)s AND id < %(hi)s") + _ADD
+
+# Catch-up after the backfill: the whole history of every device with a row in the id
+# range, recomputed and overwritten. Idempotent; costs one scan of each such device's
+# rows per range, which is fine for the few minutes of readings a catch-up covers.
+RECOMPUTE = _INSERT_COLUMNS + _AGGREGATE.format(
+    where="mac_address IN (SELECT mac_address FROM eeg_data WHERE id >= %(lo)s AND id < %(hi)s)"
+) + """
+    ON DUPLICATE KEY UPDATE
+        student_id = VALUES(student_id), active_days = VALUES(active_days),
+        first_active = VALUES(first_active), last_active = VALUES(last_active),
+        total_readings = VALUES(total_readings), focus_sum = VALUES(focus_sum),
+        peak_focus = VALUES(peak_focus), latest_delta = VALUES(latest_delta),
+        latest_theta = VALUES(latest_theta), latest_alpha = VALUES(latest_alpha),
+        latest_beta = VALUES(latest_beta), latest_gamma = VALUES(latest_gamma),
+        latest_focus = VALUES(latest_focus), latest_signal_quality = VALUES(latest_signal_quality)
+"""
+
+
+def create_student_summaries(cursor):
+    """Create the table (call from create_baseline_schema; migration 5 fills it from eeg_data)"""
+    cursor.execute(CREATE_TABLE)
+
+
+def summary_rows(readings, student_ids):
+    """One UPSERT parameter dict per device in a batch of write-behind Readings"""
+    rows = OrderedDict()
+    for r in readings:
+        row = rows.get(r.mac_address)
+        if row is None:
+            row = rows[r.mac_address] = {
+                "mac": r.mac_address, "student_id": student_ids.get(r.mac_address),
+                "first": r.timestamp, "last": r.timestamp, "day_set": set(),
+                "count": 0, "focus_sum": 0.0, "peak": float(r.focus), "latest": r
+            }
+        row["first"] = min(row["first"], r.timestamp)
+        if r.timestamp >= row["last"]:
+            row["last"], row["latest"] = r.timestamp, r
+        row["day_set"].add(r.timestamp.date())
+        row["count"] += 1
+        row["focus_sum"] += float(r.focus)
+        row["peak"] = max(row["peak"], float(r.focus))
+
+    params = []
+    for row in rows.values():
+        latest = row.pop("latest")
+        row["days"] = len(row.pop("day_set"))
+        row.update(
+            {band: float(latest.band_powers[band]) for band in ("delta", "theta", "alpha", "beta", "gamma")},
+            focus=float(latest.focus), quality=latest.signal_quality
+        )
+        params.append(row)
+    return params
+
+
+def fetch_student_summaries(cursor, mac_address=None):
+    """
+    Students with their summary columns (NULL for students without readings), by name
+    One query for every student, or just the one with device_mac = mac_address
+    """
+    query = """
+        SELECT s.id, s.name, s.device_mac, s.created_at,
+               ss.active_days, ss.first_active, ss.last_active, ss.total_readings,
+               ss.focus_sum, ss.peak_focus, ss.latest_delta, ss.latest_theta, ss.latest_alpha,
+               ss.latest_beta, ss.latest_gamma, ss.latest_focus, ss.latest_signal_quality
+        FROM students s
+        LEFT JOIN student_summaries ss ON ss.mac_address = s.device_mac
+    """
+    if mac_address is None:
+        cursor.execute(query + " ORDER BY s.name ASC")
+    else:
+        cursor.execute(query + " WHERE s.device_mac = %s", (mac_address,))
+    return cursor.fetchall()
@@ -11,6 +11,12 @@ import numpy as np
 # Import centralized database connection
 from db import get_db_connection
 
+# Per-device counters maintained by the write-behind writer
+from student_summaries import fetch_student_summaries
+
+# Per-student reads served from memory until the next stored batch for the device
+from response_cache import STUDENT_DETAILS_CACHE_SECONDS, cached_response, mac_scope
+
 logger = logging.getLogger(__name__)
 
 def get_formula_based_state(percentages):
@@ -48,7 +54,7 @@ def register_students_routes(app, device_statuses_ref, predict_state_hybrid_func
     
     Args:
         app: Flask app instance
-        device_statuses_ref: Reference to device statuses dictionary
+        device_statuses_ref: DeviceStateStore with live device statuses (shared by all workers), or None
         predict_state_hybrid_func: Hybrid prediction function from app.py
         extract_ml_features_func: Feature extraction function from app.py
     """
@@ -60,94 +66,76 @@ def register_students_routes(app, device_statuses_ref, predict_state_hybrid_func
 
     @app.route("/api/students-details-list", methods=['GET'])
     def get_students_details_list():
-        """Get all registered students from database WITH detailed session info"""
+        """
+        Get all registered students WITH detailed session info
+        One query (students + per-device summary counters) plus the live device snapshot
+        """
         try:
             db = get_db_connection()
             if not db:
                 return jsonify({"status": "error", "msg": "Database connection failed"}), 500
                 
             cursor = db.cursor(dictionary=True)
+            students = fetch_student_summaries(cursor)
+            cursor.close()
+            db.close()
             
-            # Fetch all students - simple query
-            cursor.execute("""
-                SELECT s.id, s.name, s.device_mac, s.created_at
-                FROM students s
-                ORDER BY s.name ASC
-            """)
-            students = cursor.fetchall()
+            live_snapshots = device_statuses_ref.snapshots() if device_statuses_ref is not None else {}
+            current_time = datetime.now()
             
-            # For each student, get their info AND live state
             students_list = []
             for student in students:
                 mac_address = student['device_mac']
                 
-                # Get total sessions count
-                cursor.execute("""
-                    SELECT COUNT(DISTINCT DATE(timestamp)) as total_sessions
-                    FROM eeg_data
-                    WHERE mac_address = %s
-                """, (mac_address,))
-                
-                session_data = cursor.fetchone()
-                
-                # Get latest EEG data for current state
-                cursor.execute("""
-                    SELECT delta, theta, alpha, beta, gamma, focus, signal_quality, timestamp
-                    FROM eeg_data
-                    WHERE mac_address = %s
-                    ORDER BY timestamp DESC
-                    LIMIT 1
-                """, (mac_address,))
-                
-                latest_eeg = cursor.fetchone()
-                
                 # Check if device is CURRENTLY connected (within last 10 seconds)
                 is_connected = False
                 current_state = "disconnected"
                 focus_value = 0
                 band_powers = {"delta": 0, "theta": 0, "alpha": 0, "beta": 0, "gamma": 0}
                 
-                if latest_eeg and latest_eeg['timestamp']:
-                    time_diff = (datetime.now() - latest_eeg['timestamp']).total_seconds()
+                # Live snapshot first: the state ingest just computed (also covers devices
+                # streaming without an active session, which have no stored rows)
+                live = live_snapshots.get(mac_address)
+                if live and live.get('connected') and live.get('last_update') and \
+                        (current_time - live['last_update']).total_seconds() < 10:
+                    is_connected = True
+                    if live['bands'] is not None:
+                        current_state = live['mental_state']
+                        focus_value = live['focus'] or 0
+                        band_powers = dict(live['bands'])
+                    else:
+                        current_state = "monitoring"
+                
+                # Otherwise a reading stored in the last 10 seconds (e.g. by another instance)
+                elif student['last_active'] and (current_time - student['last_active']).total_seconds() < 10:
+                    is_connected = True
+                    focus_value = student['latest_focus'] or 0
+                    band_powers = {band: student[f'latest_{band}'] or 0 for band in band_powers}
                     
-                    # If data is recent (within 10 seconds), device is connected
-                    if time_diff < 10:
-                        is_connected = True
-                        focus_value = latest_eeg['focus'] if latest_eeg['focus'] else 0
-                        
-                        # Get band powers
-                        band_powers = {
-                            "delta": latest_eeg['delta'] or 0,
-                            "theta": latest_eeg['theta'] or 0,
-                            "alpha": latest_eeg['alpha'] or 0,
-                            "beta": latest_eeg['beta'] or 0,
-                            "gamma": latest_eeg['gamma'] or 0
-                        }
+                    # Calculate total for percentages
+                    total = sum(band_powers.values())
+                    if total > 0:
+                        percentages = {k: (v/total)*100 for k, v in band_powers.items()}
                         
-                        # Calculate total for percentages
-                        total = sum(band_powers.values())
-                        if total > 0:
-                            percentages = {k: (v/total)*100 for k, v in band_powers.items()}
-                            
-                            # 🔥 HYBRID PREDICTION: Use ML + Formula if function provided
-                            if predict_state_hybrid_func:
-                                try:
-                                    current_state = predict_state_hybrid_func(band_powers, focus_value, None)
-                                    logger.debug(f"🤖 Hybrid state for {student['name']}: {current_state}")
-                                except Exception as e:
-                                    logger.error(f"Hybrid prediction failed: {e}, using formula")
-                                    current_state = get_formula_based_state(percentages)
-                            else:
-                                # Fallback to formula-based classification
+                        # 🔥 HYBRID PREDICTION: Use ML + Formula if function provided
+                        if predict_state_hybrid_func:
+                            try:
+                                current_state = predict_state_hybrid_func(band_powers, focus_value, None)
+                                logger.debug(f"🤖 Hybrid state for {student['name']}: {current_state}")
+                            except Exception as e:
+                                logger.error(f"Hybrid prediction failed: {e}, using formula")
                                 current_state = get_formula_based_state(percentages)
+                        else:
+                            # Fallback to formula-based classification
+                            current_state = get_formula_based_state(percentages)
                 
                 student_info = {
                     'id': str(student['id']),
                     'name': student['name'],
                     'mac_address': mac_address,
                     'created_at': student['created_at'].isoformat() if student['created_at'] else None,
-                    'total_sessions': session_data['total_sessions'] if session_data else 0,
-                    'last_active': latest_eeg['timestamp'].isoformat() if latest_eeg and latest_eeg['timestamp'] else None,
+                    'total_sessions': student['active_days'] or 0,
+                    'last_active': student['last_active'].isoformat() if student['last_active'] else None,
                     'is_connected': is_connected,
                     'state': current_state,
                     'focus': round(focus_value, 2),
@@ -155,9 +143,6 @@ def register_students_routes(app, device_statuses_ref, predict_state_hybrid_func
                 }
                 students_list.append(student_info)
             
-            cursor.close()
-            db.close()
-            
             logger.info(f"Fetched {len(students_list)} students, Connected: {sum(1 for s in students_list if s['is_connected'])}")
             return jsonify({"status": "success", "students": students_list})
             
@@ -166,6 +151,7 @@ def register_students_routes(app, device_statuses_ref, predict_state_hybrid_func
             return jsonify({"status": "error", "msg": str(e)}), 500
 
     @app.route("/api/student-details/<mac_address>", methods=['GET'])
+    @cached_response(mac_scope, STUDENT_DETAILS_CACHE_SECONDS)
     def get_student_details(mac_address):
         """Get detailed information about a specific student"""
         try:
@@ -175,44 +161,25 @@ def register_students_routes(app, device_statuses_ref, predict_state_hybrid_func
                 
             cursor = db.cursor(dictionary=True)
             
-            # Get student info
-            cursor.execute("""
-                SELECT id, name, device_mac, created_at
-                FROM students
-                WHERE device_mac = %s
-            """, (mac_address,))
-            
-            student = cursor.fetchone()
-            if not student:
-                cursor.close()
-                db.close()
-                return jsonify({"status": "error", "msg": "Student not found"}), 404
-            
-            # Get session statistics
-            cursor.execute("""
-                SELECT 
-                    COUNT(DISTINCT DATE(timestamp)) as total_sessions,
-                    COUNT(*) as total_data_points,
-                    AVG(focus) as avg_focus,
-                    MAX(focus) as peak_focus
-                FROM eeg_data
-                WHERE mac_address = %s
-            """, (mac_address,))
-            
-            stats = cursor.fetchone()
-            
+            # Student info with its summary counters
+            rows = fetch_student_summaries(cursor, mac_address)
             cursor.close()
             db.close()
             
+            if not rows:
+                return jsonify({"status": "error", "msg": "Student not found"}), 404
+            student = rows[0]
+            total_data_points = student['total_readings'] or 0
+            
             return jsonify({
                 "status": "success",
                 "student": {
                     "name": student['name'],
                     "mac_address": student['device_mac'],
-                    "total_sessions": stats['total_sessions'] or 0,
-                    "total_data_points": stats['total_data_points'] or 0,
-                    "avg_focus": round(stats['avg_focus'] or 0, 1),
-                    "peak_focus": round(stats['peak_focus'] or 0, 1)
+                    "total_sessions": student['active_days'] or 0,
+                    "total_data_points": total_data_points,
+                    "avg_focus": round(student['focus_sum'] / total_data_points, 1) if total_data_points else 0,
+                    "peak_focus": round(student['peak_focus'] or 0, 1)
                 }
             })
             
@@ -0,0 +1,111 @@
+"""
+Timeline Encoding Module
+Compact columnar encodings of a wave timeline (analytics.Timeline) for the dashboard
+
+The JSON timeline repeats a formatted time string and full-precision floats for every
+point of every series. The columnar forms send the times once as a base plus either a
+fixed step or int32 offsets, and each series as a float32 array:
+
+    JSON    (?format=columnar)  {"encoding": "columnar-v1", "resolution", "count", "base",
+                                 "step" (null when offsets are sent), "offsets" (base64
+                                 int32, null when step is), "series": {name: base64 float32},
+                                 "downsampled_from" (only when downsampled)}
+
+    binary  (Accept: application/x-eeg-timeline), little-endian:
+        magic        2 bytes   b"ET"
+        version      uint8     TIMELINE_VERSION
+        resolution   uint8     index into RESOLUTIONS
+        series       uint8     number of series (TIMELINE_SERIES order)
+        flags        uint8     bit 0 set -> offsets follow the header, clear -> use step
+        padding      2 bytes
+        count        uint32    points per series
+        base         float64   time of the first point
+        step         float64   seconds between points (0 when offsets are sent)
+        offsets      count * int32    seconds from base (only with FLAG_OFFSETS)
+        values       series * count * float32
+
+The dashboard reads the columnar JSON embedded in its /analytics poll; the binary body
+is for API clients fetching /analytics/<mac>/timeline on its own.
+
+Times are seconds since 1970-01-01 on the server's wall clock (the naive datetimes
+stored in eeg_data), so the browser formats them with its UTC getters to show the same
+clock time the JSON labels did. The header is 28 bytes, so every array in the body
+starts 4-byte aligned and the browser can view it as a typed array without copying.
+"""
+import base64
+import struct
+from datetime import datetime
+
+import numpy as np
+
+from analytics import TIMELINE_SERIES
+
+TIMELINE_MAGIC = b"ET"
+TIMELINE_VERSION = 1
+FLAG_OFFSETS = 0x01
+
+TIMELINE_HEADER = struct.Struct("<2sBBBB2xIdd")
+
+TIMELINE_MIMETYPE = "application/x-eeg-timeline"
+COLUMNAR_ENCODING = "columnar-v1"
+
+RESOLUTIONS = ("raw", "1m", "1h")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def wall_clock_seconds(timestamps):
+    """Naive datetimes as float64 seconds since 1970-01-01 on the same clock"""
+    return np.array([(t - _EPOCH).total_seconds() for t in timestamps], dtype=np.float64)
+
+
+def _time_axis(timestamps):
+    """(base, step, offsets): offsets is None when the points are evenly spaced"""
+    seconds = wall_clock_seconds(timestamps)
+    base = float(seconds[0]) if seconds.size else 0.0
+    offsets = np.rint(seconds - base).astype("<i4")
+    steps = np.diff(offsets)
+    if steps.size == 0 or np.all(steps == steps[0]):
+        return base, float(steps[0]) if steps.size else 0.0, None
+    return base, 0.0, offsets
+
+
+def _values(timeline):
+    """(series, count) little-endian float32, one row per TIMELINE_SERIES entry"""
+    return np.ascontiguousarray(np.asarray(timeline.values, dtype="<f4").T)
+
+
+def encode_columnar(timeline):
+    """JSON-safe dict with base64 typed-array payloads (for a timeline inside a JSON response)"""
+    base, step, offsets = _time_axis(timeline.timestamps)
+    values = _values(timeline)
+    encoded = {
+        "encoding": COLUMNAR_ENCODING,
+        "resolution": timeline.resolution,
+        "count": len(timeline.timestamps),
+        "base": base,
+        "step": None if offsets is not None else step,
+        "offsets": base64.b64encode(offsets.tobytes()).decode("ascii") if offsets is not None else None,
+        "series": {
+            series: base64.b64encode(values[i].tobytes()).decode("ascii")
+            for i, series in enumerate(TIMELINE_SERIES)
+        }
+    }
+    if timeline.source_points > len(timeline.timestamps):
+        encoded["downsampled_from"] = timeline.source_points
+    return encoded
+
+
+def encode_binary(timeline):
+    """Packed response body (see the module docstring for the layout)"""
+    base, step, offsets = _time_axis(timeline.timestamps)
+    header = TIMELINE_HEADER.pack(
+        TIMELINE_MAGIC, TIMELINE_VERSION, RESOLUTIONS.index(timeline.resolution), len(TIMELINE_SERIES),
+        FLAG_OFFSETS if offsets is not None else 0, len(timeline.timestamps), base, step
+    )
+    return b"".join([header, offsets.tobytes() if offsets is not None else b"", _values(timeline).tobytes()])
+
+
+def wants_binary(accept_mimetypes):
+    """True when the client's Accept header prefers the binary timeline over JSON (wildcards get JSON)"""
+    return accept_mimetypes.best_match(["application/json", TIMELINE_MIMETYPE]) == TIMELINE_MIMETYPE
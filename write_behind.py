@@ -0,0 +1,259 @@
+"""
+Write-Behind Persistence Module
+Collects processed readings from all devices and stores them in MySQL in batches
+
+The upload path only enqueues a reading; a background thread flushes the queue
+to raw_data and eeg_data with executemany (multi-row INSERTs) when either
+batch_size readings are waiting or flush_interval seconds have passed. Each batch,
+with its summary and rollup upserts, is one transaction: a failed flush leaves nothing
+behind and is retried whole.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Import centralized database connection
+from db import get_db_connection
+
+# Auto-registered students must show up in the cached dashboard roster
+from student_roster import invalidate_roster
+
+# Per-device counters for the students pages, kept in step with eeg_data
+from student_summaries import UPSERT as SUMMARY_UPSERT, summary_rows
+
+# Live rollups for the active monitoring session
+from session_summaries import STUDENT_UPSERT as SESSION_STUDENT_UPSERT, refresh_session_rollups, session_student_rows
+
+# 1-minute / 1-hour buckets for the analytics queries
+from eeg_rollups import upsert_rollups
+
+# Attention periods closed by the ingest-side tracker
+from attention_tracker import INSERT as ATTENTION_PERIOD_INSERT, period_rows
+
+# Cached analytics / history responses go stale once a batch is stored
+from response_cache import SESSION_HISTORY_SCOPE, invalidate_responses
+
+logger = logging.getLogger(__name__)
+
+# One processed upload: 1 eeg_data row + len(raw_values) raw_data rows
+# (session_id: the monitoring session active at ingest, for the session rollups;
+#  attention_period: the period this reading closed, if any, for attention_periods)
+Reading = namedtuple("Reading", [
+    "timestamp", "mac_address", "raw_values", "band_powers", "focus", "signal_quality", "session_id",
+    "attention_period"
+], defaults=(None, None))
+
+RAW_INSERT = """
+    INSERT INTO raw_data (timestamp, adc_value, mac_address, student_id, monitoring_session_id)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+EEG_INSERT = """
+    INSERT INTO eeg_data (timestamp, delta, theta, alpha, beta, gamma, focus, signal_quality, mac_address, student_id,
+                          monitoring_session_id)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+class WriteBehindWriter:
+    """Bounded in-memory queue drained by one background writer thread"""
+
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval=1.0, max_retry_readings=5000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retry_readings = max_retry_readings
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._retry = []  # readings from a failed flush, written first next time
+        self._student_ids = {}  # mac_address -> students.id
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "eeg_rows_written": 0,
+            "raw_rows_written": 0,
+            "last_flush_ms": None,
+            "last_flush_at": None,
+            "last_error": None
+        }
+
+    def start(self):
+        """Start the writer thread (safe to call repeatedly, e.g. after a fork)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+            logger.info("💾 Started write-behind persistence thread")
+
+    def enqueue(self, reading):
+        """Queue a reading for storage without blocking; returns False if the queue is full"""
+        self.start()
+        try:
+            self._queue.put_nowait(reading)
+            self._stats["enqueued"] += 1
+            return True
+        except queue.Full:
+            self._stats["dropped"] += 1
+            if self._stats["dropped"] % 100 == 1:
+                logger.error(f"❌ Write-behind queue full - dropped {self._stats['dropped']} reading(s) so far")
+            return False
+
+    def stop(self, timeout=10.0):
+        """Stop the writer thread and flush everything still queued"""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        """Queue depth and throughput counters for the metrics endpoint"""
+        return dict(
+            self._stats,
+            queue_depth=self._queue.qsize(),
+            queue_capacity=self._queue.maxsize,
+            retry_depth=len(self._retry),
+            running=self._thread is not None and self._thread.is_alive()
+        )
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            while len(batch) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch or self._retry:
+                self._write(batch)
+
+    def flush(self):
+        """Drain the queue synchronously (used on shutdown)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch or self._retry:
+            self._write(batch)
+
+    def _write(self, batch):
+        with self._flush_lock:
+            readings = self._retry + batch
+            self._retry = []
+            started = time.monotonic()
+            try:
+                self._write_readings(readings)
+            except Exception as e:
+                self._stats["failed_flushes"] += 1
+                self._stats["last_error"] = str(e)
+                logger.error(f"❌ Write-behind flush failed ({len(readings)} readings): {e}")
+                # Keep the newest readings for the next attempt, bounded
+                self._retry = readings[-self.max_retry_readings:]
+                self._stats["dropped"] += len(readings) - len(self._retry)
+                return
+
+            self._stats["flushes"] += 1
+            self._stats["last_flush_ms"] = round((time.monotonic() - started) * 1000, 1)
+            self._stats["last_flush_at"] = time.time()
+
+    def _write_readings(self, readings):
+        db = get_db_connection()
+        cursor = db.cursor()
+        try:
+            # Connections are opened with autocommit on: without an explicit transaction
+            # every executemany below would commit on its own, and a batch retried after
+            # a partial failure would store its rows and counters twice
+            db.start_transaction()
+            student_ids, registered = self._resolve_student_ids(cursor, {r.mac_address for r in readings})
+
+            raw_rows = []
+            eeg_rows = []
+            for r in readings:
+                student_id = student_ids.get(r.mac_address)
+                raw_rows.extend(
+                    (r.timestamp, value, r.mac_address, student_id, r.session_id)
+                    for value in np.asarray(r.raw_values).tolist()
+                )
+                eeg_rows.append((
+                    r.timestamp,
+                    r.band_powers['delta'], r.band_powers['theta'], r.band_powers['alpha'],
+                    r.band_powers['beta'], r.band_powers['gamma'], r.focus, r.signal_quality,
+                    r.mac_address, student_id, r.session_id
+                ))
+
+            if raw_rows:
+                cursor.executemany(RAW_INSERT, raw_rows)
+            cursor.executemany(EEG_INSERT, eeg_rows)
+            cursor.executemany(SUMMARY_UPSERT, summary_rows(readings, student_ids))
+            upsert_rollups(cursor, readings, student_ids)
+            attention_rows = period_rows(readings, student_ids)
+            if attention_rows:
+                cursor.executemany(ATTENTION_PERIOD_INSERT, attention_rows)
+            session_rows = session_student_rows(readings, student_ids)
+            if session_rows:
+                cursor.executemany(SESSION_STUDENT_UPSERT, session_rows)
+                refresh_session_rollups(cursor, [row["session_id"] for row in session_rows])
+            db.commit()
+            # Students registered by this batch only exist now that it committed
+            self._student_ids.update(registered)
+            if registered:
+                invalidate_roster()
+            invalidate_responses(*student_ids.keys(), *([SESSION_HISTORY_SCOPE] if session_rows else []))
+
+            self._stats["raw_rows_written"] += len(raw_rows)
+            self._stats["eeg_rows_written"] += len(eeg_rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+            db.close()
+
+    def _resolve_student_ids(self, cursor, mac_addresses):
+        """
+        Look up (or auto-register) students for a batch, caching looked-up ids per MAC
+        Returns ({mac: student id}, {mac: id} of students inserted in this transaction);
+        the caller caches the inserted ones only once the batch has committed
+        """
+        registered = {}
+        missing = [mac for mac in mac_addresses if mac not in self._student_ids]
+        if missing:
+            placeholders = ", ".join(["%s"] * len(missing))
+            cursor.execute(
+                f"SELECT id, device_mac FROM students WHERE device_mac IN ({placeholders})",
+                tuple(missing)
+            )
+            for student_id, mac in cursor.fetchall():
+                self._student_ids[mac] = student_id
+
+            for mac in missing:
+                if mac not in self._student_ids:
+                    cursor.execute(
+                        "INSERT INTO students (name, device_mac) VALUES (%s, %s)",
+                        (f"Student-{mac[-8:]}", mac)
+                    )
+                    registered[mac] = cursor.lastrowid
+                    logger.info(f"✅ New student registered: {mac}")
+
+        return {mac: registered.get(mac, self._student_ids.get(mac)) for mac in mac_addresses}, registered
+
+
+# Shared writer used by the upload path
+writer = WriteBehindWriter()
+atexit.register(writer.stop)